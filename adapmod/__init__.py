@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Adaptive modulation: datasets, models and inference for the AMR and channel assessment CNNs.
+
+Importing the package imports nothing else: the names below are resolved from their modules on first
+use, so a worker process or an inference service only pays for what it touches. The modules of the
+signal chain, the dataset caches and the NumPy runtime depend on NumPy alone. Keras (amr_model.py,
+channel_model.py), scikit-learn, pandas and TensorFlow Lite are imported inside the functions that use
+them.
+
+    from adapmod import NumpyModel, workspace_paths
+    runtime = NumpyModel.load(workspace_paths()['channel_model'])
+
+The command line interface is described in cli.py:
+
+    python -m adapmod --help
+"""
+
+import importlib
+
+# Public names and the modules they are defined in
+_EXPORTS = {
+    'create_model': 'amr_model',
+    'apply_awgn_snr': 'channel_simulation',
+    'apply_awgn_snr_batch': 'channel_simulation',
+    'apply_multipath': 'channel_simulation',
+    'apply_multipath_batch': 'channel_simulation',
+    'generate_channel_realizations': 'channel_simulation',
+    'generate_random_mp_conditions': 'channel_simulation',
+    'generate_random_mp_conditions_batch': 'channel_simulation',
+    'create_compact_model': 'channel_model',
+    'create_multi_output_model': 'channel_model',
+    'workspace_paths': 'config',
+    'load_or_build': 'dataset_cache',
+    'open_cache': 'dataset_cache',
+    'write_cache': 'dataset_cache',
+    'PILOT_PARAMETERS': 'fsk_modulation',
+    'demodulate_fsk': 'fsk_modulation',
+    'generate_BFSK_Signal_vectorized': 'fsk_modulation',
+    'generate_pilot': 'fsk_modulation',
+    'generate_random_bits': 'fsk_modulation',
+    'modulate_fsk': 'fsk_modulation',
+    'FSK_RANGES': 'hisarmod',
+    'convert_to_complex': 'hisarmod',
+    'load_ranges_iq': 'hisarmod',
+    'LinkSimulator': 'link_simulator',
+    'NumpyModel': 'numpy_runtime',
+    'export_model': 'numpy_runtime',
+    'PilotMatchedFilter': 'pilot_frontend',
+    'SelectionTable': 'selection_table',
+    'generate_sharded_dataset': 'sharded_generation',
+    'merge_shards': 'sharded_generation',
+    'StreamingAMR': 'streaming_amr',
+    'StreamingScaler': 'streaming_scaler',
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    # Cache the name so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Automatic modulation recognition model.
+
+The 1D CNN used to tell BFSK, 4FSK and 8FSK apart. It lives in its own module so that it can be built
+from worker processes (see cross_validation.py) without running the training notebook. Keras is
+imported when a model is built, so importing this module stays cheap.
+"""
+
+# Define the 1D CNN model in a function for reusability
+def create_model(input_shape, num_classes=3, filters=(64, 32, 16), kernel_size=3, dropout=0.2, dense_units=64,
+                 learning_rate=0.001):
+    """
+    Create and compile the AMR 1D CNN.
+
+    :param input_shape: Shape of one sample, (time_steps, channels).
+    :param num_classes: Number of modulation schemes.
+    :param filters: Filters of every Conv1D block, each followed by max pooling and dropout.
+    :param kernel_size: Kernel size of the Conv1D layers.
+    :param dropout: Dropout rate after every Conv1D block.
+    :param dense_units: Units of the hidden dense layer.
+    :param learning_rate: Learning rate of the Adam optimizer.
+    :return: Compiled Keras model.
+    """
+    from keras.models import Sequential
+    from keras.layers import Input, Conv1D, MaxPooling1D, Flatten, Dense, Dropout
+    from keras.optimizers import Adam
+
+    model = Sequential()
+    model.add(Input(shape=input_shape))
+    for block_filters in filters:
+        model.add(Conv1D(filters=block_filters, kernel_size=kernel_size, activation='relu'))
+        model.add(MaxPooling1D(pool_size=2))
+        model.add(Dropout(dropout))
+    model.add(Flatten())
+    model.add(Dense(dense_units, activation='relu'))
+    model.add(Dense(num_classes, activation='softmax'))
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model
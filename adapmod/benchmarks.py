@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for the pipeline stages of both notebooks.
+
+Every stage runs offline on a synthetic fixture: a CSV shaped like the HisarMod training file (one
+signal of MATLAB style complex values per line, with the selected label ranges separated by rows that
+are skipped) and the BFSK pilot of the channel assessment notebook. The notebook's original
+implementations of the loader, the complex conversion, the I/Q split, the BFSK generator, the multipath
+channel and the dataset generation loop are kept here as reference stages (prefixed 'legacy_'), next to
+the code the notebooks use now, so every change can be measured against both.
+
+    python -m adapmod.benchmarks run --output benchmark_baseline.json
+    python -m adapmod.benchmarks compare benchmark_baseline.json --threshold 0.1
+
+compare runs the suite again (or reads --current) and flags every stage whose median time grew by more
+than the threshold, exiting with status 1 if any did. The model stages use untrained models, since
+the weights do not change the latency, and are skipped when Keras is not installed.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from .channel_simulation import (apply_awgn_snr, apply_awgn_snr_batch, apply_multipath, apply_multipath_batch,
+                                 generate_channel_realizations, generate_random_mp_conditions_batch)
+from .dataset_cache import commit_cache, create_cache
+from .fsk_modulation import PILOT_PARAMETERS, generate_random_bits_batch, modulate_fsk, modulate_fsk_bits
+from .hisarmod import build_line_index, convert_to_complex, load_ranges_iq, parse_iq_rows, read_ranges
+
+# Shape of the synthetic HisarMod fixture
+FIXTURE_LABELS = ('8FSK', '4FSK', '2FSK')
+FIXTURE_NUM_SAMPLES = 1024
+FIXTURE_RANGES_PER_LABEL = 4
+FIXTURE_ROWS_PER_RANGE = 100
+
+# Rows processed by the legacy per-cell stages, which are too slow to run on the whole fixture
+LEGACY_ROWS = 50
+
+# Regression threshold of compare, as a fraction of the baseline time
+DEFAULT_THRESHOLD = 0.1
+
+def _fixture_ranges(ranges_per_label, rows_per_range):
+    # Ranges of every label are interleaved with the other labels and with a block of unused rows, as in
+    # the HisarMod ranges of the AMR notebook
+    ranges = {label: [] for label in FIXTURE_LABELS}
+    start = 1
+    for _ in range(ranges_per_label):
+        for label in FIXTURE_LABELS:
+            ranges[label].append((start, start + rows_per_range - 1))
+            start += 2 * rows_per_range
+    return ranges, start - 1
+
+def write_hisarmod_fixture(path, num_rows, num_samples=FIXTURE_NUM_SAMPLES, seed=0):
+    """
+    Write a CSV file shaped like the HisarMod training file.
+
+    :param path: Path of the CSV file.
+    :param num_rows: Number of signals (lines).
+    :param num_samples: Complex samples per signal.
+    :param seed: Seed of the random samples.
+    :return: path.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        for _ in range(num_rows):
+            values = rng.standard_normal((num_samples, 2)) * 0.01
+            f.write(','.join(f'{real:.6g}{imag:+.6g}i' for real, imag in values.tolist()))
+            f.write('\n')
+    return path
+
+def make_fixture(work_dir, ranges_per_label=FIXTURE_RANGES_PER_LABEL, rows_per_range=FIXTURE_ROWS_PER_RANGE,
+                 num_samples=FIXTURE_NUM_SAMPLES):
+    """
+    Create (or reuse) the benchmark fixture in a directory.
+
+    :param work_dir: Directory holding the fixture files.
+    :param ranges_per_label: Row ranges per modulation label.
+    :param rows_per_range: Rows per range.
+    :param num_samples: Complex samples per signal.
+    :return: Dictionary describing the fixture, passed to every stage.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    ranges, num_rows = _fixture_ranges(ranges_per_label, rows_per_range)
+    data_file = os.path.join(work_dir, f'hisarmod_{num_rows}x{num_samples}.csv')
+    if not os.path.exists(data_file):
+        write_hisarmod_fixture(data_file + '.tmp', num_rows, num_samples)
+        os.replace(data_file + '.tmp', data_file)
+
+    index = build_line_index(data_file, cache=False)
+    blocks, _ = read_ranges(data_file, ranges, index)
+    lines = [line for block in blocks for line in block.splitlines()]
+    iq, labels, _ = load_ranges_iq(data_file, ranges, index)
+
+    p = PILOT_PARAMETERS
+    bitstream = generate_random_bits_batch(1, p['bitstream_length'], np.random.default_rng(0))[0]
+    pilot = modulate_fsk(bitstream, [p['f1'], p['f2']], p['fs'], p['T_symbol'], p['fc'], dtype=complex)
+
+    return {
+        'work_dir': work_dir,
+        'data_file': data_file,
+        'ranges': ranges,
+        'index': index,
+        'lines': lines,
+        'iq': iq,
+        'labels': labels,
+        'bitstream': bitstream,
+        'pilot': pilot,
+        'description': {'rows': num_rows, 'selected_rows': len(lines), 'num_samples': num_samples,
+                        'ranges_per_label': ranges_per_label, 'rows_per_range': rows_per_range},
+    }
+
+# Every stage takes the fixture and returns (function, rows): the function to time and the number of
+# rows (signals) it processes per call
+
+def _legacy_chunk_loader(fixture):
+    import pandas as pd
+
+    def run():
+        # Original loader: one pd.read_csv per range, skipping the rows before it
+        raw_data = pd.DataFrame()
+        for modulation, chunks in fixture['ranges'].items():
+            for start, end in chunks:
+                chunk_dataframe = pd.read_csv(fixture['data_file'], header=None, skiprows=start - 1,
+                                              nrows=end - start + 1)
+                chunk_dataframe['Label'] = modulation
+                raw_data = pd.concat([raw_data, chunk_dataframe], ignore_index=True)
+        return raw_data
+    return run, len(fixture['lines'])
+
+def _line_index(fixture):
+    return lambda: build_line_index(fixture['data_file'], cache=False), fixture['description']['rows']
+
+def _chunk_loader(fixture):
+    return (lambda: load_ranges_iq(fixture['data_file'], fixture['ranges'], fixture['index']),
+            len(fixture['lines']))
+
+def _legacy_convert_to_complex(fixture):
+    import pandas as pd
+    strings = pd.read_csv(io.BytesIO(b'\n'.join(fixture['lines'][:LEGACY_ROWS])), header=None)
+    return lambda: strings.map(convert_to_complex), LEGACY_ROWS
+
+def _parse_iq_rows(fixture):
+    return lambda: parse_iq_rows(fixture['lines']), len(fixture['lines'])
+
+def _legacy_iq_split(fixture):
+    import pandas as pd
+    iq = fixture['iq'][:LEGACY_ROWS]
+    complex_data = pd.DataFrame(iq[..., 0] + 1j * iq[..., 1])
+
+    def run():
+        # Original split: two per-cell apply calls per column. Pandas warns about the fragmented frame
+        data = complex_data.copy()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for col in complex_data.columns:
+                data[f'{col}_I'] = data[col].apply(lambda x: x.real)
+                data[f'{col}_Q'] = data[col].apply(lambda x: x.imag)
+        return data
+    return run, LEGACY_ROWS
+
+def _standard_scaler(fixture):
+    from sklearn.preprocessing import StandardScaler
+    features = fixture['iq'].reshape(len(fixture['iq']), -1)
+    return lambda: StandardScaler().fit_transform(features), len(features)
+
+def _streaming_scaler(fixture):
+    from .streaming_scaler import StreamingScaler
+    iq = fixture['iq']
+    out = np.empty(iq.shape, dtype=np.float32)
+    return lambda: StreamingScaler(per='channel').fit_transform(iq, out=out), len(iq)
+
+def _original_generate_bfsk_signal(bitstream, f1, f2, fs, fc, T_symbol):
+    # Original generate_BFSK_Signal_vectorized: one slice assignment per bit
+    num_bits = len(bitstream)
+    t = np.arange(0, num_bits * T_symbol, 1/fs)
+    f_waveform = np.zeros(len(t), dtype=complex)
+    for i, bit in enumerate(bitstream):
+        start_index = i * int(T_symbol * fs)
+        end_index = start_index + int(T_symbol * fs)
+        frequency = f1 if bit == 0 else f2
+        f_waveform[start_index:end_index] = np.exp(2j * np.pi * frequency * t[start_index:end_index])
+    return f_waveform*np.exp(2j*np.pi*fc*t)
+
+def _original_apply_multipath(signal, delays, attenuations, sampling_freq):
+    # Original apply_multipath: one shifted copy per path, built in a real buffer (NumPy warns that the
+    # imaginary part is discarded, which the original did too)
+    multipath_signal = np.copy(signal)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for delay, attenuation in zip(delays, attenuations):
+            delay_samples = int(delay * sampling_freq)
+            delayed_signal = np.zeros(len(signal))
+            delayed_signal[:len(signal) - delay_samples] = signal[delay_samples:] * attenuation
+            multipath_signal += delayed_signal
+    return multipath_signal
+
+def _original_generate_mp_conditions():
+    # Original generate_random_mp_conditions, drawing from the global NumPy random state
+    alpha = -0.02645
+    delays = np.sort(np.random.uniform(0, 0.04, 5))
+    min_attenuation = np.random.uniform(0.01, 0.6)
+    attenuations = [min_attenuation * np.exp(-delay * alpha/max(delays)) for delay in delays]
+    return delays, [max(att, min_attenuation) for att in attenuations]
+
+def _legacy_generate_bfsk(fixture):
+    p = PILOT_PARAMETERS
+    return (lambda: _original_generate_bfsk_signal(fixture['bitstream'], p['f1'], p['f2'], p['fs'], p['fc'],
+                                                   p['T_symbol']), 1)
+
+def _generate_bfsk(fixture):
+    p = PILOT_PARAMETERS
+    return (lambda: modulate_fsk(fixture['bitstream'], [p['f1'], p['f2']], p['fs'], p['T_symbol'], p['fc'],
+                                 dtype=complex), 1)
+
+def _generate_bfsk_batch(fixture):
+    p = PILOT_PARAMETERS
+    bits = generate_random_bits_batch(500, p['bitstream_length'], np.random.default_rng(0))
+    return lambda: modulate_fsk_bits(bits, 2, p['fs'], p['T_symbol'], p['fc'], p['f2'] - p['f1']), len(bits)
+
+def _legacy_apply_multipath(fixture):
+    delays, attenuations = generate_random_mp_conditions_batch(1, rng=np.random.default_rng(0))
+    return (lambda: _original_apply_multipath(fixture['pilot'], delays[0], attenuations[0], PILOT_PARAMETERS['fs']),
+            1)
+
+def _apply_multipath(fixture):
+    delays, attenuations = generate_random_mp_conditions_batch(1, rng=np.random.default_rng(0))
+    return lambda: apply_multipath(fixture['pilot'], delays[0], attenuations[0], PILOT_PARAMETERS['fs']), 1
+
+def _apply_multipath_batch(fixture):
+    delays, attenuations = generate_random_mp_conditions_batch(500, rng=np.random.default_rng(0))
+    return lambda: apply_multipath_batch(fixture['pilot'], delays, attenuations, PILOT_PARAMETERS['fs']), 500
+
+def _apply_awgn_snr(fixture):
+    return lambda: apply_awgn_snr(fixture['pilot'], 15.0), 1
+
+def _apply_awgn_snr_batch(fixture):
+    signals = np.broadcast_to(fixture['pilot'].astype(np.complex64), (500, len(fixture['pilot'])))
+    rng = np.random.default_rng(0)
+    snr_db = rng.uniform(0, 30, len(signals))
+    return lambda: apply_awgn_snr_batch(signals, snr_db, rng), len(signals)
+
+def _legacy_dataset_generation(fixture):
+    import pandas as pd
+    pilot = fixture['pilot']
+    fs = PILOT_PARAMETERS['fs']
+    columns = (['BFSK_Signal_Real', 'BFSK_Signal_Imag'] + [f'Delay_{i+1}' for i in range(5)]
+               + [f'Attenuation_{i+1}' for i in range(5)] + ['SNR'])
+
+    def run():
+        # Original dataset generation loop: per-sample channel functions, per-value lists of the real and
+        # imaginary parts and one pd.concat per sample
+        np.random.seed(0)
+        df = pd.DataFrame(columns=columns)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            for _ in range(LEGACY_ROWS):
+                delays, attenuations = _original_generate_mp_conditions()
+                snr_db = np.random.uniform(0, 30)
+                multipath_signal = _original_apply_multipath(pilot, delays, attenuations, fs)
+                final_signal = apply_awgn_snr(multipath_signal, snr_db)
+                new_row = {
+                    'BFSK_Signal_Real': [num.real for num in final_signal],
+                    'BFSK_Signal_Imag': [num.imag for num in final_signal],
+                    **{f'Delay_{i+1}': delays[i] for i in range(5)},
+                    **{f'Attenuation_{i+1}': attenuations[i] for i in range(5)},
+                    'SNR': snr_db,
+                }
+                df = pd.concat([df, pd.DataFrame([new_row], columns=columns)], ignore_index=True)
+        return df
+    return run, LEGACY_ROWS
+
+def _dataset_generation(fixture):
+    # The dataset generation loop of the channel assessment notebook, writing to a dataset cache
+    num_signals, batch_size = 3000, 500
+    pilot = fixture['pilot']
+    cache_path = os.path.join(fixture['work_dir'], 'channel_dataset')
+
+    def run():
+        rng = np.random.default_rng(0)
+        dataset = create_cache(cache_path, {'features': ((num_signals, 2 * len(pilot)), np.float32),
+                                            'labels': ((num_signals, 11), np.float64)})
+        for start in range(0, num_signals, batch_size):
+            count = min(batch_size, num_signals - start)
+            signals, labels = generate_channel_realizations(pilot, count, PILOT_PARAMETERS['fs'], rng=rng)
+            dataset['features'][start:start + count, :len(pilot)] = signals.real
+            dataset['features'][start:start + count, len(pilot):] = signals.imag
+            dataset['labels'][start:start + count] = labels
+        commit_cache(cache_path, dataset)
+    return run, num_signals
+
+def _model_stage(build, batch_size):
+    def stage(fixture):
+        model, inputs = build(fixture)
+        batch = np.ascontiguousarray(inputs[:1].repeat(batch_size, axis=0), dtype=np.float32)
+        return lambda: model.predict_on_batch(batch), batch_size
+    return stage
+
+def _amr_model(fixture):
+    from .amr_model import create_model
+    # The packets enter the 1D CNN as (L, 2) I/Q pairs, as in the AMR notebook
+    features = fixture['iq']
+    return create_model(features.shape[1:], num_classes=len(FIXTURE_LABELS)), features
+
+def _channel_model(fixture):
+    from .channel_model import create_multi_output_model
+    pilot = fixture['pilot']
+    features = np.concatenate([pilot.real, pilot.imag])[None, :, None]
+    return create_multi_output_model(features.shape[1:]), features
+
+BENCHMARKS = {
+    'legacy_chunk_loader': _legacy_chunk_loader,
+    'line_index': _line_index,
+    'chunk_loader': _chunk_loader,
+    'legacy_convert_to_complex': _legacy_convert_to_complex,
+    'parse_iq_rows': _parse_iq_rows,
+    'legacy_iq_split': _legacy_iq_split,
+    'standard_scaler': _standard_scaler,
+    'streaming_scaler': _streaming_scaler,
+    'legacy_generate_bfsk': _legacy_generate_bfsk,
+    'generate_bfsk': _generate_bfsk,
+    'generate_bfsk_batch': _generate_bfsk_batch,
+    'legacy_apply_multipath': _legacy_apply_multipath,
+    'apply_multipath': _apply_multipath,
+    'apply_multipath_batch': _apply_multipath_batch,
+    'apply_awgn_snr': _apply_awgn_snr,
+    'apply_awgn_snr_batch': _apply_awgn_snr_batch,
+    'legacy_dataset_generation': _legacy_dataset_generation,
+    'dataset_generation': _dataset_generation,
+    'amr_predict_single': _model_stage(_amr_model, 1),
+    'amr_predict_batch': _model_stage(_amr_model, 64),
+    'channel_predict_single': _model_stage(_channel_model, 1),
+    'channel_predict_batch': _model_stage(_channel_model, 32),
+}
+
+def time_function(function, repeats=5, min_time=0.2):
+    """
+    Time a function after one warm-up call.
+
+    :param function: Function without arguments.
+    :param repeats: Minimum number of timed calls.
+    :param min_time: Minimum total timed duration in seconds; calls are repeated until it is reached.
+    :return: List of call durations in seconds.
+    """
+    function()
+    times = []
+    while len(times) < repeats or sum(times) < min_time:
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return times
+
+def run_benchmarks(fixture, names=None, repeats=5, min_time=0.2):
+    """
+    Run the benchmark stages.
+
+    :param fixture: Fixture from make_fixture.
+    :param names: Names of the stages to run, all of BENCHMARKS if not given.
+    :param repeats: Minimum number of timed calls per stage.
+    :param min_time: Minimum timed duration per stage in seconds.
+    :return: Dictionary mapping stage names to their results. A stage whose dependencies are not
+             installed holds only the reason it was 'skipped'.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        try:
+            function, rows = BENCHMARKS[name](fixture)
+        except ImportError as error:
+            results[name] = {'skipped': str(error)}
+            print(f"{name:>26}: skipped ({error})")
+            continue
+        times = time_function(function, repeats, min_time)
+        median = statistics.median(times)
+        results[name] = {'median_seconds': median, 'min_seconds': min(times), 'calls': len(times), 'rows': rows,
+                         'rows_per_second': rows / median}
+        print(f"{name:>26}: {median * 1000:10.3f} ms median, {rows / median:12.1f} rows/s")
+    return results
+
+def _environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+
+def run_suite(work_dir=None, names=None, repeats=5, min_time=0.2):
+    """
+    Build the fixture and run the benchmark stages.
+
+    :return: Results dictionary, as stored in the JSON baseline.
+    """
+    work_dir = work_dir or os.path.join(tempfile.gettempdir(), 'adapmod_benchmarks')
+    fixture = make_fixture(work_dir)
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'fixture': fixture['description'],
+        'results': run_benchmarks(fixture, names, repeats, min_time),
+    }
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two benchmark runs.
+
+    :param baseline: Results dictionary of the baseline run.
+    :param current: Results dictionary of the current run.
+    :param threshold: Fraction by which the median time may grow before a stage counts as a regression.
+    :return: Tuple (rows, regressions): one (name, baseline_seconds, current_seconds, ratio) row per stage
+             timed in both runs, and the names of the stages that regressed.
+    """
+    rows = []
+    regressions = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name, {})
+        if 'median_seconds' not in result or 'median_seconds' not in reference:
+            continue
+        ratio = result['median_seconds'] / reference['median_seconds']
+        rows.append((name, reference['median_seconds'], result['median_seconds'], ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+def format_comparison(rows, regressions, threshold=DEFAULT_THRESHOLD):
+    lines = [f"{'stage':>26}  {'baseline ms':>12}  {'current ms':>12}  {'change':>8}"]
+    for name, baseline_seconds, current_seconds, ratio in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        lines.append(f"{name:>26}  {baseline_seconds * 1000:12.3f}  {current_seconds * 1000:12.3f}  "
+                     f"{ratio - 1:+8.1%}{flag}")
+    lines.append(f"{len(regressions)} of {len(rows)} stages regressed by more than {threshold:.0%}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the AMR and channel assessment pipelines")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run the suite and store the results as a baseline")
+    run_parser.add_argument('--output', default='benchmark_baseline.json', help="Path of the JSON results")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare against a stored baseline")
+    compare_parser.add_argument('baseline', help="Path of the baseline JSON results")
+    compare_parser.add_argument('--current', help="Path of JSON results to compare, instead of running the suite")
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help="Allowed growth of the median time, as a fraction")
+    compare_parser.add_argument('--output', help="Path to store the results of the current run")
+
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="Stages to run")
+        subparser.add_argument('--repeats', type=int, default=5, help="Minimum timed calls per stage")
+        subparser.add_argument('--min-time', type=float, default=0.2, help="Minimum timed seconds per stage")
+        subparser.add_argument('--work-dir', help="Directory of the fixture files")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare' and args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args.work_dir, args.only, args.repeats, args.min_time)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.command == 'run':
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows, regressions = compare_results(baseline, current, args.threshold)
+    print(format_comparison(rows, regressions, args.threshold))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Channel assessment model.
+
+create_multi_output_model defines the creation of the CNN model that will be used for channel assessment. One thing thats worth noting is how the model splits into three branches for the three predictions. All branches share the convolutional layers. Where they differ is after the convolutional layers.
+
+The branch that predicts the multipath delays takes in the output of the convolutional layers and feeds that output to a dense layer, followed by the final output.
+
+The branch that predicts the multipath attenuations takes in a combination of the convolutional layer output, and the delay branch output and then sends the combination of the two through several dense layers. The reason this has been done is because it was desirable to factor in the results for the delay predictions into the preditions of attenuation in case there was a relationship that could be taken advantage of.
+
+The branch that predicts snr goes straight to the output following the convolution layers.
+
+Keras is imported when a model is built, so importing this module stays cheap.
+"""
+
+def regression_accuracy(y_true, y_pred, threshold=0.1):
+    """
+    A custom accuracy metric for regression tasks.
+    Considers predictions within a certain range of the actual values as accurate.
+    :param y_true: The actual values.
+    :param y_pred: The predicted values.
+    :param threshold: The acceptable range.
+    """
+    import keras
+    # Keras 3 moved the tensor functions of keras.backend to keras.ops
+    K = getattr(keras, 'ops', None) or keras.backend
+    within = K.cast(K.less_equal(K.abs(y_true - y_pred), threshold), 'float32')
+    return K.mean(within, axis=-1)
+
+def create_multi_output_model(input_shape, num_delays=5, num_attenuations=5, filters=(128, 64, 64, 32, 16, 8),
+                              kernel_size=3, dropout=0.2, head_dropout=0.3, learning_rate=0.001):
+    """
+    Create and compile the channel assessment CNN.
+
+    :param input_shape: Shape of one sample, (2L, 1).
+    :param num_delays: Number of multipath delays predicted.
+    :param num_attenuations: Number of multipath attenuations predicted.
+    :param filters: Filters of every shared Conv1D block, each followed by max pooling and dropout.
+    :param kernel_size: Kernel size of the Conv1D layers.
+    :param dropout: Dropout rate after every Conv1D block.
+    :param head_dropout: Dropout rate between the dense layers of the attenuations branch.
+    :param learning_rate: Learning rate of the Adam optimizer.
+    :return: Compiled Keras model.
+    """
+    from keras.models import Model
+    from keras.layers import Input, Conv1D, MaxPooling1D, Flatten, Dense, Dropout, concatenate
+    from keras.optimizers import Adam
+
+    # Input layer
+    input_layer = Input(shape=input_shape)
+
+    # Shared Convolutional layers
+    x = input_layer
+    for block_filters in filters:
+        x = Conv1D(filters=block_filters, kernel_size=kernel_size, activation='relu')(x)
+        x = MaxPooling1D(pool_size=2)(x)
+        x = Dropout(dropout)(x)
+
+    x = Flatten()(x)
+
+    # Branch for Delays
+    x_delays = Dense(64, activation='relu')(x)
+    delays_output = Dense(num_delays, name='delays_output')(x_delays)
+
+    # Combine the output of the delays branch with the flattened features
+    combined_features = concatenate([x, delays_output])
+
+    # Enhanced branch for attenuations
+    x_attenuations = Dense(128, activation='relu')(combined_features)  # First dense layer with more neurons
+    x_attenuations = Dropout(head_dropout)(x_attenuations)  # Dropout layer for regularization
+    x_attenuations = Dense(64, activation='relu')(x_attenuations)  # Second dense layer
+    x_attenuations = Dropout(head_dropout)(x_attenuations)
+    x_attenuations = Dense(32, activation='relu')(x_attenuations)  # Third dense layer
+    attenuations_output = Dense(num_attenuations, name='attenuations_output')(x_attenuations)
+
+    # Branch for SNR
+    snr_output = Dense(1, name='snr_output')(x)  # Output for SNR
+
+    # Define the model
+    model = Model(inputs=input_layer, outputs=[snr_output, delays_output, attenuations_output])
+
+    # Compile the model
+    model.compile(optimizer=Adam(learning_rate=learning_rate),
+                  loss={'snr_output': 'mse', 'delays_output': 'mse', 'attenuations_output': 'mse'},
+                  metrics={'snr_output': regression_accuracy, 'delays_output': regression_accuracy, 'attenuations_output': regression_accuracy})
+
+    return model
+
+def create_compact_model(input_shape, num_delays=5, num_attenuations=5, learning_rate=0.001):
+    """
+    Create the channel assessment model for the features of the matched-filter front end
+    (pilot_frontend.py), a few hundred impulse response taps and the residual power instead of the
+    whole received pilot. The branches are the same as in create_multi_output_model, on top of a much
+    smaller convolutional stack.
+
+    :param input_shape: Shape of one sample, (num_features, 1).
+    :param num_delays: Number of multipath delays predicted.
+    :param num_attenuations: Number of multipath attenuations predicted.
+    :param learning_rate: Learning rate of the Adam optimizer.
+    :return: Compiled Keras model.
+    """
+    from keras.models import Model
+    from keras.layers import Input, Conv1D, Cropping1D, MaxPooling1D, Flatten, Dense, Dropout, concatenate
+    from keras.optimizers import Adam
+
+    input_layer = Input(shape=input_shape)
+
+    # Shared Convolutional layers
+    x = Conv1D(filters=16, kernel_size=5, activation='relu')(input_layer)
+    x = MaxPooling1D(pool_size=2)(x)
+    x = Conv1D(filters=16, kernel_size=5, activation='relu')(x)
+    x = MaxPooling1D(pool_size=2)(x)
+    x = Conv1D(filters=8, kernel_size=3, activation='relu')(x)
+    x = MaxPooling1D(pool_size=2)(x)
+    x = Flatten()(x)
+
+    # The residual power (the last feature) goes straight to the dense layers alongside the convolutions
+    residual_power = Flatten()(Cropping1D(cropping=(input_shape[0] - 1, 0))(input_layer))
+    x = concatenate([x, residual_power])
+
+    # Branch for Delays
+    x_delays = Dense(64, activation='relu')(x)
+    delays_output = Dense(num_delays, name='delays_output')(x_delays)
+
+    # Branch for attenuations, taking in the delays as well
+    combined_features = concatenate([x, delays_output])
+    x_attenuations = Dense(64, activation='relu')(combined_features)
+    x_attenuations = Dropout(0.3)(x_attenuations)
+    x_attenuations = Dense(32, activation='relu')(x_attenuations)
+    attenuations_output = Dense(num_attenuations, name='attenuations_output')(x_attenuations)
+
+    # Branch for SNR
+    snr_output = Dense(1, name='snr_output')(x)
+
+    model = Model(inputs=input_layer, outputs=[snr_output, delays_output, attenuations_output])
+    model.compile(optimizer=Adam(learning_rate=learning_rate),
+                  loss={'snr_output': 'mse', 'delays_output': 'mse', 'attenuations_output': 'mse'},
+                  metrics={'snr_output': regression_accuracy, 'delays_output': regression_accuracy, 'attenuations_output': regression_accuracy})
+    return model
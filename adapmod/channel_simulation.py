@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""Batched channel simulation.
+
+Batched counterparts of the single-signal channel functions the channel assessment notebook was
+written with (generate_random_mp_conditions, apply_multipath and apply_awgn_snr, kept at the end of this
+module). Every batched function works on K realizations at once with array operations, so a whole
+batch of channel realizations costs a handful of NumPy calls instead of a Python loop per realization.
+
+Multipath is applied as a sparse tap-delay line that stays complex throughout and supports fractional
+delays through a precomputed interpolation filter bank.
+"""
+
+import functools
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .tracing import stage
+
+# Attenuation constant (Approximation based of of kinslers fundamentals of acoustics)
+ATTENUATION_CONSTANT = -0.02645
+
+# Maximum multipath delay in seconds
+MAX_DELAY = 0.04
+
+# Interpolation filter bank used for fractional multipath delays
+FRACTIONAL_DELAY_TAPS = 8
+FRACTIONAL_DELAY_PHASES = 64
+
+# Cost of the FFT method per sample and FFT stage, relative to one tap of the direct method per sample.
+# Used to choose the multipath method.
+_FFT_COST_FACTOR = 1.5
+
+# The direct multipath method processes short signals in blocks of rows of about this many bytes, and
+# falls back to one row at a time when fewer than _DIRECT_MIN_BLOCK_ROWS rows fit in a block
+_DIRECT_BLOCK_BYTES = 1 << 18
+_DIRECT_MIN_BLOCK_ROWS = 16
+
+def _default_rng(rng):
+    return np.random.default_rng() if rng is None else rng
+
+def generate_random_mp_conditions_batch(num_realizations, num_paths=5, rng=None):
+    """
+    Generate random multipath conditions for a batch of channel realizations.
+
+    Each row follows generate_random_mp_conditions: sorted delays drawn uniformly from 0 to 40 ms and
+    attenuations that scale exponentially with delay, never below the randomly drawn minimum.
+
+    :param num_realizations: Number of realizations K.
+    :param num_paths: Number of paths per realization.
+    :param rng: np.random.Generator to draw from. A fresh one is created if not given.
+    :return: Tuple (delays, attenuations), both of shape (K, num_paths).
+    """
+    rng = _default_rng(rng)
+
+    # Generate and sort random delays
+    delays = np.sort(rng.uniform(0, MAX_DELAY, (num_realizations, num_paths)), axis=1)
+
+    # Calculate attenuations that decay exponentially with delay
+    min_attenuation = rng.uniform(0.01, 0.6, (num_realizations, 1))
+    attenuations = min_attenuation * np.exp(-delays * ATTENUATION_CONSTANT / delays.max(axis=1, keepdims=True))
+
+    # Ensure that attenuations do not exceed min_attenuation
+    attenuations = np.maximum(attenuations, min_attenuation)
+
+    return delays, attenuations
+
+@functools.lru_cache(maxsize=None)
+def fractional_delay_filter_bank(num_taps=FRACTIONAL_DELAY_TAPS, num_phases=FRACTIONAL_DELAY_PHASES):
+    """
+    Precompute a bank of windowed-sinc interpolation filters for fractional delays.
+
+    Row q interpolates the signal at a fraction q / num_phases of a sample past an integer position, from
+    the num_taps samples at offsets fractional_delay_offsets(num_taps) around it. Each row has unit DC gain
+    and row 0 is an exact integer shift.
+
+    :param num_taps: Number of taps per filter.
+    :param num_phases: Number of fractional positions the delays are quantized to.
+    :return: Read-only array of shape (num_phases, num_taps).
+    """
+    offsets = fractional_delay_offsets(num_taps)
+    fractions = np.arange(num_phases) / num_phases
+    distance = offsets[None, :] - fractions[:, None]
+    window = np.cos(np.pi * distance / (num_taps + 1)) ** 2 if num_taps > 1 else 1.0
+    bank = np.sinc(distance) * window
+    bank /= bank.sum(axis=1, keepdims=True)
+    bank.setflags(write=False)
+    return bank
+
+def fractional_delay_offsets(num_taps):
+    """
+    Sample offsets, relative to the integer part of a delay, read by each tap of the interpolation filters.
+    """
+    return np.arange(num_taps) - (num_taps - 1) // 2
+
+def multipath_taps(delays, attenuations, sampling_freq, fractional=True,
+                   num_taps=FRACTIONAL_DELAY_TAPS, num_phases=FRACTIONAL_DELAY_PHASES):
+    """
+    Convert multipath delays and attenuations into a sparse tap-delay line.
+
+    :param delays: Delays of each path in seconds, shape (K, P).
+    :param attenuations: Gain of each path (real or complex), shape (K, P).
+    :param sampling_freq: Sampling frequency of the signals.
+    :param fractional: Interpolate fractional delays with the filter bank. If False, delays are truncated
+                       to whole samples as apply_multipath does.
+    :param num_taps: Taps per interpolation filter when fractional.
+    :param num_phases: Fractional positions per sample when fractional.
+    :return: Tuple (offsets, gains), both of shape (K, P * taps). Tap j of row k adds
+             gains[k, j] * signal[n + offsets[k, j]] to output sample n.
+    """
+    delays = np.asarray(delays, dtype=np.float64) * sampling_freq
+    attenuations = np.asarray(attenuations)
+    num_realizations, num_paths = delays.shape
+
+    if not fractional:
+        return delays.astype(np.int64), attenuations
+
+    # Split each delay into whole samples and a quantized fraction of a sample
+    whole = np.floor(delays).astype(np.int64)
+    phase = np.rint((delays - whole) * num_phases).astype(np.int64)
+    whole += phase // num_phases
+    phase %= num_phases
+
+    bank = fractional_delay_filter_bank(num_taps, num_phases)
+    offsets = whole[:, :, None] + fractional_delay_offsets(num_taps)[None, None, :]
+    gains = attenuations[:, :, None] * bank[phase]
+    return offsets.reshape(num_realizations, -1), gains.reshape(num_realizations, -1)
+
+def _apply_taps_direct(signals, offsets, gains, output):
+    # Accumulate each tap as a scaled copy of the signal shifted by that tap's offset. Short signals are
+    # processed a block of rows at a time, so each tap costs one NumPy call per block instead of one per
+    # row. Long signals keep one slice per row and tap: there the per-call overhead is negligible and a
+    # block of gathered rows would no longer fit in cache
+    length = signals.shape[1]
+    rows_per_block = _DIRECT_BLOCK_BYTES // (length * output.itemsize)
+    if rows_per_block >= _DIRECT_MIN_BLOCK_ROWS:
+        return _apply_taps_blocks(signals, offsets, gains, output, rows_per_block)
+    return _apply_taps_rows(signals, offsets, gains, output)
+
+def _apply_taps_rows(signals, offsets, gains, output):
+    length = signals.shape[1]
+    for row in range(offsets.shape[0]):
+        signal = signals[row]
+        output_row = output[row]
+        for offset, gain in zip(offsets[row].tolist(), gains[row].tolist()):
+            if offset >= length or offset <= -length:
+                continue
+            if offset >= 0:
+                output_row[:length - offset] += gain * signal[offset:]
+            else:
+                output_row[-offset:] += gain * signal[:length + offset]
+    return output
+
+def _apply_taps_blocks(signals, offsets, gains, output, rows_per_block):
+    # Zero-pad the signals so every offset is a window of the padded row: window s of a padded row is
+    # the signal shifted by offset s - before, with zeros where the shift leaves the signal. Taps
+    # outside the signal are clipped onto an all-zero window and their gain is zeroed
+    num_realizations, length = signals.shape
+    before = min(max(-int(offsets.min()), 0), length)
+    after = min(max(int(offsets.max()), 0), length)
+    starts = np.clip(offsets + before, 0, before + after)
+    gains = np.where(np.abs(offsets) < length, gains, 0)
+
+    # A signal shared by every row (broadcast with a zero stride) is padded only once
+    shared = signals.strides[0] == 0
+    rows_per_block = min(rows_per_block, num_realizations)
+    padded = np.zeros((1 if shared else rows_per_block, before + length + after), dtype=signals.dtype)
+    if shared:
+        padded[0, before:before + length] = signals[0]
+    windows = sliding_window_view(padded, length, axis=1)
+    scaled = np.empty((rows_per_block, length), dtype=output.dtype)
+
+    for first in range(0, num_realizations, rows_per_block):
+        last = min(first + rows_per_block, num_realizations)
+        count = last - first
+        if not shared:
+            padded[:count, before:before + length] = signals[first:last]
+        rows = np.zeros(count, dtype=np.intp) if shared else np.arange(count)
+        block, block_scaled = output[first:last], scaled[:count]
+        for tap in range(offsets.shape[1]):
+            np.multiply(windows[rows, starts[first:last, tap]], gains[first:last, tap, None], out=block_scaled)
+            block += block_scaled
+    return output
+
+def _apply_taps_fft(signals, offsets, gains, output):
+    # Scatter the taps into a dense impulse response h[m], m = min_offset..max_offset, and correlate
+    # it with each signal: y[n] = sum_m h[m] x[n + m]
+    num_realizations, length = signals.shape
+    min_offset = min(int(offsets.min()), 0)
+    span = max(int(offsets.max()), 0) - min_offset + 1
+
+    response = np.zeros((num_realizations, span), dtype=np.complex128)
+    rows = np.repeat(np.arange(num_realizations), offsets.shape[1])
+    np.add.at(response, (rows, (offsets - min_offset).ravel()), gains.ravel())
+
+    fft_length = 1 << int(np.ceil(np.log2(length + span)))
+    # A signal shared by every row (broadcast with a zero stride) is transformed only once
+    shared = signals.strides[0] == 0
+    signal_spectrum = np.fft.fft(signals[:1] if shared else signals, fft_length, axis=1)
+    spectrum = signal_spectrum * np.conj(np.fft.fft(np.conj(response), fft_length, axis=1))
+    correlation = np.fft.ifft(spectrum, axis=1)
+
+    # Correlation index n + min_offset holds output sample n (negative indices wrap to the end)
+    output += np.roll(correlation, -min_offset, axis=1)[:, :length]
+    return output
+
+def apply_multipath_batch(signals, delays, attenuations, sampling_freq, fractional=True, method='auto'):
+    """
+    Apply multipath effects to a batch of complex signals without extending their length.
+
+    Each path adds a copy of the signal, shifted by its delay and scaled by its attenuation, to the
+    original signal. The shift follows apply_multipath (path p adds attenuation * signal[n + delay]).
+    Fractional delays are applied through a precomputed interpolation filter bank. The taps are either
+    accumulated directly, which is fastest for a few short paths, or applied as an FFT correlation, which
+    is fastest for many taps; method='auto' picks whichever needs fewer operations.
+
+    :param signals: Signal of shape (L,) shared by every realization, or a batch of shape (K, L).
+    :param delays: Delays of each path in seconds, shape (K, P).
+    :param attenuations: Attenuation factors (or complex gains) of each path, shape (K, P).
+    :param sampling_freq: Sampling frequency of the signals.
+    :param fractional: Interpolate fractional delays. If False, delays are truncated to whole samples.
+    :param method: 'direct', 'fft' or 'auto'.
+    :return: Complex signals with multipath effects applied, shape (K, L).
+    """
+    offsets, gains = multipath_taps(delays, attenuations, sampling_freq, fractional)
+    num_realizations = offsets.shape[0]
+    dtype = np.result_type(np.asarray(signals).dtype, np.complex64)
+    signals = np.broadcast_to(np.asarray(signals, dtype=dtype), (num_realizations, np.shape(signals)[-1]))
+    length = signals.shape[1]
+
+    if method == 'auto':
+        span = int(offsets.max(initial=0)) - int(min(offsets.min(initial=0), 0)) + 1
+        fft_length = 1 << int(np.ceil(np.log2(length + span)))
+        direct_cost = offsets.shape[1] * length
+        fft_cost = _FFT_COST_FACTOR * fft_length * np.log2(fft_length)
+        method = 'fft' if direct_cost > fft_cost else 'direct'
+
+    # The direct path is the original signal itself. The copy is forced to C order, since a copy of a
+    # broadcast signal would otherwise have strided rows
+    output = np.array(signals, copy=True, order='C')
+    if offsets.shape[1] == 0:
+        return output
+    if method == 'direct':
+        return _apply_taps_direct(signals, offsets, gains, output)
+    if method == 'fft':
+        return _apply_taps_fft(signals, offsets, gains, output)
+    raise ValueError(f"Unknown multipath method: {method}")
+
+def apply_awgn_snr_batch(signals, snr_db, rng=None):
+    """
+    Apply Additive White Gaussian Noise to a batch of signals, each at its own SNR.
+
+    :param signals: Signals of shape (K, L).
+    :param snr_db: Desired Signal-to-Noise Ratio of each signal in dB, shape (K,).
+    :param rng: np.random.Generator to draw from. A fresh one is created if not given.
+    :return: Signals with AWGN applied, shape (K, L).
+    """
+    rng = _default_rng(rng)
+
+    # Calculate the power of each signal and the noise power that gives the desired SNR
+    signal_power = np.mean(np.abs(signals)**2, axis=1)
+    noise_power = signal_power / 10 ** (np.asarray(snr_db) / 10)
+
+    # Generate real white Gaussian noise, as apply_awgn_snr does, in the precision of the signals
+    real_dtype = np.float32 if signals.dtype in (np.float32, np.complex64) else np.float64
+    noise = rng.standard_normal(signals.shape, dtype=real_dtype)
+    noise *= np.sqrt(noise_power).astype(real_dtype)[:, None]
+
+    return signals + noise
+
+def generate_channel_realizations(signal, num_realizations, sampling_freq, snr_range=(0, 30), num_paths=5, rng=None,
+                                  fractional=True):
+    """
+    Generate a batch of channel realizations of a pilot signal.
+
+    :param signal: Pilot signal of shape (L,).
+    :param num_realizations: Number of realizations K.
+    :param sampling_freq: Sampling frequency of the signal.
+    :param snr_range: (low, high) range the SNR in dB is drawn uniformly from.
+    :param num_paths: Number of multipath paths per realization.
+    :param rng: np.random.Generator to draw from. A fresh one is created if not given.
+    :param fractional: Apply the multipath delays with sub-sample precision.
+    :return: Tuple (signals, labels). signals is a complex64 array of shape (K, L). labels has shape
+             (K, 2 * num_paths + 1) and holds the delays, then the attenuations, then the SNR in dB.
+    """
+    rng = _default_rng(rng)
+
+    with stage('channel_synthesis', rows=num_realizations):
+        # Generate random channel conditions
+        delays, attenuations = generate_random_mp_conditions_batch(num_realizations, num_paths, rng)
+        snr_db = rng.uniform(snr_range[0], snr_range[1], num_realizations)
+
+        # Apply channel conditions
+        with stage('multipath', rows=num_realizations):
+            multipath_signals = apply_multipath_batch(signal, delays, attenuations, sampling_freq, fractional)
+        with stage('awgn', rows=num_realizations):
+            final_signals = apply_awgn_snr_batch(multipath_signals, snr_db, rng)
+
+    labels = np.concatenate([delays, attenuations, snr_db[:, None]], axis=1)
+    return final_signals.astype(np.complex64), labels
+
+def generate_random_mp_conditions():
+    """
+    Generate a random set of multipath conditions with ordered delays and attenuations scaling linearly with delay.
+
+    :return: List of multipath conditions.
+    """
+    alpha = -0.02645 # Attenuation constant (Approximation based of of kinslers fundamentals of acoustics)
+    # Generate number of paths (Can later be modified to be random in future work)
+    num_paths = 5
+
+    # Generate and sort random delays
+    delays = np.sort(np.random.uniform(0, 0.04, num_paths))
+
+    # Calculate attenuations that decay exponentially with delay
+    min_attenuation = np.random.uniform(0.01, 0.6)
+    attenuations = [min_attenuation * np.exp(-delay * alpha/max(delays)) for delay in delays]
+
+    # Ensure that attenuations do not exceed min_attenuation
+    attenuations = [max(att, min_attenuation) for att in attenuations]
+
+    return delays, attenuations
+
+def apply_multipath(signal, delays, attenuations, sampling_freq):
+    """
+    Apply multipath effects to a signal without extending its length.
+
+    :param signal: The original signal (numpy array).
+    :param delays: List of delays for each path in seconds.
+    :param attenuations: List of attenuation factors for each path (0 to 1).
+    :param sampling_freq: Sampling frequency of the signal.
+    :return: Signal with multipath effects applied.
+    """
+    # Apply the paths as a complex tap-delay line with the delays truncated to whole samples
+    return apply_multipath_batch(signal, [delays], [attenuations], sampling_freq, fractional=False)[0]
+
+def apply_awgn_snr(signal, snr_db): # Applies addiive white gausian noise to signal
+    """
+    Apply Additive White Gaussian Noise to a signal based on a given SNR in dB.
+
+    :param signal: The original signal (numpy array).
+    :param snr_db: Desired Signal-to-Noise Ratio in dB.
+    :return: Signal with AWGN applied.
+    """
+    # Calculate signal power
+    signal_power = np.mean(np.abs(signal)**2)
+
+    # Convert SNR from dB to linear scale
+    snr_linear = 10 ** (snr_db / 10)
+
+    # Calculate noise power based on SNR
+    noise_power = signal_power / snr_linear
+
+    # Generate white Gaussian noise
+    noise = np.random.normal(0, np.sqrt(noise_power), len(signal))
+
+    # Add noise to the signal
+    noisy_signal = signal + noise
+
+    return noisy_signal
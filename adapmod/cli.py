@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Command line interface of the adapmod package.
+
+    python -m adapmod prepare --csv train_data.csv
+    python -m adapmod generate --num-signals 100000 --workers 8
+    python -m adapmod train amr --epochs 10
+    python -m adapmod train channel --epochs 30
+    python -m adapmod infer amr packets.npy --output decisions.json
+    python -m adapmod infer channel pilots.npy
+
+prepare parses the HisarMod rows of the FSK schemes into a dataset cache and writes the scaled AMR
+inputs and the fitted scaler. generate builds the channel assessment dataset in shards and merges it.
+train trains either model with Keras and exports it for the NumPy runtime, and infer runs an exported
+model on a .npy file or a dataset cache with NumPy alone. Every file is read from and written to the
+workspace of config.py (--home, $ADAPMOD_HOME or ~/adapmod); prepare can also take the CSV file and
+infer the model from elsewhere. Keras, scikit-learn and joblib are only imported by the commands that need them.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from .config import workspace_paths
+
+def _load_input(path):
+    """
+    Load model inputs from a .npy file, or the 'features' array of a dataset cache directory.
+    """
+    from .dataset_cache import open_cache
+
+    if os.path.isdir(path):
+        return open_cache(path)[0]['features']
+    return np.load(path, mmap_mode='r')
+
+def prepare(args, paths):
+    from joblib import dump
+
+    from .dataset_cache import cache_key, commit_cache, create_cache, load_or_build
+    from .hisarmod import FSK_RANGES, build_line_index, load_ranges_iq
+    from .streaming_scaler import StreamingScaler
+
+    csv_path = args.csv or paths['hisarmod_csv']
+
+    def build_dataset():
+        iq, iq_labels, bad_rows = load_ranges_iq(csv_path, FSK_RANGES, index=build_line_index(csv_path))
+        if bad_rows:
+            print(f"{len(bad_rows)} problematic rows were zero filled: {bad_rows[:20]}")
+        return {'features': iq, 'labels': iq_labels}
+
+    dataset, _ = load_or_build(paths['hisarmod_cache'], cache_key(csv_path, FSK_RANGES), build_dataset)
+    features = dataset['features']
+    # Integer labels in sorted class order, as LabelEncoder assigns them
+    class_names, integer_labels = np.unique(np.asarray(dataset['labels']), return_inverse=True)
+
+    scaler = StreamingScaler(per='channel')
+    scaled = create_cache(paths['amr_scaled'], {'features': (features.shape, np.float32),
+                                                'labels': (integer_labels.shape, np.int64)},
+                          metadata={'class_names': class_names.tolist()})
+    scaler.fit_transform(features, out=scaled['features'])
+    scaled['labels'][:] = integer_labels
+    commit_cache(paths['amr_scaled'], scaled)
+
+    os.makedirs(os.path.dirname(paths['amr_scaler']), exist_ok=True)
+    dump(scaler, paths['amr_scaler'])
+    print(f"Prepared {len(features)} packets of {', '.join(class_names)} in {paths['amr_scaled']}")
+
+def generate(args, paths):
+    from .fsk_modulation import PILOT_PARAMETERS, generate_pilot
+    from .sharded_generation import generate_sharded_dataset, merge_shards
+
+    pilot, bitstream = generate_pilot(args.seed)
+    generate_sharded_dataset(paths['channel_shards'], pilot, PILOT_PARAMETERS['fs'], args.num_signals,
+                             shard_size=args.shard_size, seed=args.seed, num_workers=args.workers,
+                             snr_range=tuple(args.snr_range),
+                             metadata={'bitstream': bitstream.tolist(), **PILOT_PARAMETERS})
+    merge_shards(paths['channel_shards'], paths['channel_dataset'])
+    print(f"Generated {args.num_signals} pilots in {paths['channel_dataset']}")
+
+def _train_amr(args, paths):
+    from joblib import load
+
+    from .amr_model import create_model
+    from .dataset_cache import open_cache
+    from .numpy_runtime import export_model
+
+    arrays, metadata = open_cache(paths['amr_scaled'])
+    class_names = metadata['class_names']
+    model = create_model(arrays['features'].shape[1:], num_classes=len(class_names))
+    model.fit(arrays['features'], arrays['labels'], epochs=args.epochs, batch_size=args.batch_size,
+              validation_split=args.validation_split, shuffle=True)
+    model.save(paths['amr_keras'])
+    # The scaler is folded into the first layer, so the runtime takes the raw I/Q packets
+    export_model(model, paths['amr_model'], scaler=load(paths['amr_scaler']), metadata={'class_names': class_names})
+
+def _train_channel(args, paths):
+    from .channel_model import create_multi_output_model
+    from .dataset_cache import open_cache
+    from .numpy_runtime import export_model
+    from .sharded_generation import manifest_pilot, read_manifest
+    from .synthetic_pipeline import SyntheticPilotStream
+
+    manifest = read_manifest(paths['channel_shards'])
+    arrays, metadata = open_cache(paths['channel_dataset'])
+    features, labels = arrays['features'], arrays['labels']
+    num_paths = manifest['num_paths']
+    # The training batches are generated on the fly, so every sample of the dataset is used for validation
+    validation_labels = {'snr_output': labels[:, 2 * num_paths], 'delays_output': labels[:, :num_paths],
+                         'attenuations_output': labels[:, num_paths:2 * num_paths]}
+
+    model = create_multi_output_model((features.shape[1], 1), num_delays=num_paths, num_attenuations=num_paths)
+    with SyntheticPilotStream(manifest_pilot(manifest), manifest['sampling_freq'], batch_size=args.batch_size,
+                              num_workers=args.workers, prefetch=4 * args.workers,
+                              snr_range=tuple(manifest['snr_range']), num_paths=num_paths) as training_stream:
+        model.fit(training_stream.batches(), steps_per_epoch=args.steps_per_epoch, epochs=args.epochs,
+                  validation_data=(features[..., np.newaxis], validation_labels))
+    model.save(paths['channel_keras'])
+    export_model(model, paths['channel_model'], metadata={'label_columns': metadata['label_columns']})
+
+def train(args, paths):
+    if args.model == 'amr':
+        _train_amr(args, paths)
+    else:
+        _train_channel(args, paths)
+    print(f"Exported {paths[args.model + '_model']}")
+
+def infer(args, paths):
+    from .numpy_runtime import NumpyModel
+
+    runtime = NumpyModel.load(args.model_path or paths[args.model + '_model'])
+    inputs = _load_input(args.input)
+    if np.iscomplexobj(inputs):
+        # Complex packets of shape (N, L) become I/Q pairs, pilots their real parts followed by the imaginary parts
+        if args.model == 'amr':
+            inputs = np.stack([inputs.real, inputs.imag], axis=-1)
+        else:
+            inputs = np.concatenate([inputs.real, inputs.imag], axis=1)
+
+    if args.model == 'amr':
+        probabilities = runtime.predict(inputs, batch_size=args.batch_size)
+        class_names = runtime.metadata.get('class_names')
+        indices = np.argmax(probabilities, axis=1)
+        results = [{'label': class_names[index] if class_names else int(index),
+                    'confidence': float(probabilities[row, index])}
+                   for row, index in enumerate(indices)]
+    else:
+        snr, delays, attenuations = runtime.predict(inputs, batch_size=args.batch_size)
+        results = [{'snr_db': float(snr[row, 0]), 'delays': delays[row].tolist(),
+                    'attenuations': attenuations[row].tolist()}
+                   for row in range(len(snr))]
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f)
+    else:
+        for result in results:
+            print(json.dumps(result))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='adapmod', description="Adaptive modulation datasets, models and inference")
+    parser.add_argument('--home', help="Workspace directory (defaults to $ADAPMOD_HOME, then ~/adapmod)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    prepare_parser = subparsers.add_parser('prepare', help="Parse and scale the HisarMod FSK rows for the AMR model")
+    prepare_parser.add_argument('--csv', help="Path of the HisarMod train_data.csv")
+
+    generate_parser = subparsers.add_parser('generate', help="Generate the channel assessment dataset")
+    generate_parser.add_argument('--num-signals', type=int, default=3000, help="Number of pilots")
+    generate_parser.add_argument('--shard-size', type=int, default=500, help="Pilots per shard")
+    generate_parser.add_argument('--seed', type=int, default=0, help="Seed of the pilot and of the channels")
+    generate_parser.add_argument('--workers', type=int, help="Generating processes (defaults to the CPU count)")
+    generate_parser.add_argument('--snr-range', type=float, nargs=2, default=(0, 30), help="SNR range in dB")
+
+    train_parser = subparsers.add_parser('train', help="Train a model and export it for the NumPy runtime")
+    train_parser.add_argument('model', choices=('amr', 'channel'))
+    train_parser.add_argument('--epochs', type=int, help="Training epochs (10 for amr, 30 for channel)")
+    train_parser.add_argument('--batch-size', type=int, default=32)
+    train_parser.add_argument('--validation-split', type=float, default=0.1,
+                              help="Fraction of the packets held out (amr only)")
+    train_parser.add_argument('--steps-per-epoch', type=int, default=100,
+                              help="Generated batches per epoch (channel only)")
+    train_parser.add_argument('--workers', type=int, default=4, help="Batch generating processes (channel only)")
+
+    infer_parser = subparsers.add_parser('infer', help="Run an exported model with the NumPy runtime")
+    infer_parser.add_argument('model', choices=('amr', 'channel'))
+    infer_parser.add_argument('input', help=".npy file or dataset cache directory of packets (amr) or pilots (channel)")
+    infer_parser.add_argument('--model-path', help="Exported model, instead of the one in the workspace")
+    infer_parser.add_argument('--batch-size', type=int, default=256)
+    infer_parser.add_argument('--output', help="JSON file of the results, instead of one JSON line per input")
+
+    args = parser.parse_args(argv)
+    if args.command == 'train' and args.epochs is None:
+        args.epochs = 10 if args.model == 'amr' else 30
+    commands = {'prepare': prepare, 'generate': generate, 'train': train, 'infer': infer}
+    commands[args.command](args, workspace_paths(args.home))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
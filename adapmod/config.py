@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Local paths of the datasets and models.
+
+The notebooks read and write everything under /content/drive. Outside of Colab the same files live in a
+workspace directory, given with --home on the command line or the ADAPMOD_HOME environment variable,
+and ~/adapmod otherwise. The file names are the ones the notebooks use, so a workspace can be filled
+from a copy of the notebooks' Drive folders (MyDrive/Data and MyDrive/Models) and the other way around.
+
+    paths = workspace_paths('/data/adapmod')
+    runtime = NumpyModel.load(paths['amr_model'])
+"""
+
+import os
+
+# Environment variable holding the workspace directory
+HOME_ENV = 'ADAPMOD_HOME'
+
+DEFAULT_HOME = os.path.join('~', 'adapmod')
+
+def workspace_home(home=None):
+    """
+    Resolve the workspace directory: home if given, else $ADAPMOD_HOME, else ~/adapmod.
+    """
+    return os.path.abspath(os.path.expanduser(home or os.environ.get(HOME_ENV) or DEFAULT_HOME))
+
+def workspace_paths(home=None):
+    """
+    Paths of the files of a workspace. Nothing is created.
+
+    :param home: Workspace directory, resolved with workspace_home.
+    :return: Dictionary mapping every file or directory of the workspace to its path.
+    """
+    home = workspace_home(home)
+    data = os.path.join(home, 'Data')
+    models = os.path.join(home, 'Models')
+    return {
+        'home': home,
+        'data': data,
+        'models': models,
+        'hisarmod_csv': os.path.join(data, 'HisarMod', 'train_data.csv'),
+        'hisarmod_cache': os.path.join(data, 'HisarMod', 'cache'),
+        'amr_scaled': os.path.join(data, 'HisarMod', 'cache', 'scaled'),
+        'channel_shards': os.path.join(data, 'channelassessment_shards'),
+        'channel_dataset': os.path.join(data, 'channelassessment_cache'),
+        'amr_keras': os.path.join(models, 'AMRProjectModel.keras'),
+        'amr_model': os.path.join(models, 'AMRProjectModel.npmodel'),
+        'amr_scaler': os.path.join(models, 'AMRProjectScaler.joblib'),
+        'channel_keras': os.path.join(models, 'ChannelAssessmentModel.keras'),
+        'channel_model': os.path.join(models, 'ChannelAssessmentModel.npmodel'),
+    }
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Parallel cross validation.
+
+Trains the folds of a stratified K-fold cross validation concurrently in a process pool. Every worker
+caps the threads used by TensorFlow and the BLAS libraries, so the folds share the machine's cores
+instead of oversubscribing them. The libraries size their thread pools when they are imported, which
+for NumPy happens while a spawned worker unpickles its first task, so the caps are set in the
+environment the workers are started with rather than by the workers themselves. The features are shared
+with the workers through a memory-mapped dataset cache rather than being copied into every process (the
+cache they come from, when they were opened from one), and the weights of every fold are kept so they
+can be reused as a soft-voting ensemble or as the starting point of the final model.
+"""
+
+import contextlib
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .dataset_cache import cache_source, open_cache, write_cache
+from .tracing import stage
+
+# Environment variables read by TensorFlow and the BLAS libraries when they create their thread pools
+_THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+
+@contextlib.contextmanager
+def _worker_thread_limits(num_threads):
+    """
+    Cap the threads of the numerical libraries in the worker processes started within the context.
+
+    The variables are set in this process's environment, which spawned workers inherit, and restored on exit.
+    """
+    overrides = {name: str(num_threads) for name in _THREAD_ENV_VARS}
+    # Keep the TensorFlow log quiet when several workers start at once
+    overrides.setdefault('TF_CPP_MIN_LOG_LEVEL', os.environ.get('TF_CPP_MIN_LOG_LEVEL', '2'))
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def _share_array(array, cache_path, name):
+    """
+    Make an array available to worker processes through a dataset cache.
+
+    :param array: Array to share.
+    :param cache_path: Cache directory written if array does not already come from a cache.
+    :param name: Name of the array in the written cache.
+    :return: Tuple (cache_path, name) locating the array, for _open_shared.
+    """
+    source = cache_source(array)
+    if source is not None:
+        return source
+    write_cache(cache_path, {name: np.asarray(array)})
+    return cache_path, name
+
+def _open_shared(source):
+    """
+    Open an array shared with _share_array.
+    """
+    cache_path, name = source
+    return open_cache(cache_path)[0][name]
+
+def _configure_tensorflow_threads(num_threads):
+    import tensorflow as tf
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        # The thread pools were already created, the environment variables apply instead
+        pass
+
+def _train_fold(fold, features_source, labels_source, train_index, val_index, build_model, epochs, batch_size,
+                num_threads, weights_path, class_names):
+    """
+    Train and evaluate one fold. Runs in a worker process.
+    """
+    from sklearn.metrics import confusion_matrix, classification_report
+
+    _configure_tensorflow_threads(num_threads)
+    features, labels = _open_shared(features_source), _open_shared(labels_source)
+
+    X_train, X_val = features[train_index], features[val_index]
+    y_train, y_val = labels[train_index], labels[val_index]
+
+    model = build_model(X_train.shape[1:])
+    with stage('fold_fit', rows=len(X_train) * epochs, fold=fold + 1, epochs=epochs):
+        model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, validation_data=(X_val, y_val), verbose=0)
+
+    with stage('fold_evaluate', rows=len(X_val), fold=fold + 1):
+        # Evaluate model on validation data
+        score = model.evaluate(X_val, y_val, verbose=0)
+
+        # Predict on validation data
+        y_pred = model.predict(X_val, batch_size=1024, verbose=0)
+        y_pred_int = np.argmax(y_pred, axis=1)
+
+    model.save_weights(weights_path)
+    return {
+        'fold': fold,
+        'score': score[1],  # assuming score[1] is accuracy
+        'cm': confusion_matrix(y_val, y_pred_int, labels=np.arange(len(class_names))),
+        'report': classification_report(y_val, y_pred_int, labels=np.arange(len(class_names)),
+                                        target_names=class_names),
+        'weights_path': weights_path,
+        'val_index': val_index,
+    }
+
+def run_cross_validation(features, labels, build_model, class_names, n_folds=5, epochs=10, batch_size=32,
+                         random_state=42, max_workers=None, threads_per_worker=None, work_dir=None):
+    """
+    Run stratified K-fold cross validation with the folds trained concurrently.
+
+    :param features: Array of shape (N, ...) holding the (scaled) model inputs.
+    :param labels: Integer class labels of shape (N,).
+    :param build_model: Picklable function taking the input shape and returning a compiled Keras model,
+                        e.g. functools.partial(create_model, num_classes=3).
+    :param class_names: Names of the classes, in label order.
+    :param n_folds: Number of folds.
+    :param epochs: Training epochs per fold.
+    :param batch_size: Training batch size.
+    :param random_state: Seed of the fold split.
+    :param max_workers: Number of folds trained at once. Defaults to min(n_folds, CPU count).
+    :param threads_per_worker: Threads used by each fold. Defaults to an even share of the CPUs.
+    :param work_dir: Directory for the shared dataset and the fold weights. A temporary directory is
+                     created if not given.
+    :return: Dictionary with the per-fold 'scores', 'cms', 'reports' and 'weights_paths' (in fold order),
+             plus 'val_indices' and 'work_dir'.
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    cpu_count = os.cpu_count() or 1
+    if max_workers is None:
+        max_workers = min(n_folds, cpu_count)
+    if threads_per_worker is None:
+        threads_per_worker = max(1, cpu_count // max_workers)
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='amr_cv_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Share the dataset with the workers through memory-mapped caches
+    features_source = _share_array(features, os.path.join(work_dir, 'features'), 'features')
+    labels_source = _share_array(labels, os.path.join(work_dir, 'labels'), 'labels')
+
+    skf = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+    folds = list(skf.split(np.zeros(len(labels)), labels))
+
+    results = [None] * n_folds
+    # TensorFlow is not fork safe, so the workers are started fresh
+    context = multiprocessing.get_context('spawn')
+    with _worker_thread_limits(threads_per_worker), \
+            ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = [executor.submit(_train_fold, fold, features_source, labels_source, train_index, val_index,
+                                   build_model, epochs, batch_size, threads_per_worker,
+                                   os.path.join(work_dir, f'fold_{fold + 1}.weights.h5'), list(class_names))
+                   for fold, (train_index, val_index) in enumerate(folds)]
+        # Gather the results as the folds finish
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['fold']] = result
+            print(f"Fold {result['fold'] + 1} completed: accuracy {result['score']:.4f}")
+
+    return {
+        'scores': [result['score'] for result in results],
+        'cms': [result['cm'] for result in results],
+        'reports': [result['report'] for result in results],
+        'weights_paths': [result['weights_path'] for result in results],
+        'val_indices': [result['val_index'] for result in results],
+        'work_dir': work_dir,
+    }
+
+def load_fold_models(build_model, input_shape, weights_paths):
+    """
+    Rebuild the models trained during cross validation from their saved weights.
+
+    :param build_model: Function used to build the models for cross validation.
+    :param input_shape: Shape of one sample.
+    :param weights_paths: Weight files, as returned in 'weights_paths' by run_cross_validation.
+    :return: List of Keras models.
+    """
+    models = []
+    for weights_path in weights_paths:
+        model = build_model(input_shape)
+        model.load_weights(weights_path)
+        models.append(model)
+    return models
+
+def soft_vote_predict(models, features, batch_size=1024):
+    """
+    Predict with a soft-voting ensemble of fold models, averaging their softmax outputs.
+
+    :param models: Fold models from load_fold_models.
+    :param features: Model inputs.
+    :param batch_size: Prediction batch size.
+    :return: Averaged class probabilities of shape (N, num_classes).
+    """
+    probabilities = None
+    for model in models:
+        prediction = model.predict(features, batch_size=batch_size, verbose=0)
+        probabilities = prediction if probabilities is None else probabilities + prediction
+    return probabilities / len(models)
+
+def warm_start_model(build_model, input_shape, cv_results):
+    """
+    Build a model initialized with the weights of the best scoring fold.
+
+    Fine tuning it on the full dataset for a few epochs replaces training the final model from scratch.
+
+    :param build_model: Function used to build the models for cross validation.
+    :param input_shape: Shape of one sample.
+    :param cv_results: Dictionary returned by run_cross_validation.
+    :return: Tuple (model, fold) with the initialized model and the (0 based) fold it was taken from.
+    """
+    fold = int(np.argmax(cv_results['scores']))
+    model = build_model(input_shape)
+    model.load_weights(cv_results['weights_paths'][fold])
+    return model, fold
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Binary dataset cache.
+
+A cache is a directory holding one raw little-endian binary file per numeric array and a JSON header
+describing them. Text arrays (such as modulation labels) are small and are stored in the header itself.
+Numeric arrays are opened with np.memmap, so opening a cache costs almost nothing and datasets larger
+than memory can still be used for training.
+
+    <cache>/header.json
+    <cache>/features.bin
+    <cache>/labels.bin
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .tracing import stage
+
+CACHE_FORMAT_VERSION = 1
+HEADER_FILE = 'header.json'
+
+def cache_key(source_files, spec=None):
+    """
+    Compute a cache key from the source files and the specification used to build a dataset.
+
+    Source files are identified by their path, size and modification time, so a changed input produces
+    a new key without having to hash the (possibly multi-GB) contents.
+
+    :param source_files: Path, or list of paths, of the files the dataset is built from.
+    :param spec: Any JSON serializable description of how the dataset is built (e.g. the ranges dictionary).
+    :return: Hexadecimal key string.
+    """
+    if isinstance(source_files, (str, os.PathLike)):
+        source_files = [source_files]
+
+    sources = []
+    for source_file in source_files:
+        stat = os.stat(source_file)
+        sources.append([os.path.abspath(source_file), stat.st_size, stat.st_mtime_ns])
+
+    description = json.dumps({'format': CACHE_FORMAT_VERSION, 'sources': sources, 'spec': spec},
+                             sort_keys=True, default=str)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()[:16]
+
+def _tmp_path(cache_path):
+    return cache_path.rstrip(os.sep) + '.tmp'
+
+def create_cache(cache_path, specs, metadata=None):
+    """
+    Allocate the numeric arrays of a cache so they can be filled in place, batch by batch.
+
+    The arrays are allocated in a temporary directory and only become visible at cache_path once
+    commit_cache is called, so a cache that exists is always complete.
+
+    :param cache_path: Directory the cache is committed to.
+    :param specs: Dictionary mapping names to (shape, dtype) tuples.
+    :param metadata: Optional JSON serializable dictionary stored in the header.
+    :return: Dictionary mapping names to writable np.memmap arrays.
+    """
+    tmp_path = _tmp_path(cache_path)
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    header = {'format': CACHE_FORMAT_VERSION, 'arrays': {}, 'metadata': metadata or {}}
+    arrays = {}
+    for name, (shape, dtype) in specs.items():
+        dtype = np.dtype(dtype).newbyteorder('<')
+        shape = tuple(shape)
+        file_name = name + '.bin'
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(os.path.join(tmp_path, file_name), dtype=dtype, mode='w+', shape=shape)
+        header['arrays'][name] = {'dtype': dtype.str, 'shape': list(shape), 'file': file_name}
+
+    with open(os.path.join(tmp_path, HEADER_FILE), 'w') as f:
+        json.dump(header, f)
+    return arrays
+
+def commit_cache(cache_path, arrays=None):
+    """
+    Make a cache allocated with create_cache visible at its final location.
+
+    :param cache_path: Directory given to create_cache. Replaced if it already exists.
+    :param arrays: Optional dictionary returned by create_cache, flushed before committing.
+    :return: cache_path.
+    """
+    for array in (arrays or {}).values():
+        if isinstance(array, np.memmap):
+            array.flush()
+
+    if os.path.exists(cache_path):
+        shutil.rmtree(cache_path)
+    os.replace(_tmp_path(cache_path), cache_path)
+    return cache_path
+
+def write_cache(cache_path, arrays, metadata=None):
+    """
+    Write a dictionary of arrays as a cache directory.
+
+    :param cache_path: Directory to write the cache to. Replaced if it already exists.
+    :param arrays: Dictionary mapping names to arrays. Numeric arrays are stored as raw little-endian
+                   binary files, string or object arrays are stored in the JSON header.
+    :param metadata: Optional JSON serializable dictionary stored in the header.
+    :return: cache_path.
+    """
+    arrays = {name: np.asarray(array) for name, array in arrays.items()}
+    numeric = {name: array for name, array in arrays.items() if array.dtype.kind not in 'OUS'}
+
+    with stage('write_cache', bytes=sum(array.nbytes for array in numeric.values())):
+        stored = create_cache(cache_path, {name: (array.shape, array.dtype) for name, array in numeric.items()},
+                              metadata)
+        for name, array in numeric.items():
+            stored[name][...] = array
+
+    # Text arrays are kept in the header
+    header_path = os.path.join(_tmp_path(cache_path), HEADER_FILE)
+    with open(header_path) as f:
+        header = json.load(f)
+    for name, array in arrays.items():
+        if name not in numeric:
+            header['arrays'][name] = {'dtype': 'str', 'shape': list(array.shape),
+                                      'values': [str(value) for value in array.ravel()]}
+    with open(header_path, 'w') as f:
+        json.dump(header, f)
+
+    return commit_cache(cache_path, stored)
+
+def open_cache(cache_path, mode='r'):
+    """
+    Open a cache directory written by write_cache.
+
+    :param cache_path: Cache directory.
+    :param mode: np.memmap mode used for the numeric arrays ('r', 'r+' or 'c').
+    :return: Tuple (arrays, metadata). Numeric arrays are np.memmap instances, string arrays are
+             loaded into memory as object arrays.
+    """
+    with open(os.path.join(cache_path, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header.get('format') != CACHE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported cache format {header.get('format')} in {cache_path}")
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        shape = tuple(entry['shape'])
+        if entry['dtype'] == 'str':
+            arrays[name] = np.array(entry['values'], dtype=object).reshape(shape)
+        elif 0 in shape:
+            # np.memmap cannot map an empty file
+            arrays[name] = np.zeros(shape, dtype=np.dtype(entry['dtype']))
+        else:
+            arrays[name] = np.memmap(os.path.join(cache_path, entry['file']), dtype=np.dtype(entry['dtype']),
+                                     mode=mode, shape=shape)
+    return arrays, header['metadata']
+
+def cache_source(array):
+    """
+    Find the cache an array was opened from, so it can be shared by path instead of being written again.
+
+    :param array: Any array.
+    :return: Tuple (cache_path, name) if array is a whole numeric array of a committed cache as returned
+             by open_cache, None otherwise (including for slices and views of one).
+    """
+    if not isinstance(array, np.memmap) or array.filename is None or array.offset != 0:
+        return None
+    if not array.flags.c_contiguous:
+        return None
+    cache_path, file_name = os.path.split(array.filename)
+    try:
+        with open(os.path.join(cache_path, HEADER_FILE)) as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    for name, entry in header.get('arrays', {}).items():
+        if (entry.get('file') == file_name and entry['dtype'] == array.dtype.str
+                and tuple(entry['shape']) == array.shape):
+            return cache_path, name
+    return None
+
+def load_or_build(cache_dir, key, build, metadata=None):
+    """
+    Open the cache stored under key, building and writing it first if it does not exist yet.
+
+    :param cache_dir: Directory holding the caches.
+    :param key: Cache key, typically from cache_key.
+    :param build: Function with no arguments returning the dictionary of arrays to cache.
+    :param metadata: Optional JSON serializable dictionary stored in the header when building.
+    :return: Tuple (arrays, metadata) as returned by open_cache.
+    """
+    cache_path = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(cache_path, HEADER_FILE)):
+        os.makedirs(cache_dir, exist_ok=True)
+        with stage('build_dataset', key=key):
+            arrays = build()
+        write_cache(cache_path, arrays, metadata)
+    return open_cache(cache_path)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Vectorized M-FSK modulation.
+
+One modulator for the BFSK, 4FSK and 8FSK schemes used by the adaptive modulation system. Waveforms are
+built from a cumulative phase: the phase at the start of every symbol is the running sum of the phase
+advanced by the previous symbols, so consecutive tones join without phase discontinuities. Within a
+symbol each tone is a fixed table of samples, so a whole (batch, n_symbols) matrix of symbols is
+modulated with one table lookup and one complex multiply per sample, without a loop over symbols.
+
+generate_random_bits and generate_BFSK_Signal_vectorized are the single-signal functions the pilot of
+the channel assessment notebook is generated with.
+"""
+
+import numpy as np
+
+# Modulation orders of the schemes recognized by the AMR model
+FSK_ORDERS = {'2FSK': 2, '4FSK': 4, '8FSK': 8}
+
+# BFSK pilot parameters of the channel assessment notebook
+PILOT_PARAMETERS = {'f1': -2500, 'f2': 2500, 'fs': 30000, 'fc': 10000, 'T_symbol': 0.02, 'bitstream_length': 25}
+
+def generate_random_bits_batch(batch_size, num_bits, rng=None):
+    """
+    Generate a batch of random bitstreams.
+
+    :param batch_size: Number of bitstreams.
+    :param num_bits: Length of each bitstream.
+    :param rng: np.random.Generator to draw from. A fresh one is created if not given.
+    :return: uint8 array of shape (batch_size, num_bits).
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    return rng.integers(0, 2, (batch_size, num_bits), dtype=np.uint8)
+
+def bits_to_symbols(bits, order):
+    """
+    Group bits into M-ary symbols, most significant bit first.
+
+    :param bits: Array of shape (..., num_bits), num_bits a multiple of log2(order).
+    :param order: Modulation order M (2, 4 or 8).
+    :return: Array of shape (..., num_bits / log2(order)) with symbols in 0..M-1.
+    """
+    bits_per_symbol = int(np.log2(order))
+    bits = np.asarray(bits)
+    if bits.shape[-1] % bits_per_symbol:
+        raise ValueError(f"{bits.shape[-1]} bits cannot be grouped into {order}-ary symbols")
+
+    grouped = bits.reshape(bits.shape[:-1] + (-1, bits_per_symbol)).astype(np.int64)
+    weights = 1 << np.arange(bits_per_symbol - 1, -1, -1)
+    return grouped @ weights
+
+def generate_random_symbols(batch_size, num_symbols, order, rng=None):
+    """
+    Generate a batch of random M-ary symbols.
+
+    :param batch_size: Number of symbol sequences.
+    :param num_symbols: Length of each sequence.
+    :param order: Modulation order M.
+    :param rng: np.random.Generator to draw from. A fresh one is created if not given.
+    :return: int64 array of shape (batch_size, num_symbols) with symbols in 0..M-1.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    return rng.integers(0, order, (batch_size, num_symbols))
+
+def fsk_tones(order, tone_spacing):
+    """
+    Baseband tone frequencies of M-FSK, evenly spaced and centred on 0 Hz.
+
+    With order 2 and a spacing of 5000 Hz this gives the -2500 Hz and 2500 Hz tones of the BFSK pilot.
+
+    :param order: Modulation order M.
+    :param tone_spacing: Spacing between adjacent tones in Hz.
+    :return: Array of M frequencies, ordered by symbol value.
+    """
+    return (np.arange(order) - (order - 1) / 2) * tone_spacing
+
+def _check_tones(frequencies, fs):
+    """
+    Reject tones (carrier included) at or beyond the Nyquist frequency, which would alias onto other tones.
+    """
+    highest = np.max(np.abs(frequencies))
+    if highest >= fs / 2:
+        raise ValueError(f"A tone at {highest:g} Hz is at or above the Nyquist frequency {fs / 2:g} Hz; "
+                         "lower the carrier or the tone spacing")
+
+def modulate_fsk(symbols, tones, fs, T_symbol, fc=0, phase_continuous=True, dtype=np.complex64):
+    """
+    Modulate a batch of symbol sequences with M-FSK.
+
+    :param symbols: Integer array of shape (batch, n_symbols) (or (n_symbols,)) indexing into tones.
+    :param tones: Baseband frequency of each symbol value in Hz, e.g. from fsk_tones.
+    :param fs: Sampling frequency.
+    :param T_symbol: Symbol duration.
+    :param fc: Carrier frequency the signal is upconverted with.
+    :param phase_continuous: Accumulate the phase across symbols. If False the phase of every symbol is
+                             taken from the absolute time, as generate_BFSK_Signal_vectorized did.
+    :param dtype: Complex dtype of the output.
+    :return: Complex array of shape (batch, n_symbols * samples_per_symbol) (or 1D for 1D symbols).
+    """
+    symbols = np.asarray(symbols)
+    squeeze = symbols.ndim == 1
+    symbols = np.atleast_2d(symbols)
+    batch_size, num_symbols = symbols.shape
+
+    samples_per_symbol = int(round(T_symbol * fs))
+    symbol_time = samples_per_symbol / fs
+
+    # Every tone includes the carrier, so the upconversion is part of the same phase
+    frequencies = np.asarray(tones, dtype=np.float64) + fc
+    _check_tones(frequencies, fs)
+    k = np.arange(samples_per_symbol)
+    tone_table = np.exp(2j * np.pi * frequencies[:, None] * k[None, :] / fs).astype(dtype)
+
+    # Phase at the start of every symbol, kept within [0, 2*pi) to preserve precision over long streams
+    symbol_frequencies = frequencies[symbols]
+    if phase_continuous:
+        advance = np.mod(2 * np.pi * symbol_frequencies * symbol_time, 2 * np.pi)
+        start_phase = np.cumsum(advance, axis=1) - advance
+    else:
+        start_phase = 2 * np.pi * symbol_frequencies * (np.arange(num_symbols) * symbol_time)[None, :]
+    start_phasor = np.exp(1j * np.mod(start_phase, 2 * np.pi)).astype(dtype)
+
+    waveform = start_phasor[:, :, None] * tone_table[symbols]
+    waveform = waveform.reshape(batch_size, num_symbols * samples_per_symbol)
+    return waveform[0] if squeeze else waveform
+
+def modulate_fsk_bits(bits, order, fs, T_symbol, fc=0, tone_spacing=None, dtype=np.complex64):
+    """
+    Modulate a batch of bitstreams with phase-continuous M-FSK.
+
+    :param bits: Array of shape (batch, num_bits), num_bits a multiple of log2(order).
+    :param order: Modulation order M (2, 4 or 8).
+    :param fs: Sampling frequency.
+    :param T_symbol: Symbol duration.
+    :param fc: Carrier frequency the signal is upconverted with.
+    :param tone_spacing: Spacing between adjacent tones in Hz. Defaults to the orthogonal spacing
+                         fs / samples_per_symbol, as in link_simulator.py.
+    :param dtype: Complex dtype of the output.
+    :return: Complex array of shape (batch, num_symbols * samples_per_symbol).
+    """
+    if tone_spacing is None:
+        tone_spacing = fs / int(round(T_symbol * fs))
+    symbols = bits_to_symbols(bits, order)
+    return modulate_fsk(symbols, fsk_tones(order, tone_spacing), fs, T_symbol, fc, dtype=dtype)
+
+def symbols_to_bits(symbols, order):
+    """
+    Expand M-ary symbols into bits, most significant bit first (the inverse of bits_to_symbols).
+
+    :param symbols: Integer array of shape (..., num_symbols) with symbols in 0..M-1.
+    :param order: Modulation order M (2, 4 or 8).
+    :return: uint8 array of shape (..., num_symbols * log2(order)).
+    """
+    bits_per_symbol = int(np.log2(order))
+    symbols = np.asarray(symbols)
+    shifts = np.arange(bits_per_symbol - 1, -1, -1)
+    bits = (symbols[..., None] >> shifts) & 1
+    return bits.reshape(symbols.shape[:-1] + (-1,)).astype(np.uint8)
+
+def demodulate_fsk(signals, tones, fs, T_symbol, fc=0):
+    """
+    Non-coherently demodulate a batch of M-FSK signals.
+
+    Every symbol interval is correlated with each tone and the tone with the most energy is picked, so
+    the phase of the received signal does not need to be known.
+
+    :param signals: Complex array of shape (batch, n_symbols * samples_per_symbol) (or 1D).
+    :param tones: Baseband frequency of each symbol value in Hz, e.g. from fsk_tones.
+    :param fs: Sampling frequency.
+    :param T_symbol: Symbol duration.
+    :param fc: Carrier frequency the signal was upconverted with.
+    :return: int64 array of shape (batch, n_symbols) (or 1D for 1D signals) with the detected symbols.
+    """
+    signals = np.asarray(signals)
+    squeeze = signals.ndim == 1
+    signals = np.atleast_2d(signals)
+
+    samples_per_symbol = int(round(T_symbol * fs))
+    num_symbols = signals.shape[1] // samples_per_symbol
+    symbol_samples = signals[:, :num_symbols * samples_per_symbol].reshape(len(signals), num_symbols,
+                                                                           samples_per_symbol)
+
+    frequencies = np.asarray(tones, dtype=np.float64) + fc
+    _check_tones(frequencies, fs)
+    k = np.arange(samples_per_symbol)
+    tone_table = np.exp(-2j * np.pi * frequencies[:, None] * k[None, :] / fs).astype(
+        np.result_type(signals.dtype, np.complex64))
+
+    # Correlate every symbol interval with every tone: (batch, n_symbols, M)
+    correlation = symbol_samples @ tone_table.T
+    symbols = np.argmax(correlation.real**2 + correlation.imag**2, axis=2)
+    return symbols[0] if squeeze else symbols
+
+def generate_random_bits(len, rng=None):
+    """
+    Generate a bitstream to transmit.
+
+    :param len: Length of the bitstream.
+    :param rng: np.random.Generator to draw from. A fresh one is created if not given.
+    :return: NumPy array containing the bitstream.
+    """
+    return generate_random_bits_batch(1, len, rng)[0]
+
+def generate_BFSK_Signal_vectorized(bitstream, f1, f2, fs, fc, T_symbol):
+    """
+    Generate a phase-continuous BFSK signal using vectorization.
+
+    :param bitstream: Bitstream to modulate.
+    :param f1: Frequency representing '0'.
+    :param f2: Frequency representing '1'.
+    :param fs: Sampling frequency.
+    :param T_symbol: Symbol duration.
+    :return: BFSK signal as a numpy array.
+    """
+    return modulate_fsk(bitstream, [f1, f2], fs, T_symbol, fc, dtype=complex)
+
+def generate_pilot(seed=0, f1=-2500, f2=2500, fs=30000, fc=10000, T_symbol=0.02, bitstream_length=25):
+    """
+    Generate the BFSK pilot as the channel assessment notebook does, from a bitstream drawn from
+    np.random.default_rng(seed). The defaults are PILOT_PARAMETERS.
+
+    :return: Tuple (pilot, bitstream).
+    """
+    bitstream = generate_random_bits(bitstream_length, np.random.default_rng(seed))
+    return generate_BFSK_Signal_vectorized(bitstream, f1, f2, fs, fc, T_symbol), bitstream
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""HisarMod dataset access.
+
+The HisarMod training file is a single multi-GB CSV with one signal per line. The functions below
+build a byte-offset index of the line starts in one streaming pass and then use it to pull any set of
+(start, end) row ranges with direct seeks, instead of rescanning the file for every range.
+"""
+
+import io
+import os
+
+import numpy as np
+
+from .tracing import stage
+
+# Size of the blocks read while scanning the file for line breaks
+_INDEX_BLOCK_SIZE = 64 * 1024 * 1024
+
+# The MATLAB imaginary unit i becomes Python's j, and spaces and carriage returns are dropped before parsing
+_IQ_TABLE = bytes.maketrans(b'i', b'j')
+_IQ_DROP = b' \t\r'
+
+# Rows of the training file holding the FSK signals of the adaptive modulation system, 1 based and
+# inclusive: for every scheme, one range of 1000 signals at each SNR.
+FSK_RANGES = {
+    '8FSK': [
+        (266001, 267000), (292001, 293000), (318001, 319000), (344001, 345000), (370001, 371000),
+        (396001, 397000), (422001, 423000), (448001, 449000), (474001, 475000), (500001, 501000),
+    ],
+    '4FSK': [
+        (265001, 266000), (291001, 292000), (317001, 318000), (343001, 344000), (369001, 370000),
+        (395001, 396000), (421001, 422000), (447001, 448000), (473001, 474000), (499001, 500000),
+    ],
+    '2FSK': [
+        (264001, 265000), (290001, 291000), (316001, 317000), (342001, 343000), (368001, 369000),
+        (394001, 395000), (420001, 421000), (446001, 447000), (472001, 473000), (498001, 499000),
+    ],
+}
+
+def _index_cache_path(data_file):
+    return data_file + '.lineidx.npz'
+
+def build_line_index(data_file, cache=True):
+    """
+    Build (or load) the byte-offset index of every line in a CSV file.
+
+    The index is stored next to the data file and is reused as long as the size and modification time
+    of the data file have not changed.
+
+    :param data_file: Path to the CSV file.
+    :param cache: Whether to read and write the on-disk index.
+    :return: int64 array of length num_lines + 1. Entry i is the byte offset of line i (0 based) and the
+             last entry is the offset one past the final line.
+    """
+    stat = os.stat(data_file)
+    cache_path = _index_cache_path(data_file)
+    if cache and os.path.exists(cache_path):
+        with np.load(cache_path) as stored:
+            if int(stored['size']) == stat.st_size and int(stored['mtime_ns']) == stat.st_mtime_ns:
+                return stored['offsets']
+
+    # Stream the file once, collecting the position following every newline
+    line_ends = []
+    position = 0
+    with stage('build_line_index', bytes=stat.st_size), open(data_file, 'rb') as f:
+        while True:
+            block = f.read(_INDEX_BLOCK_SIZE)
+            if not block:
+                break
+            newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+            line_ends.append(newlines.astype(np.int64) + position + 1)
+            position += len(block)
+
+    offsets = np.concatenate([np.zeros(1, dtype=np.int64)] + line_ends)
+    # A final line without a trailing newline still counts as a line
+    if offsets[-1] != stat.st_size:
+        offsets = np.append(offsets, np.int64(stat.st_size))
+
+    if cache:
+        np.savez(cache_path, offsets=offsets, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    return offsets
+
+def read_ranges(data_file, ranges, index=None):
+    """
+    Read the raw text of several row ranges for several labels in a single sweep over the file.
+
+    Ranges use the same convention as the ranges dictionary in the AMR notebook, 1 based and inclusive,
+    so (264001, 265000) refers to the 1000 lines starting with line 264001. The ranges are visited in
+    file order so the sweep only ever seeks forward.
+
+    :param data_file: Path to the CSV file.
+    :param ranges: Dictionary mapping each label to a list of (start, end) tuples.
+    :param index: Line index from build_line_index. Built (or loaded) if not given.
+    :return: Tuple (blocks, labels), the raw bytes and label of each range in the order given by ranges.
+    """
+    if index is None:
+        index = build_line_index(data_file)
+    num_lines = len(index) - 1
+
+    requests = [(start, end, label) for label, chunks in ranges.items() for start, end in chunks]
+    for start, end, label in requests:
+        if start < 1 or end < start or end > num_lines:
+            raise ValueError(f"Range ({start}, {end}) for {label} is outside of the {num_lines} lines in {data_file}")
+
+    blocks = [None] * len(requests)
+    order = sorted(range(len(requests)), key=lambda i: requests[i][0])
+    rows = sum(end - start + 1 for start, end, _ in requests)
+    with stage('read_ranges', rows=rows, ranges=len(requests)), open(data_file, 'rb') as f:
+        for i in order:
+            start, end, _ = requests[i]
+            f.seek(index[start - 1])
+            blocks[i] = f.read(int(index[end] - index[start - 1]))
+
+    return blocks, [label for _, _, label in requests]
+
+def load_ranges(data_file, ranges, index=None, label_column='Label'):
+    """
+    Load several row ranges for several labels into one DataFrame.
+
+    :param data_file: Path to the CSV file.
+    :param ranges: Dictionary mapping each label to a list of (start, end) tuples.
+    :param index: Line index from build_line_index. Built (or loaded) if not given.
+    :param label_column: Name of the label column appended after the data columns.
+    :return: DataFrame with the data columns of every range, in order, followed by the label column.
+    """
+    import pandas as pd
+
+    blocks, block_labels = read_ranges(data_file, ranges, index)
+
+    # Make sure every block ends on a line break before joining them into one buffer
+    text = b''.join(block if block.endswith(b'\n') else block + b'\n' for block in blocks)
+    with stage('read_csv') as read_stage:
+        data = pd.read_csv(io.BytesIO(text), header=None)
+        read_stage.set(rows=len(data))
+
+    counts = [block.count(b'\n') + (not block.endswith(b'\n')) for block in blocks]
+    data[label_column] = np.repeat(np.array(block_labels, dtype=object), counts)
+    return data
+
+def convert_to_complex(s):
+    """
+    Convert a single MATLAB style complex string (a+bi) to a Python complex number.
+
+    :param s: String to convert.
+    :return: Complex value, or 0j if the string cannot be parsed (parse_iq_rows reports such rows).
+    """
+    try:
+        return complex(s.replace('i', 'j'))
+    except ValueError:
+        return 0j
+
+def parse_iq_rows(lines, num_samples=None):
+    """
+    Parse lines of MATLAB style complex values (a+bi, or a pure real a or pure imaginary bi) into a
+    float32 I/Q tensor, with the same values as convert_to_complex.
+
+    Each line is parsed with a single NumPy conversion of its values to complex. Rows that do not contain
+    num_samples values or that contain a value that cannot be parsed are zero filled and reported
+    together in the returned list, rather than one at a time while parsing.
+
+    :param lines: Sequence of lines (bytes), one signal per line.
+    :param num_samples: Number of complex samples per line. Taken from the first line if not given.
+    :return: Tuple (iq, bad_rows) where iq has shape (N, num_samples, 2) with I in [..., 0] and Q in
+             [..., 1], and bad_rows is a sorted list of the indices of rows that could not be parsed.
+    """
+    lines = [line.rstrip(b'\r\n') for line in lines]
+    if num_samples is None:
+        num_samples = lines[0].count(b',') + 1 if lines else 0
+
+    iq = np.zeros((len(lines), num_samples, 2), dtype=np.float32)
+    # The interleaved I and Q values of a row are the real and imaginary parts of complex64 values
+    samples = iq.view(np.complex64)[..., 0]
+    bad_rows = []
+
+    for row, line in enumerate(lines):
+        try:
+            values = np.array(line.translate(_IQ_TABLE, _IQ_DROP).split(b','), dtype=np.complex128)
+        except ValueError:
+            bad_rows.append(row)
+            continue
+        if values.size != num_samples:
+            bad_rows.append(row)
+            continue
+        samples[row] = values
+
+    return iq, bad_rows
+
+def load_ranges_iq(data_file, ranges, index=None):
+    """
+    Load several row ranges for several labels straight into a float32 I/Q tensor.
+
+    :param data_file: Path to the CSV file.
+    :param ranges: Dictionary mapping each label to a list of (start, end) tuples.
+    :param index: Line index from build_line_index. Built (or loaded) if not given.
+    :return: Tuple (iq, labels, bad_rows). iq has shape (N, L, 2), labels is an array of N labels and
+             bad_rows lists the rows that could not be parsed (see parse_iq_rows).
+    """
+    blocks, block_labels = read_ranges(data_file, ranges, index)
+
+    lines = []
+    counts = []
+    for block in blocks:
+        block_lines = block.splitlines()
+        lines.extend(block_lines)
+        counts.append(len(block_lines))
+
+    with stage('parse_iq_rows', rows=len(lines)):
+        iq, bad_rows = parse_iq_rows(lines)
+    labels = np.repeat(np.array(block_labels, dtype=object), counts)
+    return iq, labels, bad_rows
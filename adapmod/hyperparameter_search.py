@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""Budgeted hyperparameter search with successive halving.
+
+The architecture and training hyperparameters of create_model and create_multi_output_model are sampled
+from a search space, and the sampled configurations are trained in rungs of increasing epochs. After
+every rung only the best 1 / eta of the configurations go on to the next one, so most of the budget goes
+to the promising configurations and the weak ones are stopped after a few epochs. A trial resumes from
+the weights and optimizer state it ended the previous rung with.
+
+The dataset is written once, shuffled and split into training and validation rows, to a memory-mapped
+dataset cache (see dataset_cache.py). The trials of a rung are trained concurrently in a process pool,
+each worker capped to its share of the CPU threads as in cross_validation.py, and every worker maps the
+same cache instead of receiving a copy of the data.
+
+Every trial is also exported for the NumPy runtime (numpy_runtime.py), and its latency, the time to
+classify one packet, is measured in the parent process after the first rung while no worker is running.
+With promote='pareto' the configurations are promoted by their rank in the accuracy/latency Pareto
+front, so fast configurations that are slightly less accurate survive alongside the most accurate ones.
+
+    build_model = functools.partial(create_model, num_classes=3)
+    search = successive_halving(scaled_features, integer_labels, build_model, AMR_SEARCH_SPACE,
+                                num_configs=27, max_epochs=9, work_dir=search_dir)
+    print(format_search_report(search))
+    model_options, training_options = select_configuration(search)
+    build_model = functools.partial(create_model, num_classes=3, **model_options)
+"""
+
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .cross_validation import _configure_tensorflow_threads, _worker_thread_limits
+from .dataset_cache import commit_cache, create_cache, open_cache
+from .numpy_runtime import NumpyModel
+from .tracing import stage
+
+# Choices of every keyword of create_model. batch_size is a training option rather than a model one.
+AMR_SEARCH_SPACE = {
+    'filters': [(32, 16, 8), (64, 32, 16), (128, 64, 32), (64, 64, 32, 16)],
+    'kernel_size': [3, 5, 7],
+    'dropout': [0.1, 0.2, 0.3],
+    'dense_units': [32, 64, 128],
+    'learning_rate': [3e-4, 1e-3, 3e-3],
+    'batch_size': [32, 64, 128],
+}
+
+# Choices of every keyword of create_multi_output_model
+CHANNEL_SEARCH_SPACE = {
+    'filters': [(128, 64, 64, 32, 16, 8), (64, 32, 32, 16, 8, 8), (32, 32, 16, 16, 8), (64, 64, 32, 16)],
+    'kernel_size': [3, 5, 7],
+    'dropout': [0.1, 0.2, 0.3],
+    'head_dropout': [0.2, 0.3, 0.4],
+    'learning_rate': [3e-4, 1e-3, 3e-3],
+    'batch_size': [32, 64, 128],
+}
+
+# Options taken from a configuration by the training loop instead of being passed to build_model
+TRAINING_OPTIONS = ('batch_size',)
+
+DEFAULT_BATCH_SIZE = 32
+
+def sample_configurations(search_space, num_configs, seed=None):
+    """
+    Draw distinct configurations from a search space.
+
+    :param search_space: Dictionary mapping every hyperparameter to a list of choices.
+    :param num_configs: Number of configurations to draw. Fewer are returned if the space is smaller.
+    :param seed: Seed of the draws.
+    :return: List of dictionaries mapping every hyperparameter to one of its choices.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(search_space)
+    size = int(np.prod([len(search_space[name]) for name in names]))
+    # Draw indices into the grid without replacement, without building the whole grid
+    flat_indices = rng.choice(size, size=min(num_configs, size), replace=False)
+    configurations = []
+    for flat_index in flat_indices:
+        choice = np.unravel_index(flat_index, [len(search_space[name]) for name in names])
+        configurations.append({name: search_space[name][index] for name, index in zip(names, choice)})
+    return configurations
+
+def rung_epochs(min_epochs=1, max_epochs=9, eta=3):
+    """
+    Cumulative epochs trained by the end of every rung: min_epochs * eta**i, capped at max_epochs.
+    """
+    epochs = [min_epochs]
+    while epochs[-1] < max_epochs:
+        epochs.append(min(epochs[-1] * eta, max_epochs))
+    return epochs
+
+def _label_names(labels):
+    return None if not isinstance(labels, dict) else list(labels)
+
+def _write_search_dataset(cache_path, features, labels, val_fraction, max_samples, seed, chunk_size=4096):
+    """
+    Write a shuffled subset of the dataset to a cache, the training rows first and the validation rows after.
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = len(features) if max_samples is None else min(max_samples, len(features))
+    order = np.sort(rng.permutation(len(features))[:num_samples])
+    rng.shuffle(order)
+    num_train = num_samples - int(round(num_samples * val_fraction))
+
+    label_names = _label_names(labels)
+    targets = {'labels': labels} if label_names is None else {f'labels_{name}': labels[name] for name in label_names}
+    targets = {name: np.asarray(target) for name, target in targets.items()}
+    shapes = {'features': ((num_samples,) + features.shape[1:], np.float32)}
+    shapes.update({name: ((num_samples,) + target.shape[1:], target.dtype) for name, target in targets.items()})
+
+    arrays = create_cache(cache_path, shapes, metadata={'num_train': num_train, 'label_names': label_names})
+    for start in range(0, num_samples, chunk_size):
+        # Gather in increasing index order, which reads a memory-mapped source sequentially
+        rows = order[start:start + chunk_size]
+        sorted_rows = np.argsort(rows)
+        for name, source in [('features', features)] + list(targets.items()):
+            chunk = np.asarray(source[rows[sorted_rows]])
+            arrays[name][start + sorted_rows] = chunk
+    commit_cache(cache_path, arrays)
+    return num_train
+
+def _split(cache_path):
+    arrays, metadata = open_cache(cache_path)
+    num_train = metadata['num_train']
+    features = arrays['features']
+    if metadata['label_names'] is None:
+        labels = arrays['labels']
+        return (features[:num_train], labels[:num_train]), (features[num_train:], labels[num_train:])
+    labels = {name: arrays[f'labels_{name}'] for name in metadata['label_names']}
+    return ((features[:num_train], {name: label[:num_train] for name, label in labels.items()}),
+            (features[num_train:], {name: label[num_train:] for name, label in labels.items()}))
+
+def _train_trial(trial, configuration, cache_path, build_model, initial_epoch, epochs, objective, num_threads,
+                 trial_dir):
+    """
+    Train one trial up to the given number of epochs and export it. Runs in a worker process.
+    """
+    from .numpy_runtime import export_model
+
+    _configure_tensorflow_threads(num_threads)
+    (X_train, y_train), validation_data = _split(cache_path)
+
+    model_options = {name: value for name, value in configuration.items() if name not in TRAINING_OPTIONS}
+    batch_size = configuration.get('batch_size', DEFAULT_BATCH_SIZE)
+    model = build_model(X_train.shape[1:], **model_options)
+    os.makedirs(trial_dir, exist_ok=True)
+    weights_path = os.path.join(trial_dir, 'trial.weights.h5')
+    if initial_epoch:
+        # Build the optimizer first, so its state is restored along with the weights where the file holds it
+        model.optimizer.build(model.trainable_variables)
+        model.load_weights(weights_path)
+
+    with stage('trial_fit', rows=len(X_train) * (epochs - initial_epoch), trial=trial, epochs=epochs):
+        history = model.fit(X_train, y_train, initial_epoch=initial_epoch, epochs=epochs, batch_size=batch_size,
+                            validation_data=validation_data, verbose=0)
+
+    model.save_weights(weights_path)
+    runtime_path = export_model(model, os.path.join(trial_dir, 'trial.npmodel'))
+    return {
+        'trial': trial,
+        'score': float(history.history[objective][-1]),
+        'history': {name: [float(value) for value in values] for name, values in history.history.items()},
+        'parameters': int(model.count_params()),
+        'weights_path': weights_path,
+        'runtime_path': runtime_path,
+    }
+
+def measure_latency(runtime_path, input_shape, repeats=20):
+    """
+    Median time of the NumPy runtime to run one packet through an exported model, in milliseconds.
+    """
+    runtime = NumpyModel.load(runtime_path)
+    packet = np.random.default_rng(0).standard_normal((1,) + tuple(input_shape)).astype(np.float32)
+    runtime.predict(packet)  # Warm up
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        runtime.predict(packet)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+def pareto_ranks(scores, latencies, maximize=True):
+    """
+    Rank of every point in the non-dominated sorting of (score, latency): 0 for the Pareto front, 1 for
+    the front of the remaining points, and so on.
+
+    :param scores: Objective values.
+    :param latencies: Latencies, lower is better.
+    :param maximize: Whether a higher score is better.
+    :return: Integer array of ranks.
+    """
+    scores = np.asarray(scores, dtype=np.float64) * (1 if maximize else -1)
+    latencies = np.asarray(latencies, dtype=np.float64)
+    # dominates[i, j]: i is at least as good as j on both and strictly better on one
+    at_least = (scores[:, None] >= scores[None, :]) & (latencies[:, None] <= latencies[None, :])
+    strictly = (scores[:, None] > scores[None, :]) | (latencies[:, None] < latencies[None, :])
+    dominates = at_least & strictly
+
+    ranks = np.full(len(scores), -1)
+    remaining = np.flatnonzero(ranks < 0)
+    rank = 0
+    while len(remaining):
+        front = remaining[~dominates[np.ix_(remaining, remaining)].any(axis=0)]
+        ranks[front] = rank
+        remaining = np.flatnonzero(ranks < 0)
+        rank += 1
+    return ranks
+
+def _promote(trials, keep, promote, maximize):
+    scores = [trial['score'] for trial in trials]
+    order_scores = -np.asarray(scores) if maximize else np.asarray(scores)
+    if promote == 'pareto':
+        ranks = pareto_ranks(scores, [trial['latency_ms'] for trial in trials], maximize)
+        order = np.lexsort((order_scores, ranks))
+    elif promote == 'score':
+        order = np.argsort(order_scores, kind='stable')
+    else:
+        raise ValueError(f"Unknown promotion rule: {promote}")
+    return [trials[index] for index in order[:keep]]
+
+def _run_rung(trials, cache_path, build_model, initial_epoch, epochs, objective, max_workers, work_dir):
+    cpu_count = os.cpu_count() or 1
+    num_workers = max(1, min(len(trials), max_workers or cpu_count))
+    num_threads = max(1, cpu_count // num_workers)
+
+    # TensorFlow is not fork safe, so the workers are started fresh
+    context = multiprocessing.get_context('spawn')
+    with _worker_thread_limits(num_threads), \
+            ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as executor:
+        futures = {executor.submit(_train_trial, trial['trial'], trial['config'], cache_path, build_model,
+                                   initial_epoch, epochs, objective, num_threads,
+                                   os.path.join(work_dir, f"trial_{trial['trial']:03d}")): trial
+                   for trial in trials}
+        for future in as_completed(futures):
+            trial = futures[future]
+            result = future.result()
+            trial.update(score=result['score'], epochs=epochs, parameters=result['parameters'],
+                         weights_path=result['weights_path'], runtime_path=result['runtime_path'])
+            trial['rungs'].append({'epochs': epochs, 'score': result['score']})
+            for name, values in result['history'].items():
+                trial['history'].setdefault(name, []).extend(values)
+            print(f"Trial {trial['trial']} at {epochs} epochs: {objective} {result['score']:.4f}")
+
+def successive_halving(features, labels, build_model, search_space, num_configs=27, min_epochs=1, max_epochs=9,
+                       eta=3, objective='val_accuracy', maximize=True, promote='pareto', val_fraction=0.2,
+                       max_samples=None, max_workers=None, seed=0, work_dir=None):
+    """
+    Search hyperparameters with successive halving.
+
+    :param features: Array of shape (N, ...) holding the (scaled) model inputs. May be memory-mapped.
+    :param labels: Labels of shape (N,) or (N, k), or for a multi-output model a dictionary mapping every
+                   output name to its labels.
+    :param build_model: Picklable function taking the input shape and the model hyperparameters of a
+                        configuration as keywords and returning a compiled Keras model, e.g.
+                        functools.partial(create_model, num_classes=3).
+    :param search_space: Dictionary mapping every hyperparameter to a list of choices, e.g. AMR_SEARCH_SPACE.
+    :param num_configs: Configurations sampled for the first rung.
+    :param min_epochs: Epochs of the first rung.
+    :param max_epochs: Epochs the surviving configurations are trained to.
+    :param eta: 1 / eta of the configurations are promoted after every rung, trained eta times as long.
+    :param objective: Keras history key scored at the end of every rung, e.g. 'val_accuracy' or 'val_loss'.
+    :param maximize: Whether a higher objective is better.
+    :param promote: 'pareto' to promote by Pareto rank of (objective, latency), then objective, or 'score'
+                    to promote by the objective alone.
+    :param val_fraction: Fraction of the samples held out for validation.
+    :param max_samples: Optional number of samples the search is run on, drawn at random.
+    :param max_workers: Trials trained at once. Defaults to the CPU count.
+    :param seed: Seed of the sampled configurations and of the split.
+    :param work_dir: Directory for the shared dataset, the trial weights and the search results. A
+                     temporary directory is created if not given.
+    :return: Dictionary with the 'trials' (configuration, final objective, epochs, latency, parameters,
+             per-rung scores, training history and file paths of each), the 'rungs' epochs, 'objective',
+             'maximize' and 'work_dir'. It is also written to work_dir/search.json.
+    """
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix='hyperparameter_search_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Share the dataset with the workers through a memory-mapped cache, written once
+    cache_path = os.path.join(work_dir, 'dataset')
+    with stage('search_dataset', rows=len(features) if max_samples is None else min(max_samples, len(features))):
+        _write_search_dataset(cache_path, features, labels, val_fraction, max_samples, seed)
+    input_shape = open_cache(cache_path)[0]['features'].shape[1:]
+
+    trials = [{'trial': index, 'config': configuration, 'score': None, 'epochs': 0, 'latency_ms': None,
+               'rungs': [], 'history': {}}
+              for index, configuration in enumerate(sample_configurations(search_space, num_configs, seed))]
+    schedule = rung_epochs(min_epochs, max_epochs, eta)
+
+    survivors = trials
+    initial_epoch = 0
+    for rung, epochs in enumerate(schedule):
+        with stage('search_rung', rows=len(survivors), rung=rung, epochs=epochs):
+            _run_rung(survivors, cache_path, build_model, initial_epoch, epochs, objective, max_workers, work_dir)
+        if rung == 0:
+            # The latency depends only on the architecture, so it is measured once
+            for trial in trials:
+                trial['latency_ms'] = measure_latency(trial['runtime_path'], input_shape)
+        initial_epoch = epochs
+        if rung + 1 < len(schedule):
+            survivors = _promote(survivors, max(1, len(survivors) // eta), promote, maximize)
+
+    results = {'trials': trials, 'rungs': schedule, 'objective': objective, 'maximize': maximize,
+               'work_dir': work_dir}
+    with open(os.path.join(work_dir, 'search.json'), 'w') as f:
+        json.dump(results, f, indent=1)
+    return results
+
+def pareto_front(results, epochs=None):
+    """
+    Trials on the objective/latency Pareto front.
+
+    :param results: Dictionary returned by successive_halving.
+    :param epochs: Only compare trials trained for this many epochs, so their scores are comparable.
+                   Defaults to the epochs of the first rung, which every trial completed.
+    :return: List of trials on the front, sorted by latency.
+    """
+    epochs = results['rungs'][0] if epochs is None else epochs
+    trials = [trial for trial in results['trials'] if any(rung['epochs'] == epochs for rung in trial['rungs'])]
+    scores = [next(rung['score'] for rung in trial['rungs'] if rung['epochs'] == epochs) for trial in trials]
+    ranks = pareto_ranks(scores, [trial['latency_ms'] for trial in trials], results['maximize'])
+    return sorted((trial for trial, rank in zip(trials, ranks) if rank == 0), key=lambda trial: trial['latency_ms'])
+
+def select_configuration(results, max_latency_ms=None):
+    """
+    Configuration of the best scoring trial on the Pareto front of the longest trained trials.
+
+    :param results: Dictionary returned by successive_halving.
+    :param max_latency_ms: Only consider trials classifying a packet within this many milliseconds.
+                           The fastest trial on the front is chosen if none does.
+    :return: Tuple (model_options, training_options) splitting the configuration into the keywords of
+             build_model and the TRAINING_OPTIONS.
+    """
+    front = pareto_front(results, results['rungs'][-1])
+    if max_latency_ms is not None:
+        front = [trial for trial in front if trial['latency_ms'] <= max_latency_ms] or front[:1]
+    sign = 1 if results['maximize'] else -1
+    configuration = max(front, key=lambda trial: sign * trial['score'])['config']
+    model_options = {name: value for name, value in configuration.items() if name not in TRAINING_OPTIONS}
+    training_options = {name: value for name, value in configuration.items() if name in TRAINING_OPTIONS}
+    return model_options, training_options
+
+def format_search_report(results):
+    """
+    Format the trials of a search as a table, the longest trained and best scoring first.
+    """
+    sign = -1 if results['maximize'] else 1
+    trials = sorted(results['trials'], key=lambda trial: (-trial['epochs'], sign * trial['score']))
+    front = {trial['trial'] for trial in pareto_front(results)}
+    lines = [f"{'trial':>5} {'epochs':>6} {results['objective']:>14} {'latency ms':>10} {'params':>9}  config"]
+    for trial in trials:
+        marker = '*' if trial['trial'] in front else ' '
+        lines.append(f"{trial['trial']:>5} {trial['epochs']:>6} {trial['score']:>14.4f} {trial['latency_ms']:>10.3f} "
+                     f"{trial['parameters']:>9}{marker} {trial['config']}")
+    lines.append(f"* on the Pareto front after {results['rungs'][0]} epochs, which every trial was trained for")
+    return '\n'.join(lines)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""AMR inference service.
+
+A long running process that loads the trained AMR model, scaler and label encoder once and classifies
+packets sent to it over a Unix or TCP socket. Requests that arrive close together are coalesced into one
+micro-batch and classified with a single model call, which amortizes the per-call overhead of the model
+across all of them. A request waits at most max_wait_ms for others to join its batch. With a spectral
+cascade (see spectral_cascade.py) only the packets its fast path is not confident about reach the model.
+
+Protocol (every integer is a little-endian uint32):
+    request:  payload length, then the packet as float32 little-endian I/Q pairs (L x 2, I first).
+              A request with an empty payload asks for the service statistics instead.
+    response: payload length, then a UTF-8 JSON object. For a packet this holds the 'label' and its
+              softmax 'confidence', for a statistics request the latency percentiles and batch counters.
+              A packet whose length does not match the model input, or that failed to classify, gets
+              an 'error' message instead.
+
+Start the service with
+    python -m adapmod.inference_service --model AMRProjectModel.keras --scaler AMRProjectScaler.joblib \\
+        --label-encoder AMRProjectLabelEncoder.joblib --socket /tmp/amr.sock \\
+        [--cascade AMRProjectCascade.joblib]
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import socket
+import struct
+import time
+
+import numpy as np
+
+_LENGTH = struct.Struct('<I')
+
+class AMRInferenceService:
+    """
+    Micro-batching AMR classifier.
+
+    :param model: Trained AMR Keras model.
+    :param scaler: Fitted StandardScaler or StreamingScaler applied to the flattened I/Q features before the
+                   model.
+    :param label_encoder: Fitted LabelEncoder mapping class indices to modulation names.
+    :param max_batch_size: Largest number of packets classified in one model call.
+    :param max_wait_ms: Longest time a packet waits for others to join its batch.
+    :param latency_window: Number of most recent requests the latency percentiles are computed over.
+    :param cascade: Optional SpectralCascade deciding confident packets before the model.
+    """
+
+    def __init__(self, model, scaler, label_encoder, max_batch_size=64, max_wait_ms=2.0, latency_window=10000,
+                 cascade=None):
+        self.model = model
+        self.scaler = scaler
+        self.cascade = cascade
+        self.classes = np.asarray(label_encoder.classes_)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # Size of a packet payload, float32 I/Q pairs filling the model input
+        self.packet_bytes = 4 * int(np.prod(model.input_shape[1:]))
+
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.batch_sizes = collections.Counter()
+        self.requests = 0
+
+        self._queue = None
+        self._batcher = None
+
+    @classmethod
+    def from_artifacts(cls, model_path, scaler_path, label_encoder_path, cascade_path=None, **kwargs):
+        """
+        Load the service from the files saved by the AMR training notebook.
+
+        :param model_path: Path of AMRProjectModel.keras.
+        :param scaler_path: Path of AMRProjectScaler.joblib.
+        :param label_encoder_path: Path of AMRProjectLabelEncoder.joblib.
+        :param cascade_path: Optional path of AMRProjectCascade.joblib.
+        :return: AMRInferenceService.
+        """
+        from joblib import load
+        from keras.models import load_model
+        if cascade_path is not None:
+            from .spectral_cascade import SpectralCascade
+            kwargs['cascade'] = SpectralCascade.load(cascade_path)
+        return cls(load_model(model_path), load(scaler_path), load(label_encoder_path), **kwargs)
+
+    def _model_predict(self, packets):
+        features = self.scaler.transform(packets.reshape(len(packets), -1))
+        features = features.reshape((len(packets),) + tuple(self.model.input_shape[1:]))
+        return np.asarray(self.model.predict_on_batch(features))
+
+    def predict(self, packets):
+        """
+        Classify a batch of packets synchronously.
+
+        :param packets: float32 array of shape (B, L, 2).
+        :return: Softmax probabilities of shape (B, num_classes).
+        """
+        if self.cascade is not None:
+            return self.cascade.predict(packets, self._model_predict)
+        return self._model_predict(packets)
+
+    async def classify(self, packet):
+        """
+        Classify one packet, sharing a model call with any other packets waiting at the same time.
+
+        :param packet: Array of shape (L, 2) holding the I/Q samples of the packet.
+        :return: Dictionary with the 'label' and its 'confidence'.
+        """
+        self._ensure_batcher()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((np.asarray(packet, dtype=np.float32), time.perf_counter(), future))
+        return await future
+
+    def _ensure_batcher(self):
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.get_running_loop().create_task(self._run_batches())
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a first request, then give others up to max_wait to join it
+            pending = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                packets = np.stack([packet for packet, _, _ in pending])
+                # Run the model off the event loop so new requests keep being accepted
+                probabilities = await loop.run_in_executor(None, self.predict, packets)
+            except Exception as error:
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            indices = np.argmax(probabilities, axis=1)
+            finished = time.perf_counter()
+            self.batch_sizes[len(pending)] += 1
+            self.requests += len(pending)
+            for (_, received, future), index, row in zip(pending, indices, probabilities):
+                self.latencies.append(finished - received)
+                if not future.done():
+                    future.set_result({'label': str(self.classes[index]), 'confidence': float(row[index])})
+
+    def stats(self):
+        """
+        Latency and batching statistics.
+
+        :return: Dictionary with the request count, the p50 and p99 latency in milliseconds over the most
+                 recent requests, the number of batches and the count of batches of each size.
+        """
+        latencies = np.array(self.latencies) * 1000
+        stats = {
+            'requests': self.requests,
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batches': sum(self.batch_sizes.values()),
+            'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+        }
+        if self.cascade is not None:
+            stats['cascade'] = self.cascade.stats()
+        return stats
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                    payload = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+
+                if length == 0:
+                    response = self.stats()
+                elif length != self.packet_bytes:
+                    # A packet of another length would fail the whole batch it joins
+                    response = {'error': f"Expected a packet of {self.packet_bytes} bytes, got {length}"}
+                else:
+                    packet = np.frombuffer(payload, dtype='<f4').reshape(-1, 2)
+                    try:
+                        response = await self.classify(packet)
+                    except Exception as error:
+                        response = {'error': f"{type(error).__name__}: {error}"}
+
+                body = json.dumps(response).encode('utf-8')
+                writer.write(_LENGTH.pack(len(body)) + body)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host='127.0.0.1', port=None):
+        """
+        Serve requests on a Unix socket (path) or a TCP socket (host, port) until cancelled.
+        """
+        self._ensure_batcher()
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle_connection, path=path)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host=host, port=port)
+        async with server:
+            await server.serve_forever()
+
+class InferenceClient:
+    """
+    Blocking client for AMRInferenceService.
+
+    :param path: Unix socket path of the service.
+    :param host: Host of the service when using TCP.
+    :param port: Port of the service when using TCP.
+    """
+
+    def __init__(self, path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _request(self, payload):
+        self.socket.sendall(_LENGTH.pack(len(payload)) + payload)
+        (length,) = _LENGTH.unpack(self._receive(_LENGTH.size))
+        response = json.loads(self._receive(length))
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+    def _receive(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Inference service closed the connection")
+            data += chunk
+        return data
+
+    def classify(self, packet):
+        """
+        Classify one packet of shape (L, 2).
+
+        :return: Dictionary with the 'label' and its 'confidence'.
+        """
+        return self._request(np.ascontiguousarray(packet, dtype='<f4').tobytes())
+
+    def stats(self):
+        """
+        Fetch the service statistics.
+        """
+        return self._request(b'')
+
+    def close(self):
+        self.socket.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the AMR model with dynamic micro-batching")
+    parser.add_argument('--model', required=True, help="Path of AMRProjectModel.keras")
+    parser.add_argument('--scaler', required=True, help="Path of AMRProjectScaler.joblib")
+    parser.add_argument('--label-encoder', required=True, help="Path of AMRProjectLabelEncoder.joblib")
+    parser.add_argument('--cascade', help="Path of AMRProjectCascade.joblib, to enable the spectral fast path")
+    parser.add_argument('--socket', help="Unix socket path to listen on")
+    parser.add_argument('--host', default='127.0.0.1', help="TCP host to listen on")
+    parser.add_argument('--port', type=int, help="TCP port to listen on")
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+    if args.socket is None and args.port is None:
+        parser.error("either --socket or --port is required")
+
+    service = AMRInferenceService.from_artifacts(args.model, args.scaler, args.label_encoder, args.cascade,
+                                                 max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    asyncio.run(service.serve(path=args.socket, host=args.host, port=args.port))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Closed-loop adaptive modulation link simulation.
+
+Runs the order of operations of the proposed architecture for many independent links at once:
+
+1. The transmitter sends a data packet with the currently selected modulation scheme.
+2. The receiver classifies the modulation scheme of the received packet with the AMR model.
+3. The receiver demodulates the packet with the detected scheme.
+4. The receiver sends the pilot signal back to the transmitter.
+5. The transmitter assesses the channel from the received pilot with the channel assessment model.
+6. The transmitter selects the next modulation scheme from the channel assessment.
+7. The process is repeated from step 1.
+
+Every step works on a batch of links with the batched functions of fsk_modulation.py and
+channel_simulation.py, and both models are called once per batch. Each link has its own multipath and
+SNR, which stay fixed for a random number of rounds (coherence_rounds on average) and are then redrawn,
+so the schemes have to follow a changing channel. Either model can be left out, in which case the
+receiver or transmitter is given the true scheme or channel (a genie), to separate the errors of the
+models from the errors of the link itself (without the channel model no pilot is sent).
+
+    amr_model = NumpyModel.load('AMRProjectModel.npmodel')
+    channel_model = NumpyModel.load('ChannelAssessmentModel.npmodel')
+    simulator = LinkSimulator(bfsk_signal, fs, num_links=4096, amr_predict=amr_model.predict,
+                              channel_predict=channel_model.predict, seed=0)
+    print(format_link_report(simulator.run(num_rounds=50)))
+"""
+
+import time
+
+import numpy as np
+
+from .channel_simulation import apply_awgn_snr_batch, apply_multipath_batch, generate_random_mp_conditions_batch
+from .fsk_modulation import (FSK_ORDERS, demodulate_fsk, fsk_tones, generate_random_bits_batch, modulate_fsk_bits,
+                             symbols_to_bits)
+
+# Modulation schemes in scheme index order, from the most robust to the fastest
+SCHEMES = tuple(FSK_ORDERS)
+
+# Stages timed by LinkSimulator.run, in loop order
+STAGES = ('channel_update', 'transmit', 'channel', 'amr', 'demodulate', 'pilot', 'assessment', 'selection')
+
+def snr_threshold_policy(snr_db, delays, attenuations, current=None, thresholds=(12.0, 20.0)):
+    """
+    Select the scheme from the estimated SNR alone: BFSK below the first threshold, 4FSK up to the second
+    and 8FSK above it.
+
+    :param snr_db: Estimated SNR in dB, shape (N,).
+    :param delays: Estimated multipath delays, shape (N, P) (unused).
+    :param attenuations: Estimated multipath attenuations, shape (N, P) (unused).
+    :param current: Current scheme indices of the links, shape (N,) (unused).
+    :param thresholds: SNR thresholds in dB between consecutive schemes.
+    :return: Scheme indices into SCHEMES, shape (N,).
+    """
+    return np.digitize(np.ravel(snr_db), thresholds)
+
+def fixed_policy(snr_db, delays, attenuations, current=None, scheme=0):
+    """
+    Always select the same scheme, as a fixed modulation baseline.
+
+    :param scheme: Scheme index into SCHEMES.
+    """
+    return np.full(len(snr_db), scheme)
+
+def amr_predictor(model, scaler=None):
+    """
+    Wrap a Keras AMR model and its scaler into an amr_predict function for LinkSimulator.
+
+    A NumpyModel exported with the scaler folded in can be passed as NumpyModel.predict directly.
+
+    :param model: Trained AMR Keras model.
+    :param scaler: Fitted StandardScaler or StreamingScaler applied to the flattened I/Q features before the
+                   model.
+    :return: Function mapping packets of shape (B, L, 2) to class probabilities.
+    """
+    def predict(packets):
+        features = packets.reshape(len(packets), -1)
+        if scaler is not None:
+            features = scaler.transform(features)
+        features = features.reshape((len(packets),) + tuple(model.input_shape[1:]))
+        return np.asarray(model.predict_on_batch(features))
+    return predict
+
+def _percentiles(values):
+    if not values:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None}
+    values = np.asarray(values, dtype=np.float64)
+    return {'count': int(len(values)), 'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95))}
+
+class LinkSimulator:
+    """
+    Batched simulation of independent adaptive modulation links.
+
+    :param pilot: Pilot signal of shape (Lp,) sent back by every receiver, e.g. the BFSK pilot of the
+                  channel assessment notebook.
+    :param sampling_freq: Sampling frequency of the packets and the pilot.
+    :param num_links: Number of links simulated at once.
+    :param amr_predict: Function mapping received packets of shape (B, L, 2) (float32 I/Q) to class
+                        probabilities of shape (B, num_classes). None gives the receiver the true scheme.
+    :param amr_classes: Scheme names of the amr_predict outputs, in output order (label_encoder.classes_).
+    :param channel_predict: Function mapping received pilot features of shape (B, 2Lp, 1) (real parts then
+                            imaginary parts) to the [snr, delays, attenuations] outputs of the channel
+                            assessment model. None gives the transmitter the true channel.
+    :param policy: Function (snr_db, delays, attenuations, current) -> scheme indices into SCHEMES, where
+                   current holds the links' current schemes (None when the ideal scheme is computed), e.g.
+                   snr_threshold_policy or a SelectionTable.
+    :param packet_length: Samples per data packet, the input length of the AMR model.
+    :param samples_per_symbol: Samples per data symbol.
+    :param tone_spacing: Spacing of the FSK tones in Hz. Defaults to the orthogonal spacing
+                         sampling_freq / samples_per_symbol.
+    :param snr_range: (low, high) range the SNR of every channel in dB is drawn uniformly from.
+    :param num_paths: Number of multipath paths per channel.
+    :param coherence_rounds: Mean number of rounds a channel stays the same before being redrawn.
+    :param fractional: Apply the multipath delays with sub-sample precision.
+    :param chunk_size: Number of links processed (and passed to the models) at once, which bounds memory.
+    :param seed: Seed of the simulation.
+    """
+
+    def __init__(self, pilot, sampling_freq, num_links=1024, amr_predict=None, amr_classes=SCHEMES,
+                 channel_predict=None, policy=snr_threshold_policy, packet_length=1024, samples_per_symbol=16,
+                 tone_spacing=None, snr_range=(0, 30), num_paths=5, coherence_rounds=20, fractional=True,
+                 chunk_size=512, seed=None):
+        if packet_length % samples_per_symbol:
+            raise ValueError("packet_length must be a multiple of samples_per_symbol")
+        self.pilot = np.asarray(pilot, dtype=np.complex64)
+        self.sampling_freq = sampling_freq
+        self.num_links = num_links
+        self.amr_predict = amr_predict
+        self.channel_predict = channel_predict
+        self.policy = policy
+        self.packet_length = packet_length
+        self.samples_per_symbol = samples_per_symbol
+        self.tone_spacing = sampling_freq / samples_per_symbol if tone_spacing is None else tone_spacing
+        self.snr_range = snr_range
+        self.num_paths = num_paths
+        self.coherence_rounds = coherence_rounds
+        self.fractional = fractional
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+
+        # Map the AMR model outputs onto scheme indices
+        self.amr_schemes = np.array([SCHEMES.index(str(name)) for name in amr_classes])
+        self.symbol_time = samples_per_symbol / sampling_freq
+        self.num_symbols = packet_length // samples_per_symbol
+        self.round_time = (packet_length + len(self.pilot)) / sampling_freq
+
+        # Every link starts on the most robust scheme with a fresh channel
+        self.scheme = np.zeros(num_links, dtype=np.int64)
+        self.delays = np.empty((num_links, num_paths))
+        self.attenuations = np.empty((num_links, num_paths))
+        self.snr_db = np.empty(num_links)
+        self._redraw_channels(np.arange(num_links))
+
+    def _redraw_channels(self, links):
+        self.delays[links], self.attenuations[links] = generate_random_mp_conditions_batch(
+            len(links), self.num_paths, self.rng)
+        self.snr_db[links] = self.rng.uniform(self.snr_range[0], self.snr_range[1], len(links))
+
+    def _through_channel(self, signals, links):
+        received = apply_multipath_batch(signals, self.delays[links], self.attenuations[links], self.sampling_freq,
+                                         self.fractional)
+        return apply_awgn_snr_batch(received, self.snr_db[links], self.rng).astype(np.complex64)
+
+    def _step(self, links, timings):
+        """
+        Run one round of the loop for a chunk of links and select their next schemes.
+
+        :return: Tuple (bits, bit_errors, delivered_bits, amr_correct) summed over the chunk.
+        """
+        count = len(links)
+        scheme = self.scheme[links]
+
+        # 1. Modulate a packet of random bits with every link's scheme
+        started = time.perf_counter()
+        packets = np.empty((count, self.packet_length), dtype=np.complex64)
+        sent_bits = {}
+        for index, name in enumerate(SCHEMES):
+            rows = np.flatnonzero(scheme == index)
+            if len(rows):
+                order = FSK_ORDERS[name]
+                bits = generate_random_bits_batch(len(rows), self.num_symbols * int(np.log2(order)), self.rng)
+                packets[rows] = modulate_fsk_bits(bits, order, self.sampling_freq, self.symbol_time,
+                                                  tone_spacing=self.tone_spacing)
+                sent_bits[index] = (rows, bits)
+        timings['transmit'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        received = self._through_channel(packets, links)
+        timings['channel'] += time.perf_counter() - started
+
+        # 2. Recognize the modulation scheme of every packet
+        started = time.perf_counter()
+        if self.amr_predict is None:
+            detected = scheme
+        else:
+            iq = np.stack([received.real, received.imag], axis=2)
+            detected = self.amr_schemes[np.argmax(self.amr_predict(iq), axis=1)]
+        timings['amr'] += time.perf_counter() - started
+
+        # 3. Demodulate with the detected scheme. A misdetected packet is lost with all of its bits
+        started = time.perf_counter()
+        num_bits = bit_errors = delivered_bits = 0
+        for index, (rows, bits) in sent_bits.items():
+            num_bits += bits.size
+            correct = detected[rows] == index
+            errors = np.full(len(rows), bits.shape[1])
+            if correct.any():
+                order = FSK_ORDERS[SCHEMES[index]]
+                symbols = demodulate_fsk(received[rows[correct]], fsk_tones(order, self.tone_spacing),
+                                         self.sampling_freq, self.symbol_time)
+                errors[correct] = np.count_nonzero(symbols_to_bits(symbols, order) != bits[correct], axis=1)
+            bit_errors += int(errors.sum())
+            delivered_bits += int(bits.shape[1] * np.count_nonzero(errors == 0))
+        timings['demodulate'] += time.perf_counter() - started
+
+        if self.channel_predict is None:
+            snr_db, delays, attenuations = self.snr_db[links], self.delays[links], self.attenuations[links]
+        else:
+            # 4. Send the pilot back through the same channel
+            started = time.perf_counter()
+            received_pilot = self._through_channel(self.pilot, links)
+            features = np.concatenate([received_pilot.real, received_pilot.imag], axis=1)[:, :, None]
+            timings['pilot'] += time.perf_counter() - started
+
+            # 5. Assess the channel from the pilot
+            started = time.perf_counter()
+            snr_db, delays, attenuations = self.channel_predict(features)
+            timings['assessment'] += time.perf_counter() - started
+
+        # 6. Select the next schemes
+        started = time.perf_counter()
+        self.scheme[links] = self.policy(np.ravel(snr_db), np.asarray(delays), np.asarray(attenuations),
+                                         current=scheme)
+        timings['selection'] += time.perf_counter() - started
+
+        return num_bits, bit_errors, delivered_bits, int(np.count_nonzero(detected == scheme))
+
+    def run(self, num_rounds=20):
+        """
+        Run the loop for a number of rounds on every link.
+
+        The scheme-switch latency is measured against the scheme the policy selects from the true
+        channel: whenever a link's scheme differs from it, the rounds until the link uses that scheme
+        again are counted.
+
+        :param num_rounds: Number of packets sent on every link.
+        :return: Report dictionary, see format_link_report.
+        """
+        timings = dict.fromkeys(STAGES, 0.0)
+        totals = np.zeros(4, dtype=np.int64)
+        scheme_rounds = np.zeros(len(SCHEMES), dtype=np.int64)
+        mismatch_since = np.full(self.num_links, -1)
+        latencies = []
+        switches = matched = 0
+
+        started_run = time.perf_counter()
+        for round_index in range(num_rounds):
+            # Redraw the channels whose coherence time ran out
+            started = time.perf_counter()
+            if round_index:
+                expired = np.flatnonzero(self.rng.random(self.num_links) < 1 / self.coherence_rounds)
+                if len(expired):
+                    self._redraw_channels(expired)
+            ideal = self.policy(self.snr_db, self.delays, self.attenuations)
+            timings['channel_update'] += time.perf_counter() - started
+
+            # Track how long every link takes to follow a change of its ideal scheme
+            mismatch = self.scheme != ideal
+            matched += int(np.count_nonzero(~mismatch))
+            mismatch_since[mismatch & (mismatch_since < 0)] = round_index
+            caught_up = ~mismatch & (mismatch_since >= 0)
+            latencies.extend((round_index - mismatch_since[caught_up]).tolist())
+            mismatch_since[caught_up] = -1
+
+            scheme_rounds += np.bincount(self.scheme, minlength=len(SCHEMES))
+            previous = self.scheme.copy()
+            for start in range(0, self.num_links, self.chunk_size):
+                links = np.arange(start, min(start + self.chunk_size, self.num_links))
+                totals += self._step(links, timings)
+            switches += int(np.count_nonzero(self.scheme != previous))
+        elapsed = time.perf_counter() - started_run
+
+        num_bits, bit_errors, delivered_bits, amr_correct = totals.tolist()
+        packets = self.num_links * num_rounds
+        latency_rounds = _percentiles(latencies)
+        return {
+            'links': self.num_links,
+            'rounds': num_rounds,
+            'packets': packets,
+            'amr_accuracy': amr_correct / packets,
+            'bit_error_rate': bit_errors / num_bits,
+            'goodput_bps': delivered_bits / (packets * self.round_time),
+            'scheme_usage': {name: float(rounds / packets) for name, rounds in zip(SCHEMES, scheme_rounds)},
+            'ideal_scheme_fraction': matched / packets,
+            'scheme_switches': switches,
+            'switch_latency_rounds': latency_rounds,
+            'switch_latency_seconds': (None if latency_rounds['mean'] is None
+                                       else latency_rounds['mean'] * self.round_time),
+            'unresolved_switches': int(np.count_nonzero(mismatch_since >= 0)),
+            'packets_per_second': packets / elapsed,
+            'stage_seconds': timings,
+        }
+
+def format_link_report(report):
+    """
+    Format a report from LinkSimulator.run as text.
+
+    Goodput is the mean rate per link of the bits in packets delivered without errors, over the time of a
+    round (packet plus pilot). Packets per second is the wall-clock simulation throughput.
+    """
+    latency = report['switch_latency_rounds']
+    usage = ', '.join(f"{name} {fraction:.1%}" for name, fraction in report['scheme_usage'].items())
+    stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in report['stage_seconds'].items())
+    lines = [
+        f"{report['links']} links x {report['rounds']} rounds = {report['packets']} packets",
+        f"Goodput: {report['goodput_bps']:.1f} bit/s per link, BER {report['bit_error_rate']:.2e}, "
+        f"AMR accuracy {report['amr_accuracy']:.4f}",
+        f"Schemes: {usage}, on the ideal scheme {report['ideal_scheme_fraction']:.1%} of the time",
+    ]
+    if latency['count']:
+        lines.append(f"Scheme switch latency: mean {latency['mean']:.2f} rounds "
+                     f"({report['switch_latency_seconds'] * 1000:.0f} ms), p50 {latency['p50']:.0f}, "
+                     f"p95 {latency['p95']:.0f} over {latency['count']} switches")
+    lines.append(f"Throughput: {report['packets_per_second']:.0f} packets/s ({stages})")
+    return '\n'.join(lines)
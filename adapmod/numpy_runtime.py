@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""Keras-free inference runtime.
+
+The AMR and channel assessment CNNs are small, but running them through Keras means importing TensorFlow
+in every inference process. export_model writes the weights of a trained model and a description of its
+layers to a single flat float32 parameter file (stored in the dataset cache format, see
+dataset_cache.py). NumpyModel loads that file with np.memmap and runs the forward pass in pure NumPy.
+
+During export, dropout layers are dropped and a fitted StandardScaler can be folded into the first
+Conv1D, so the runtime takes the raw (unscaled) features directly. A scaler with one statistic per
+input channel (as the StreamingScaler of the AMR notebook) is folded exactly into the kernel and bias. A
+scaler with one statistic per time step becomes a per-sample input scale and a per-position bias of that
+first layer.
+
+    export_model(model, 'AMRProjectModel.npmodel', scaler=scaler)
+    runtime = NumpyModel.load('AMRProjectModel.npmodel')
+    probabilities = runtime.predict(features)
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .dataset_cache import open_cache, write_cache
+
+RUNTIME_FORMAT = 'numpy-runtime-1'
+
+# Name the runtime gives to the model input
+INPUT = 'input'
+
+def _source_names(layer):
+    """
+    Names of the layers producing the inputs of a Keras layer.
+    """
+    inputs = layer.input if isinstance(layer.input, (list, tuple)) else [layer.input]
+    return [tensor._keras_history[0].name for tensor in inputs]
+
+def _conv1d(x, kernel):
+    # im2col: every output position becomes one row of kernel_size * channels input values
+    kernel_size, channels, filters = kernel.shape
+    windows = sliding_window_view(x, kernel_size, axis=1)  # (B, T', C, K)
+    columns = windows.transpose(0, 1, 3, 2).reshape(x.shape[0], -1, kernel_size * channels)
+    return columns @ kernel.reshape(kernel_size * channels, filters)
+
+def _activation(x, activation):
+    if activation == 'relu':
+        return np.maximum(x, 0, out=x)
+    if activation == 'softmax':
+        x = np.exp(x - x.max(axis=-1, keepdims=True))
+        return x / x.sum(axis=-1, keepdims=True)
+    if activation == 'linear':
+        return x
+    raise ValueError(f"Unsupported activation: {activation}")
+
+def _fold_scaler(op, tensors, scaler, input_shape):
+    """
+    Fold a fitted StandardScaler into the first Conv1D layer.
+    """
+    kernel = tensors[op['kernel']]
+    bias = tensors.pop(op['bias'])
+    kernel_size, channels, filters = kernel.shape
+
+    mean = np.zeros(int(np.prod(input_shape))) if scaler.mean_ is None else np.asarray(scaler.mean_, dtype=np.float64)
+    scale = np.ones_like(mean) if scaler.scale_ is None else np.asarray(scaler.scale_, dtype=np.float64)
+
+    if mean.size == channels:
+        # Per channel statistics fold exactly into the kernel and bias
+        tensors[op['kernel']] = (kernel / scale[None, :, None]).astype(np.float32)
+        tensors[op['bias']] = (bias - np.einsum('kcf,c->f', kernel, mean / scale)).astype(np.float32)
+        return
+
+    # Per position statistics: the input is multiplied by 1 / scale and the mean becomes a per-position bias
+    inverse_scale = (1 / scale).reshape(input_shape)
+    shifted_mean = (mean / scale).reshape((1,) + tuple(input_shape))
+    position_bias = bias[None, :] - _conv1d(shifted_mean, kernel.astype(np.float64))[0]
+
+    op['input_scale'] = op['kernel'] + '_input_scale'
+    op['position_bias'] = op['kernel'] + '_position_bias'
+    del op['bias']
+    tensors[op['input_scale']] = inverse_scale.astype(np.float32)
+    tensors[op['position_bias']] = position_bias.astype(np.float32)
+
+def export_model(model, path, scaler=None, metadata=None):
+    """
+    Export a trained Keras model (create_model or create_multi_output_model) for NumpyModel.
+
+    :param model: Trained Keras model built from Conv1D, MaxPooling1D, Cropping1D, Dropout, Flatten, Dense
+                  and Concatenate layers.
+    :param path: Directory to write the parameter file to.
+    :param scaler: Optional fitted StandardScaler or StreamingScaler applied to the flattened input, folded
+                   into the first Conv1D layer.
+    :param metadata: Optional JSON serializable dictionary stored with the model (e.g. the class names),
+                     available as NumpyModel.metadata.
+    :return: path.
+    """
+    input_shape = tuple(int(size) for size in model.input_shape[1:])
+    layer_names = {layer.name for layer in model.layers if layer.__class__.__name__ != 'InputLayer'}
+    aliases = {}
+    ops = []
+    tensors = {}
+
+    def resolve(name):
+        name = aliases.get(name, name)
+        return name if name in layer_names else INPUT
+
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        if kind == 'InputLayer':
+            continue
+        inputs = [resolve(name) for name in _source_names(layer)]
+        config = layer.get_config()
+
+        if kind == 'Dropout':
+            # Dropout is the identity at inference time
+            aliases[layer.name] = inputs[0]
+            continue
+
+        op = {'type': kind, 'name': layer.name, 'inputs': inputs}
+        if kind in ('Conv1D', 'Dense'):
+            kernel, bias = layer.get_weights()
+            if kind == 'Conv1D' and (tuple(config['strides']) != (1,) or config['padding'] != 'valid'
+                                     or tuple(config['dilation_rate']) != (1,)):
+                raise ValueError(f"{layer.name}: only stride 1, undilated, valid Conv1D layers are supported")
+            op['kernel'], op['bias'] = layer.name + '_kernel', layer.name + '_bias'
+            op['activation'] = config['activation']
+            tensors[op['kernel']] = kernel.astype(np.float32)
+            tensors[op['bias']] = bias.astype(np.float32)
+        elif kind == 'MaxPooling1D':
+            strides = config['strides'] or config['pool_size']
+            op['pool_size'] = int(np.ravel(config['pool_size'])[0])
+            op['strides'] = int(np.ravel(strides)[0])
+            if config['padding'] != 'valid':
+                raise ValueError(f"{layer.name}: only valid MaxPooling1D layers are supported")
+        elif kind == 'Cropping1D':
+            op['cropping'] = [int(size) for size in np.ravel(config['cropping'])]
+        elif kind == 'Concatenate':
+            op['axis'] = int(config['axis'])
+        elif kind != 'Flatten':
+            raise ValueError(f"Unsupported layer {layer.name} of type {kind}")
+        ops.append(op)
+
+    if scaler is not None:
+        first = next(op for op in ops if INPUT in op['inputs'])
+        if first['type'] != 'Conv1D':
+            raise ValueError("The scaler can only be folded into a model starting with a Conv1D layer")
+        _fold_scaler(first, tensors, scaler, input_shape)
+
+    outputs = [resolve(tensor._keras_history[0].name) for tensor in model.outputs]
+
+    # Pack every parameter into one flat float32 array
+    layout = {}
+    offset = 0
+    for name, tensor in tensors.items():
+        layout[name] = {'offset': offset, 'shape': list(tensor.shape)}
+        offset += tensor.size
+    parameters = np.empty(offset, dtype=np.float32)
+    for name, tensor in tensors.items():
+        parameters[layout[name]['offset']:layout[name]['offset'] + tensor.size] = tensor.ravel()
+
+    header = {'format': RUNTIME_FORMAT, 'input_shape': list(input_shape), 'ops': ops, 'outputs': outputs,
+              'tensors': layout, 'metadata': metadata or {}}
+    return write_cache(path, {'parameters': parameters}, header)
+
+class NumpyModel:
+    """
+    Pure NumPy forward pass of a model exported with export_model.
+
+    :param parameters: Flat float32 parameter array.
+    :param metadata: Layer description written by export_model.
+    """
+
+    def __init__(self, parameters, metadata):
+        if metadata.get('format') != RUNTIME_FORMAT:
+            raise ValueError(f"Unsupported model format: {metadata.get('format')}")
+        self.input_shape = tuple(metadata['input_shape'])
+        self.ops = metadata['ops']
+        self.outputs = metadata['outputs']
+        self.metadata = metadata.get('metadata', {})
+        self.tensors = {name: parameters[entry['offset']:entry['offset'] + int(np.prod(entry['shape']))]
+                        .reshape(entry['shape'])
+                        for name, entry in metadata['tensors'].items()}
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load (memory-map) an exported model.
+        """
+        arrays, metadata = open_cache(path)
+        return cls(arrays['parameters'], metadata)
+
+    def _run(self, x):
+        values = {INPUT: x}
+        for op in self.ops:
+            inputs = [values[name] for name in op['inputs']]
+            kind = op['type']
+            if kind == 'Conv1D':
+                x = inputs[0]
+                if 'input_scale' in op:
+                    x = x * self.tensors[op['input_scale']]
+                y = _conv1d(x, self.tensors[op['kernel']])
+                y += self.tensors[op['position_bias']] if 'position_bias' in op else self.tensors[op['bias']]
+                y = _activation(y, op['activation'])
+            elif kind == 'Dense':
+                y = inputs[0] @ self.tensors[op['kernel']]
+                y += self.tensors[op['bias']]
+                y = _activation(y, op['activation'])
+            elif kind == 'MaxPooling1D':
+                x = inputs[0]
+                pool_size, strides = op['pool_size'], op['strides']
+                if pool_size == strides:
+                    length = x.shape[1] // pool_size
+                    y = x[:, :length * pool_size].reshape(x.shape[0], length, pool_size, x.shape[2]).max(axis=2)
+                else:
+                    y = sliding_window_view(x, pool_size, axis=1)[:, ::strides].max(axis=-1)
+            elif kind == 'Cropping1D':
+                start, end = op['cropping']
+                y = inputs[0][:, start:inputs[0].shape[1] - end]
+            elif kind == 'Flatten':
+                y = inputs[0].reshape(inputs[0].shape[0], -1)
+            elif kind == 'Concatenate':
+                y = np.concatenate(inputs, axis=op['axis'])
+            else:
+                raise ValueError(f"Unsupported layer type: {kind}")
+            values[op['name']] = y
+        return [values[name] for name in self.outputs]
+
+    def predict(self, x, batch_size=32):
+        """
+        Run the model on a batch of inputs.
+
+        :param x: Inputs with N samples, in any shape that reshapes to (N,) + input_shape (for example
+                  the flattened (N, 2048) AMR features).
+        :param batch_size: Number of samples run through the layers at once.
+        :return: The output array, or a list of arrays (in model output order) for multi-output models.
+        """
+        x = np.asarray(x, dtype=np.float32).reshape((-1,) + self.input_shape)
+        if len(x) == 0:
+            raise ValueError("No samples to predict")
+        results = [self._run(x[start:start + batch_size]) for start in range(0, len(x), batch_size)]
+        outputs = [np.concatenate([result[i] for result in results]) for i in range(len(self.outputs))]
+        return outputs[0] if len(outputs) == 1 else outputs
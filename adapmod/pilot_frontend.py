@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""Matched-filter front end of the channel assessment model.
+
+The pilot is always the same signal, so the channel it went through can be read off the received pilot.
+Multipath path p adds attenuation * pilot[n + delay] to the pilot (see apply_multipath_batch), so the
+received pilot is r = X h + noise, where column d of X is the pilot advanced by d samples and h is the
+channel impulse response: 1 at lag 0 for the direct path and each path's attenuation at its delay.
+
+The correlation with the pilot, c = X^H r, computed for a whole batch with one FFT and one inverse FFT
+each, is not a usable estimate of h on its own. The BFSK pilot is narrowband and nearly periodic, so
+its autocorrelation X^H X has sidelobes about as strong as its main peak and they, rather than the
+paths, dominate c. PilotMatchedFilter removes them with the regularized (MMSE) deconvolution
+h = (X^H X + noise_power / tap_variance I)^-1 c over the lags 0 to MAX_DELAY. The Gram matrix X^H X only
+depends on the pilot, so it is built and eigendecomposed once when the front end is built, and the
+regularization follows the noise power measured in each received pilot at the cost of two matrix
+products per pilot.
+
+The magnitudes of the estimated response are max-pooled over a few lags at a time into a compact
+response of a few hundred taps. The residual power, the power of the received pilot in the bins of its
+spectrum the pilot does not occupy (see snr_estimation.py) relative to its total power, is appended as
+the last feature.
+
+The compact model of channel_model.py is trained on these features instead of the 2L real and imaginary
+parts of the received pilot.
+
+    frontend = PilotMatchedFilter(bfsk_signal, fs)
+    features = frontend.transform(received_pilots)  # (B, num_features, 1)
+"""
+
+import numpy as np
+
+from .channel_simulation import MAX_DELAY
+from .snr_estimation import NOISE_BINS_FRACTION, noise_bins, pilot_features_to_signals
+
+# Lags max-pooled into one tap of the compact impulse response
+DEFAULT_DECIMATION = 4
+
+# Prior variance of the impulse response taps, which sets the MMSE regularization noise_power / tap_variance
+DEFAULT_TAP_VARIANCE = 0.01
+
+# Smallest regularization, relative to the pilot energy, so noise-free pilots stay well conditioned
+MIN_REGULARIZATION = 1e-6
+
+def pilot_gram(pilot, num_lags):
+    """
+    Gram matrix X^H X of the advanced copies of a pilot, column d of X being pilot[n + d] for n < L (zero
+    past the end of the pilot).
+
+    Entry (k, d) with d >= k is sum_{m=k}^{L-1-(d-k)} pilot[m + d - k] conj(pilot[m]): the full
+    autocorrelation at lag d - k less the terms with m < k, which are accumulated directly.
+
+    :param pilot: Pilot of shape (L,).
+    :param num_lags: Number of lags (columns of X).
+    :return: Hermitian complex128 array of shape (num_lags, num_lags).
+    """
+    pilot = np.asarray(pilot, dtype=np.complex128)
+    fft_length = 1 << int(np.ceil(np.log2(2 * len(pilot))))
+    autocorrelation = np.fft.ifft(np.abs(np.fft.fft(pilot, fft_length)) ** 2)[:num_lags]
+
+    lags = np.arange(num_lags)
+    padded = np.pad(pilot, (0, 2 * num_lags))
+    # head[j, k] = sum_{m<k} pilot[m + j] conj(pilot[m])
+    head = np.zeros((num_lags, num_lags), dtype=np.complex128)
+    np.cumsum(padded[lags[:, None] + lags[None, :-1]] * np.conj(pilot[:num_lags - 1]), axis=1, out=head[:, 1:])
+
+    row, column = np.meshgrid(lags, lags, indexing='ij')
+    lag = np.abs(column - row)
+    upper = autocorrelation[lag] - head[lag, np.minimum(row, column)]
+    return np.where(column >= row, upper, np.conj(upper))
+
+class PilotMatchedFilter:
+    """
+    Batched matched filter and deconvolution turning received pilots into a compact impulse response and
+    residual power.
+
+    :param pilot: Transmitted pilot of shape (L,).
+    :param sampling_freq: Sampling frequency of the pilot.
+    :param max_delay: Largest delay in seconds covered by the impulse response.
+    :param decimation: Lags max-pooled into one tap.
+    :param noise_fraction: Fraction of the bins, with the least pilot energy, the residual power is measured in.
+    :param tap_variance: Prior variance of the impulse response taps of the MMSE deconvolution.
+    """
+
+    def __init__(self, pilot, sampling_freq, max_delay=MAX_DELAY, decimation=DEFAULT_DECIMATION,
+                 noise_fraction=NOISE_BINS_FRACTION, tap_variance=DEFAULT_TAP_VARIANCE):
+        self.pilot = np.asarray(pilot, dtype=np.complex64)
+        self.sampling_freq = sampling_freq
+        self.decimation = decimation
+        self.tap_variance = tap_variance
+        self.length = len(self.pilot)
+        self.max_lag = int(np.ceil(max_delay * sampling_freq))
+        self.num_taps = -(-(self.max_lag + 1) // decimation)
+
+        # The lags are computed without wrapping around, from zero padded transforms
+        self.fft_length = 1 << int(np.ceil(np.log2(self.length + self.max_lag + 1)))
+        self.energy = float(np.sum(np.abs(self.pilot) ** 2))
+        self._pilot_spectrum = np.fft.fft(self.pilot, self.fft_length).astype(np.complex64)
+        self._noise_bins = noise_bins(np.pad(self.pilot, (0, self.fft_length - self.length)), noise_fraction)
+
+        # X^H X = V diag(eigenvalues) V^H, so (X^H X + lambda I)^-1 = V diag(1 / (eigenvalues + lambda)) V^H
+        eigenvalues, eigenvectors = np.linalg.eigh(pilot_gram(pilot, self.max_lag + 1))
+        self._eigenvalues = np.maximum(eigenvalues, 0)
+        self._eigenvectors = eigenvectors.astype(np.complex64)
+
+    @property
+    def num_features(self):
+        return self.num_taps + 1
+
+    def residual_power(self, spectrum):
+        """
+        Noise power per sample of received pilots, measured in the bins the pilot does not occupy.
+
+        :param spectrum: Zero padded spectrum of the received pilots, as returned by impulse_response.
+        :return: float64 array of shape (B,).
+        """
+        noise = spectrum[:, self._noise_bins]
+        # White noise of variance N per sample has an expected power of L * N in every bin
+        return np.mean(noise.real.astype(np.float64)**2 + noise.imag.astype(np.float64)**2, axis=1) / self.length
+
+    def impulse_response(self, received):
+        """
+        Estimate the channel impulse response of received pilots.
+
+        :param received: Received pilots of shape (B, L).
+        :return: Tuple (response, spectrum): the complex impulse response estimate of shape (B, max_lag + 1)
+                 for the lags 0 to max_lag, and the zero padded spectrum of the received pilots.
+        """
+        received = np.atleast_2d(received)
+        spectrum = np.fft.fft(received, self.fft_length, axis=1).astype(np.complex64, copy=False)
+        # ifft(P * conj(R))[d] = sum_n p[n + d] conj(r[n]), the conjugate of the correlation X^H r
+        correlation = np.conj(np.fft.ifft(self._pilot_spectrum * np.conj(spectrum), axis=1)[:, :self.max_lag + 1])
+
+        regularization = np.maximum(self.residual_power(spectrum) / self.tap_variance,
+                                     MIN_REGULARIZATION * self.energy)
+        weights = 1 / (self._eigenvalues + regularization[:, None])
+        projected = correlation.astype(np.complex64) @ np.conj(self._eigenvectors)
+        response = (projected * weights.astype(np.float32)) @ self._eigenvectors.T
+        return response, spectrum
+
+    def transform(self, received):
+        """
+        Compute the front end features of received pilots.
+
+        :param received: Received pilots of shape (B, L).
+        :return: float32 array of shape (B, num_features, 1): the max-pooled magnitudes of the impulse
+                 response, then the residual power in dB relative to the total power.
+        """
+        response, spectrum = self.impulse_response(received)
+        batch = len(response)
+
+        magnitude = np.zeros((batch, self.num_taps * self.decimation), dtype=np.float32)
+        magnitude[:, :response.shape[1]] = np.abs(response)
+        taps = magnitude.reshape(batch, self.num_taps, self.decimation).max(axis=2)
+
+        residual_power = self.residual_power(spectrum)
+        received = np.atleast_2d(received)
+        total_power = np.mean(received.real**2 + received.imag**2, axis=1)
+        tiny = np.finfo(np.float32).tiny
+        residual_db = 10 * np.log10(np.maximum(residual_power, tiny) / np.maximum(total_power, tiny))
+
+        features = np.empty((batch, self.num_features, 1), dtype=np.float32)
+        features[:, :self.num_taps, 0] = taps
+        features[:, self.num_taps, 0] = residual_db
+        return features
+
+    def transform_features(self, features):
+        """
+        Compute the front end features from channel assessment model inputs.
+
+        :param features: Array of shape (B, 2L) or (B, 2L, 1) holding the real parts followed by the
+                         imaginary parts of received pilots.
+        :return: float32 array of shape (B, num_features, 1).
+        """
+        return self.transform(pilot_features_to_signals(features))
+
+    def flops(self):
+        """
+        Approximate floating point operations per received pilot: two complex FFTs of fft_length (5 N log2 N
+        each), the spectrum product, the two complex products with the eigenvectors of the deconvolution
+        and the magnitudes.
+        """
+        fft = 5 * self.fft_length * np.log2(self.fft_length)
+        lags = self.max_lag + 1
+        return int(2 * fft + 6 * self.fft_length + 16 * lags**2 + 3 * lags)
+
+def frontend_predictor(frontend, predict):
+    """
+    Wrap a compact model's predict function to take the usual channel assessment model inputs.
+
+    :param frontend: PilotMatchedFilter the compact model was trained with.
+    :param predict: Function mapping front end features to the model outputs, e.g. NumpyModel.predict.
+    :return: Function mapping features of shape (B, 2L, 1) to the model outputs, which can be passed as
+             channel_predict to LinkSimulator.
+    """
+    return lambda features: predict(frontend.transform_features(features))
+
+def model_cost(model):
+    """
+    Approximate inference cost of a Keras model built from Conv1D, MaxPooling1D, Dense and the layers
+    without arithmetic (Input, Dropout, Flatten, Concatenate).
+
+    :return: Dictionary with the floating point operations per sample, the number of parameters and the
+             float32 bytes of the largest activation per sample.
+    """
+    flops = 0
+    largest_activation = 0
+    for layer in model.layers:
+        output_shape = layer.output.shape[1:]
+        kind = type(layer).__name__
+        if kind == 'Conv1D':
+            kernel = layer.get_weights()[0]
+            flops += 2 * output_shape[0] * kernel.size
+        elif kind == 'Dense':
+            flops += 2 * layer.get_weights()[0].size
+        largest_activation = max(largest_activation, int(np.prod(output_shape)) * 4)
+    return {'flops': int(flops), 'parameters': int(model.count_params()), 'activation_bytes': largest_activation}
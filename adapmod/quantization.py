@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Post-training quantization of the AMR and channel assessment models.
+
+Both CNNs run in float32, yet their outputs are an argmax over three classes and coarse channel
+parameters. This module converts a trained Keras model into float32, float16 and int8 TensorFlow Lite
+variants and evaluates them side by side:
+
+- float16: weights stored in half precision.
+- int8: weights quantized with per-channel scales and activations quantized with ranges calibrated on a
+  sample of the training data. The model keeps float32 inputs and outputs, so it is a drop-in
+  replacement.
+
+All variants are run by the TFLite interpreter on a single thread, so the throughput figures in the
+report are per CPU core and directly comparable with each other. The interpreter is taken from
+ai_edge_litert or tflite_runtime when installed (neither needs TensorFlow at inference time) and from
+TensorFlow otherwise. TensorFlow is only needed to convert the models.
+"""
+
+import json
+import time
+
+import numpy as np
+
+QUANTIZATION_MODES = ('float32', 'float16', 'int8')
+
+def _interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+def sample_calibration_data(features, size=500, seed=0):
+    """
+    Draw a random sample of the training inputs for int8 calibration.
+
+    :param features: Training inputs of shape (N,) + input_shape (already scaled for the AMR model).
+    :param size: Number of samples to draw.
+    :param seed: Seed of the draw.
+    :return: float32 array of min(size, N) samples.
+    """
+    rng = np.random.default_rng(seed)
+    indices = np.sort(rng.choice(len(features), min(size, len(features)), replace=False))
+    return np.asarray(features[indices], dtype=np.float32)
+
+def convert_quantized(model, mode, calibration_data=None):
+    """
+    Convert a trained Keras model to a TensorFlow Lite model.
+
+    :param model: Trained Keras model.
+    :param mode: 'float32' (no quantization), 'float16' or 'int8'.
+    :param calibration_data: Sample of model inputs used to calibrate the int8 activation ranges.
+    :return: Serialized TFLite model (bytes).
+    """
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if mode == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if calibration_data is None:
+            raise ValueError("int8 quantization needs calibration data")
+
+        def representative_dataset():
+            for sample in calibration_data:
+                yield [np.asarray(sample, dtype=np.float32)[None]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode != 'float32':
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    return converter.convert()
+
+class TFLiteModel:
+    """
+    Batched predict over a TFLite model, with outputs in the order of the original Keras model.
+
+    :param model_content: Serialized TFLite model, as returned by convert_quantized.
+    :param num_threads: Interpreter threads. 1 measures per core performance.
+    """
+
+    def __init__(self, model_content, num_threads=1):
+        self.interpreter = _interpreter_class()(model_content=model_content, num_threads=num_threads)
+        signature = self.interpreter.get_signature_list()['serving_default']
+        self.input_name = signature['inputs'][0]
+        # Keras models are exported with outputs named output_0, output_1, ... in model order
+        self.output_names = sorted(signature['outputs'], key=lambda name: int(name.rsplit('_', 1)[-1]))
+        self.runner = self.interpreter.get_signature_runner()
+
+    @classmethod
+    def load(cls, path, num_threads=1):
+        with open(path, 'rb') as f:
+            return cls(f.read(), num_threads)
+
+    def predict(self, x, batch_size=32):
+        """
+        :param x: float32 inputs of shape (N,) + input_shape.
+        :return: The output array, or a list of arrays for multi-output models.
+        """
+        x = np.asarray(x, dtype=np.float32)
+        results = [self.runner(**{self.input_name: x[start:start + batch_size]})
+                   for start in range(0, len(x), batch_size)]
+        outputs = [np.concatenate([result[name] for result in results]) for name in self.output_names]
+        return outputs[0] if len(outputs) == 1 else outputs
+
+def measure_throughput(predict, x, batch_size=32, min_duration=2.0):
+    """
+    Measure the throughput of a predict function.
+
+    :param predict: Function taking a batch of inputs.
+    :param x: Inputs, at least batch_size of them.
+    :param batch_size: Batch size of every call.
+    :param min_duration: Minimum measuring time in seconds.
+    :return: Samples per second.
+    """
+    batch = x[:batch_size]
+    predict(batch)  # Warm up
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        predict(batch)
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_duration:
+            return calls * len(batch) / elapsed
+
+def regression_accuracy(y_true, y_pred, threshold=0.1):
+    """
+    NumPy version of the channel assessment regression_accuracy metric: the fraction of predicted values
+    within threshold of the actual values.
+    """
+    y_true = np.asarray(y_true).reshape(len(y_true), -1)
+    y_pred = np.asarray(y_pred).reshape(len(y_pred), -1)
+    return float(np.mean(np.abs(y_true - y_pred) <= threshold))
+
+def _confusion_matrix(y_true, y_pred, num_classes):
+    cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+    np.add.at(cm, (y_true, y_pred), 1)
+    return cm
+
+def amr_quantization_report(fold_models, features, labels, val_indices, class_names, modes=QUANTIZATION_MODES,
+                            calibration_size=500, throughput_batch_size=32, seed=0):
+    """
+    Compare quantized variants of the AMR cross validation fold models against float32 Keras.
+
+    Each fold model is converted with calibration data drawn from its own training split and evaluated
+    on its validation split, so the confusion matrices line up with the per-fold matrices of the
+    notebook.
+
+    :param fold_models: Trained Keras models of every fold (see cross_validation.load_fold_models).
+    :param features: Scaled model inputs of shape (N,) + input_shape.
+    :param labels: Integer class labels of shape (N,).
+    :param val_indices: Validation indices of every fold, as returned by run_cross_validation.
+    :param class_names: Names of the classes, in label order.
+    :param modes: Quantization modes to evaluate.
+    :param calibration_size: Calibration samples per fold.
+    :param throughput_batch_size: Batch size used to measure throughput.
+    :param seed: Seed of the calibration sample.
+    :return: Report dictionary, see format_quantization_report.
+    """
+    labels = np.asarray(labels)
+    num_classes = len(class_names)
+    variants = ['keras'] + list(modes)
+    report = {'model': 'amr', 'class_names': list(class_names),
+              'variants': {variant: {'cms': [], 'accuracy': []} for variant in variants}}
+
+    for fold, (model, val_index) in enumerate(zip(fold_models, val_indices)):
+        train_index = np.setdiff1d(np.arange(len(labels)), val_index)
+        calibration = sample_calibration_data(features[train_index], calibration_size, seed + fold)
+        X_val, y_val = np.asarray(features[val_index], dtype=np.float32), labels[val_index]
+
+        predictions = {'keras': model.predict(X_val, batch_size=1024, verbose=0)}
+        for mode in modes:
+            model_content = convert_quantized(model, mode, calibration)
+            quantized = TFLiteModel(model_content)
+            predictions[mode] = quantized.predict(X_val)
+            if fold == 0:
+                report['variants'][mode]['model_bytes'] = len(model_content)
+                report['variants'][mode]['samples_per_second'] = measure_throughput(
+                    quantized.predict, X_val, throughput_batch_size)
+
+        for variant, prediction in predictions.items():
+            cm = _confusion_matrix(y_val, np.argmax(prediction, axis=1), num_classes)
+            report['variants'][variant]['cms'].append(cm.tolist())
+            report['variants'][variant]['accuracy'].append(float(np.trace(cm) / cm.sum()))
+
+    return report
+
+def channel_quantization_report(model, features, targets, calibration_features, modes=QUANTIZATION_MODES,
+                                throughput_batch_size=32):
+    """
+    Compare quantized variants of the channel assessment model against float32 Keras.
+
+    :param model: Trained channel assessment Keras model.
+    :param features: Validation inputs of shape (N,) + input_shape.
+    :param targets: Dictionary with the 'snr_output', 'delays_output' and 'attenuations_output' targets.
+    :param calibration_features: Sample of training inputs used for int8 calibration.
+    :param modes: Quantization modes to evaluate.
+    :param throughput_batch_size: Batch size used to measure throughput.
+    :return: Report dictionary, see format_quantization_report.
+    """
+    features = np.asarray(features, dtype=np.float32)
+    output_names = ['snr_output', 'delays_output', 'attenuations_output']
+    report = {'model': 'channel', 'variants': {'keras': {}}}
+
+    predictions = {'keras': model.predict(features, batch_size=32, verbose=0)}
+    for mode in modes:
+        model_content = convert_quantized(model, mode, calibration_features)
+        quantized = TFLiteModel(model_content)
+        predictions[mode] = quantized.predict(features)
+        report['variants'][mode] = {'model_bytes': len(model_content),
+                                    'samples_per_second': measure_throughput(quantized.predict, features,
+                                                                             throughput_batch_size)}
+
+    for variant, prediction in predictions.items():
+        entry = report['variants'].setdefault(variant, {})
+        entry['regression_accuracy'] = {name: regression_accuracy(targets[name], output)
+                                        for name, output in zip(output_names, prediction)}
+    return report
+
+def format_quantization_report(report):
+    """
+    Format a report from amr_quantization_report or channel_quantization_report as text.
+
+    For the AMR model every variant lists its mean accuracy, the number of 4FSK/8FSK confusions summed
+    over the folds and the change of that number relative to float32 Keras. For the channel model every
+    variant lists the regression accuracy of every output. Throughput is in samples per second on one
+    CPU core, with the speedup relative to the TFLite float32 variant.
+    """
+    lines = []
+    variants = report['variants']
+    baseline_speed = variants.get('float32', {}).get('samples_per_second')
+
+    if report['model'] == 'amr':
+        names = report['class_names']
+        pairs = [(names.index(a), names.index(b)) for a, b in (('4FSK', '8FSK'), ('8FSK', '4FSK'))
+                 if a in names and b in names]
+        baseline_confusion = None
+        for variant, entry in variants.items():
+            confusion = sum(cm[i][j] for cm in entry['cms'] for i, j in pairs)
+            if baseline_confusion is None:
+                baseline_confusion = confusion
+            line = (f"{variant:>8}: accuracy {np.mean(entry['accuracy']):.4f}, 4FSK/8FSK confusions {confusion}"
+                    f" ({confusion - baseline_confusion:+d})")
+            lines.append(line + _speed(entry, baseline_speed))
+    else:
+        for variant, entry in variants.items():
+            accuracies = ', '.join(f"{name} {value:.4f}" for name, value in entry['regression_accuracy'].items())
+            lines.append(f"{variant:>8}: {accuracies}" + _speed(entry, baseline_speed))
+    return '\n'.join(lines)
+
+def _speed(entry, baseline_speed):
+    speed = entry.get('samples_per_second')
+    if speed is None:
+        return ''
+    text = f", {entry['model_bytes'] / 1024:.0f} KiB, {speed:.1f} samples/s per core"
+    if baseline_speed:
+        text += f" ({speed / baseline_speed:.2f}x)"
+    return text
+
+def save_report(report, path):
+    """
+    Save a quantization report as JSON.
+    """
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""Precomputed modulation selection table.
+
+Step 6 of the adaptive modulation loop selects the next scheme from the channel assessment. Rather than
+simulating the candidate schemes for every decision, build_selection_table sweeps the channels the
+generator draws (SNR from 0 to 30 dB, delays and attenuations from generate_random_mp_conditions_batch)
+through simulated BFSK, 4FSK and 8FSK links offline, and bins the results by three summaries of the
+channel:
+
+- the SNR in dB,
+- the multipath power, the summed power of the delayed paths relative to the direct path, in dB,
+- the RMS delay spread of the paths, weighted by their power, in seconds.
+
+Every cell of the table holds the scheme with the highest goodput (bits of the packets delivered without
+errors) over the channels that fell into it. The bins are uniform, so looking a channel up is a few
+arithmetic operations and one array index, for one link or for a whole batch at once.
+
+Switching between schemes is damped with a hysteresis margin on the SNR: a link only moves to a faster
+scheme if the table still selects it with the SNR hysteresis_db lower, and only falls back to a more
+robust scheme if the table still selects it with the SNR hysteresis_db higher.
+
+    table = build_selection_table(fs, num_channels=100000, seed=0)
+    table.save('SelectionTable.table')
+    scheme = SelectionTable.load('SelectionTable.table').lookup(snr_output, delays_output, attenuations_output,
+                                                                current=scheme)
+
+A SelectionTable can be passed as the policy of LinkSimulator.
+"""
+
+import numpy as np
+
+from .channel_simulation import (MAX_DELAY, apply_awgn_snr_batch, apply_multipath_batch,
+                                 generate_random_mp_conditions_batch)
+from .dataset_cache import open_cache, write_cache
+from .fsk_modulation import (FSK_ORDERS, demodulate_fsk, fsk_tones, generate_random_bits_batch, modulate_fsk_bits,
+                             symbols_to_bits)
+
+TABLE_FORMAT = 'selection-table-1'
+
+# Modulation schemes in scheme index order, from the most robust to the fastest (as in link_simulator.py)
+SCHEMES = tuple(FSK_ORDERS)
+
+# Default bins: (low edge, bin width, number of bins) of every axis
+SNR_BINS = (0.0, 1.0, 30)
+MULTIPATH_POWER_BINS = (-35.0, 5.0, 8)
+DELAY_SPREAD_BINS = (0.0, MAX_DELAY / 8, 4)
+
+AXES = ('snr_db', 'multipath_power_db', 'delay_spread')
+
+def channel_summary(delays, attenuations):
+    """
+    Summarize multipath conditions by their multipath power and RMS delay spread.
+
+    :param delays: Delays of the paths in seconds, shape (N, P).
+    :param attenuations: Attenuations of the paths, shape (N, P).
+    :return: Tuple (multipath_power_db, delay_spread), both of shape (N,). The direct path counts with
+             power 1 at delay 0.
+    """
+    delays = np.atleast_2d(np.asarray(delays, dtype=np.float64))
+    power = np.atleast_2d(np.asarray(attenuations, dtype=np.float64)) ** 2
+    multipath_power = power.sum(axis=1)
+
+    total = 1 + multipath_power
+    mean_delay = (power * delays).sum(axis=1) / total
+    mean_square_delay = (power * delays**2).sum(axis=1) / total
+    delay_spread = np.sqrt(np.maximum(mean_square_delay - mean_delay**2, 0))
+
+    multipath_power_db = 10 * np.log10(np.maximum(multipath_power, np.finfo(np.float64).tiny))
+    return multipath_power_db, delay_spread
+
+def _bin_index(values, bins):
+    low, width, count = bins
+    return np.clip(np.floor((values - low) / width).astype(np.int64), 0, count - 1)
+
+class SelectionTable:
+    """
+    Binned modulation selection policy.
+
+    :param schemes: Scheme index of every cell, shape (snr bins, multipath power bins, delay spread bins).
+    :param bins: Dictionary mapping every axis in AXES to its (low edge, bin width, number of bins).
+    :param hysteresis_db: SNR margin in dB a link needs before switching scheme.
+    :param goodput: Optional mean bits delivered per packet by every scheme in every cell, shape
+                    schemes.shape + (len(SCHEMES),).
+    :param samples: Optional number of simulated channels in every cell, shape schemes.shape.
+    """
+
+    def __init__(self, schemes, bins, hysteresis_db=1.0, goodput=None, samples=None):
+        self.schemes = np.asarray(schemes, dtype=np.int8)
+        self.bins = {axis: tuple(bins[axis]) for axis in AXES}
+        self.hysteresis_db = hysteresis_db
+        self.goodput = goodput
+        self.samples = samples
+
+    def _cells(self, snr_db, delays, attenuations):
+        multipath_power_db, delay_spread = channel_summary(delays, attenuations)
+        return (_bin_index(np.ravel(snr_db), self.bins['snr_db']),
+                _bin_index(multipath_power_db, self.bins['multipath_power_db']),
+                _bin_index(delay_spread, self.bins['delay_spread']))
+
+    def lookup(self, snr_db, delays, attenuations, current=None):
+        """
+        Select the scheme of one or many links.
+
+        :param snr_db: Estimated SNR in dB, shape (N,) or (N, 1) (snr_output), or a scalar.
+        :param delays: Estimated delays, shape (N, P) (delays_output), or (P,) for one link.
+        :param attenuations: Estimated attenuations, shape (N, P) (attenuations_output), or (P,) for one link.
+        :param current: Current scheme indices of the links, shape (N,). Without them no hysteresis is applied.
+        :return: Scheme indices into SCHEMES, shape (N,).
+        """
+        snr_db = np.ravel(snr_db).astype(np.float64)
+        snr_index, power_index, spread_index = self._cells(snr_db, delays, attenuations)
+        selected = self.schemes[snr_index, power_index, spread_index].astype(np.int64)
+        if current is None or not self.hysteresis_db:
+            return selected
+
+        current = np.ravel(current)
+        margin = self.hysteresis_db
+        # Move up only if the scheme is still selected hysteresis_db lower, down only if still selected higher
+        upgrade = self.schemes[_bin_index(snr_db - margin, self.bins['snr_db']), power_index, spread_index]
+        downgrade = self.schemes[_bin_index(snr_db + margin, self.bins['snr_db']), power_index, spread_index]
+        return np.where(upgrade > current, upgrade,
+                        np.where(downgrade < current, downgrade, current)).astype(np.int64)
+
+    def __call__(self, snr_db, delays, attenuations, current=None):
+        return self.lookup(snr_db, delays, attenuations, current)
+
+    def snr_thresholds(self):
+        """
+        SNR at which the selected scheme changes, for every multipath power and delay spread bin.
+
+        :return: Dictionary mapping (multipath power bin, delay spread bin) to a list of (snr_db, from
+                 scheme, to scheme) switching points, in increasing SNR.
+        """
+        low, width, _ = self.bins['snr_db']
+        thresholds = {}
+        for power_index in range(self.schemes.shape[1]):
+            for spread_index in range(self.schemes.shape[2]):
+                column = self.schemes[:, power_index, spread_index]
+                changes = np.flatnonzero(column[1:] != column[:-1]) + 1
+                thresholds[(power_index, spread_index)] = [(low + width * index, SCHEMES[column[index - 1]],
+                                                            SCHEMES[column[index]]) for index in changes]
+        return thresholds
+
+    def save(self, path):
+        arrays = {'schemes': self.schemes}
+        if self.goodput is not None:
+            arrays['goodput'] = np.asarray(self.goodput, dtype=np.float32)
+        if self.samples is not None:
+            arrays['samples'] = np.asarray(self.samples, dtype=np.int64)
+        return write_cache(path, arrays, {'format': TABLE_FORMAT, 'bins': self.bins,
+                                          'hysteresis_db': self.hysteresis_db, 'schemes': list(SCHEMES)})
+
+    @classmethod
+    def load(cls, path):
+        arrays, metadata = open_cache(path)
+        if metadata.get('format') != TABLE_FORMAT:
+            raise ValueError(f"Unsupported selection table format: {metadata.get('format')}")
+        return cls(np.array(arrays['schemes']), metadata['bins'], metadata['hysteresis_db'],
+                   arrays.get('goodput'), arrays.get('samples'))
+
+def simulate_scheme_goodput(delays, attenuations, snr_db, sampling_freq, packet_length=1024, samples_per_symbol=16,
+                            tone_spacing=None, fractional=True, rng=None):
+    """
+    Send one packet of every scheme through each of a batch of channels.
+
+    :param delays: Delays of the paths in seconds, shape (N, P).
+    :param attenuations: Attenuations of the paths, shape (N, P).
+    :param snr_db: SNR of every channel in dB, shape (N,).
+    :param sampling_freq: Sampling frequency of the packets.
+    :param packet_length: Samples per packet.
+    :param samples_per_symbol: Samples per symbol.
+    :param tone_spacing: Spacing of the FSK tones in Hz. Defaults to sampling_freq / samples_per_symbol.
+    :param fractional: Apply the multipath delays with sub-sample precision.
+    :param rng: np.random.Generator to draw from.
+    :return: Delivered bits (the packet's bits if it arrived without errors, else 0), shape (N, len(SCHEMES)).
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    tone_spacing = sampling_freq / samples_per_symbol if tone_spacing is None else tone_spacing
+    symbol_time = samples_per_symbol / sampling_freq
+    num_symbols = packet_length // samples_per_symbol
+
+    delivered = np.zeros((len(snr_db), len(SCHEMES)))
+    for index, name in enumerate(SCHEMES):
+        order = FSK_ORDERS[name]
+        bits = generate_random_bits_batch(len(snr_db), num_symbols * int(np.log2(order)), rng)
+        packets = modulate_fsk_bits(bits, order, sampling_freq, symbol_time, tone_spacing=tone_spacing)
+        received = apply_multipath_batch(packets, delays, attenuations, sampling_freq, fractional)
+        received = apply_awgn_snr_batch(received, snr_db, rng)
+        symbols = demodulate_fsk(received, fsk_tones(order, tone_spacing), sampling_freq, symbol_time)
+        errors = np.count_nonzero(symbols_to_bits(symbols, order) != bits, axis=1)
+        delivered[:, index] = np.where(errors == 0, bits.shape[1], 0)
+    return delivered
+
+def build_selection_table(sampling_freq, num_channels=100000, snr_range=(0, 30), num_paths=5, bins=None,
+                          hysteresis_db=1.0, min_samples=20, chunk_size=2048, seed=None, **link_options):
+    """
+    Build a selection table by simulating every scheme over random channels of the generator.
+
+    :param sampling_freq: Sampling frequency of the packets.
+    :param num_channels: Number of random channels simulated.
+    :param snr_range: (low, high) range the SNR in dB is drawn uniformly from.
+    :param num_paths: Number of multipath paths per channel.
+    :param bins: Optional dictionary overriding the (low edge, bin width, number of bins) of any axis in AXES.
+    :param hysteresis_db: SNR margin in dB a link needs before switching scheme.
+    :param min_samples: Cells with fewer simulated channels fall back to the most robust scheme.
+    :param chunk_size: Channels simulated at once.
+    :param seed: Seed of the simulation.
+    :param link_options: packet_length, samples_per_symbol, tone_spacing and fractional, passed on to
+                         simulate_scheme_goodput. Match them to the links the table is used on.
+    :return: SelectionTable.
+    """
+    rng = np.random.default_rng(seed)
+    bins = {'snr_db': SNR_BINS, 'multipath_power_db': MULTIPATH_POWER_BINS, 'delay_spread': DELAY_SPREAD_BINS,
+            **(bins or {})}
+    shape = tuple(bins[axis][2] for axis in AXES)
+    delivered_bits = np.zeros(shape + (len(SCHEMES),))
+    samples = np.zeros(shape, dtype=np.int64)
+
+    for start in range(0, num_channels, chunk_size):
+        count = min(chunk_size, num_channels - start)
+        delays, attenuations = generate_random_mp_conditions_batch(count, num_paths, rng)
+        snr_db = rng.uniform(snr_range[0], snr_range[1], count)
+        delivered = simulate_scheme_goodput(delays, attenuations, snr_db, sampling_freq, rng=rng, **link_options)
+
+        multipath_power_db, delay_spread = channel_summary(delays, attenuations)
+        cells = np.ravel_multi_index((_bin_index(snr_db, bins['snr_db']),
+                                      _bin_index(multipath_power_db, bins['multipath_power_db']),
+                                      _bin_index(delay_spread, bins['delay_spread'])), shape)
+        samples += np.bincount(cells, minlength=samples.size).reshape(shape)
+        for index in range(len(SCHEMES)):
+            delivered_bits[..., index] += np.bincount(cells, delivered[:, index],
+                                                      minlength=samples.size).reshape(shape)
+
+    goodput = delivered_bits / np.maximum(samples, 1)[..., None]
+    # The most robust scheme wins ties and the cells without enough channels
+    schemes = np.where(samples >= min_samples, np.argmax(goodput, axis=-1), 0)
+    return SelectionTable(schemes, bins, hysteresis_db, goodput, samples)
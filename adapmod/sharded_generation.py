@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Deterministic sharded generation of the channel assessment dataset.
+
+The dataset is split into shards of a fixed number of samples. Every shard draws from its own
+np.random.Generator, seeded with the SeedSequence spawned for that shard from the dataset seed, and is
+written to its own dataset cache (see dataset_cache.py). The contents of a shard therefore depend only
+on the seed, the shard index and the generation parameters, never on which process generated it or in
+what order, so the merged dataset is bit-identical for any number of workers and any single shard can
+be regenerated on its own.
+
+    output_dir/manifest.json
+    output_dir/shard_00000/header.json, features.bin, labels.bin
+    output_dir/shard_00001/...
+
+The manifest records the generation parameters, the pilot and, for every shard, its range of samples,
+its spawn key and the SHA-256 digests of its arrays.
+
+    manifest = generate_sharded_dataset(shards_dir, bfsk_signal, fs, num_signals=1000000, seed=0)
+    merge_shards(shards_dir, dataset_cache_path)
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .channel_simulation import generate_channel_realizations
+from .dataset_cache import commit_cache, create_cache, open_cache
+from .tracing import stage
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_FORMAT_VERSION = 1
+
+# Samples generated at once within a shard
+DEFAULT_BATCH_SIZE = 500
+
+def label_columns(num_paths=5):
+    return ([f'Delay_{i+1}' for i in range(num_paths)] +
+            [f'Attenuation_{i+1}' for i in range(num_paths)] +
+            ['SNR'])
+
+def shard_seed_sequence(seed, index):
+    """
+    SeedSequence of one shard, the same as the index-th child spawned from np.random.SeedSequence(seed).
+    """
+    return np.random.SeedSequence(seed, spawn_key=(index,))
+
+def _shard_path(output_dir, index):
+    return os.path.join(output_dir, f'shard_{index:05d}')
+
+def _digest(array):
+    return hashlib.sha256(np.ascontiguousarray(array).view(np.uint8)).hexdigest()
+
+def generate_shard(shard_path, pilot, sampling_freq, count, seed, index, snr_range=(0, 30), num_paths=5,
+                   fractional=True, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Generate one shard into its own dataset cache.
+
+    :param shard_path: Directory of the shard's cache.
+    :param pilot: Pilot signal of shape (L,).
+    :param sampling_freq: Sampling frequency of the pilot.
+    :param count: Number of samples in the shard.
+    :param seed: Seed of the dataset.
+    :param index: Index of the shard.
+    :param snr_range: (low, high) range the SNR in dB is drawn uniformly from.
+    :param num_paths: Number of multipath paths per realization.
+    :param fractional: Apply the multipath delays with sub-sample precision.
+    :param batch_size: Samples generated at once.
+    :return: Dictionary with the shard's 'index', 'count' and the 'sha256' digests of its arrays.
+    """
+    pilot = np.asarray(pilot)
+    signal_length = len(pilot)
+    rng = np.random.default_rng(shard_seed_sequence(seed, index))
+
+    with stage('generate_shard', rows=count, shard=index):
+        arrays = create_cache(shard_path,
+                              {'features': ((count, 2 * signal_length), np.float32),
+                               'labels': ((count, 2 * num_paths + 1), np.float64)},
+                              metadata={'label_columns': label_columns(num_paths), 'shard': index})
+        for start in range(0, count, batch_size):
+            batch = min(batch_size, count - start)
+            signals, labels = generate_channel_realizations(pilot, batch, sampling_freq, snr_range, num_paths, rng,
+                                                            fractional)
+            arrays['features'][start:start + batch, :signal_length] = signals.real
+            arrays['features'][start:start + batch, signal_length:] = signals.imag
+            arrays['labels'][start:start + batch] = labels
+        digests = {name: _digest(array) for name, array in arrays.items()}
+        commit_cache(shard_path, arrays)
+
+    return {'index': index, 'count': count, 'sha256': digests}
+
+def generate_sharded_dataset(output_dir, pilot, sampling_freq, num_signals, shard_size=10000, seed=0,
+                             num_workers=None, snr_range=(0, 30), num_paths=5, fractional=True,
+                             batch_size=DEFAULT_BATCH_SIZE, metadata=None):
+    """
+    Generate a dataset as independent shards in a process pool.
+
+    :param output_dir: Directory the shards and the manifest are written to.
+    :param pilot: Pilot signal of shape (L,), stored in the manifest.
+    :param sampling_freq: Sampling frequency of the pilot.
+    :param num_signals: Total number of samples.
+    :param shard_size: Samples per shard (the last shard may be smaller). Part of the dataset's identity:
+                       the same seed with another shard size gives another dataset.
+    :param seed: Integer seed of the dataset.
+    :param num_workers: Number of processes. Defaults to the CPU count. Does not affect the result.
+    :param snr_range: (low, high) range the SNR in dB is drawn uniformly from.
+    :param num_paths: Number of multipath paths per realization.
+    :param fractional: Apply the multipath delays with sub-sample precision.
+    :param batch_size: Samples generated at once within a shard. Like shard_size, it sets the order of
+                       the random draws and so is part of the dataset's identity.
+    :param metadata: Optional JSON serializable dictionary stored in the manifest (e.g. the pilot's
+                     bitstream and modulation parameters).
+    :return: The manifest dictionary.
+    """
+    if num_signals < 1 or shard_size < 1:
+        raise ValueError(f"num_signals and shard_size must be positive, got {num_signals} and {shard_size}")
+    pilot = np.asarray(pilot)
+    num_workers = num_workers or os.cpu_count() or 1
+    starts = list(range(0, num_signals, shard_size))
+    counts = [min(shard_size, num_signals - start) for start in starts]
+    os.makedirs(output_dir, exist_ok=True)
+
+    shards = [None] * len(starts)
+    arguments = (pilot, sampling_freq)
+    options = {'snr_range': tuple(snr_range), 'num_paths': num_paths, 'fractional': fractional,
+               'batch_size': batch_size}
+    with stage('sharded_generation', rows=num_signals, shards=len(starts), workers=num_workers):
+        if num_workers == 1:
+            for index, count in enumerate(counts):
+                shards[index] = generate_shard(_shard_path(output_dir, index), *arguments, count, seed, index,
+                                               **options)
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as executor:
+                futures = [executor.submit(generate_shard, _shard_path(output_dir, index), *arguments, count, seed,
+                                           index, **options)
+                           for index, count in enumerate(counts)]
+                for future in as_completed(futures):
+                    result = future.result()
+                    shards[result['index']] = result
+
+    manifest = {
+        'format': MANIFEST_FORMAT_VERSION,
+        'seed': seed,
+        'num_signals': num_signals,
+        'shard_size': shard_size,
+        'sampling_freq': sampling_freq,
+        'snr_range': list(snr_range),
+        'num_paths': num_paths,
+        'fractional': fractional,
+        'batch_size': batch_size,
+        'label_columns': label_columns(num_paths),
+        'pilot': {'real': pilot.real.tolist(), 'imag': np.imag(pilot).tolist()},
+        'shards': [{'index': index, 'start': start, 'count': shard['count'],
+                    'path': os.path.basename(_shard_path(output_dir, index)), 'spawn_key': [index],
+                    'sha256': shard['sha256']}
+                   for index, (start, shard) in enumerate(zip(starts, shards))],
+        'metadata': metadata or {},
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+def read_manifest(output_dir):
+    with open(os.path.join(output_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != MANIFEST_FORMAT_VERSION:
+        raise ValueError(f"Unsupported manifest format {manifest.get('format')} in {output_dir}")
+    return manifest
+
+def manifest_pilot(manifest):
+    return np.asarray(manifest['pilot']['real']) + 1j * np.asarray(manifest['pilot']['imag'])
+
+def regenerate_shard(output_dir, index, shard_path=None):
+    """
+    Regenerate one shard from the manifest and check it against the recorded digests.
+
+    :param output_dir: Directory holding the manifest.
+    :param index: Index of the shard.
+    :param shard_path: Where to write the regenerated shard. Defaults to a 'regenerated' directory next
+                       to the shards, so the original is left untouched.
+    :return: Tuple (arrays, matches): the regenerated arrays, opened from their cache, and whether their
+             digests match the manifest.
+    """
+    manifest = read_manifest(output_dir)
+    shard = manifest['shards'][index]
+    shard_path = shard_path or os.path.join(output_dir, 'regenerated', shard['path'])
+    os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+    result = generate_shard(shard_path, manifest_pilot(manifest), manifest['sampling_freq'], shard['count'],
+                            manifest['seed'], index, manifest['snr_range'], manifest['num_paths'],
+                            manifest['fractional'], manifest['batch_size'])
+    return open_cache(shard_path)[0], result['sha256'] == shard['sha256']
+
+def merge_shards(output_dir, cache_path, verify=True):
+    """
+    Concatenate the shards, in shard order, into a single dataset cache.
+
+    :param output_dir: Directory holding the manifest and the shards.
+    :param cache_path: Directory of the merged dataset cache. Replaced if it already exists.
+    :param verify: Check every shard against the digests in the manifest.
+    :return: cache_path.
+    """
+    manifest = read_manifest(output_dir)
+    if not manifest['shards']:
+        raise ValueError(f"The manifest in {output_dir} lists no shards")
+    first, _ = open_cache(os.path.join(output_dir, manifest['shards'][0]['path']))
+    num_signals = manifest['num_signals']
+
+    with stage('merge_shards', rows=num_signals, shards=len(manifest['shards'])):
+        merged = create_cache(cache_path,
+                              {name: ((num_signals,) + array.shape[1:], array.dtype) for name, array in first.items()},
+                              metadata={'label_columns': manifest['label_columns'], 'seed': manifest['seed'],
+                                        'shard_size': manifest['shard_size']})
+        for shard in manifest['shards']:
+            arrays, _ = open_cache(os.path.join(output_dir, shard['path']))
+            for name, array in arrays.items():
+                if verify and _digest(array) != shard['sha256'][name]:
+                    raise ValueError(f"Shard {shard['index']} {name} does not match the manifest")
+                merged[name][shard['start']:shard['start'] + shard['count']] = array
+        return commit_cache(cache_path, merged)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""Classical SNR estimators for the received pilots.
+
+The SNR output of the channel assessment model does not learn the SNR (see the results of the channel
+assessment notebook), yet the SNR of a received pilot can be estimated in closed form. Every estimator
+below works on a whole batch of received pilots of shape (batch, L) with a few array operations:
+
+- Data-aided: the pilot is known, so the bins of its spectrum that hold (next to) none of its energy
+  carry only noise, whatever the multipath does to the pilot (multipath filters the pilot, it cannot
+  move its energy to other frequencies). The noise power is measured in those bins. This is the
+  maximum likelihood estimate of the noise variance when the channel is an unknown filter.
+- M2M4: the second and fourth moments of the received samples, for a constant envelope signal. Needs
+  no pilot, but multipath breaks the constant envelope and biases the estimate.
+- Eigenvalue: the eigenvalues of the covariance of short windows of the received signal split into a
+  few large signal eigenvalues and noise eigenvalues; the number of signal eigenvalues is chosen by the
+  minimum description length (MDL) criterion. Needs no pilot.
+
+The SNR follows apply_awgn_snr: the power of the signal after multipath over the power of the (real)
+noise added to it, in dB.
+
+    estimates = SNR_ESTIMATORS['data_aided'](received_pilots, bfsk_signal)
+"""
+
+import time
+
+import numpy as np
+
+# Fraction of the spectrum, with the least pilot energy, the data-aided estimator measures the noise in
+NOISE_BINS_FRACTION = 0.5
+
+# Window length of the eigenvalue estimator
+EIGENVALUE_WINDOW = 32
+
+# The SNR is limited to this range so that a noise or signal power estimate of zero stays finite
+SNR_LIMITS_DB = (-30.0, 80.0)
+
+def _to_db(signal_power, noise_power):
+    tiny = np.finfo(np.float64).tiny
+    snr_db = 10 * np.log10(np.maximum(signal_power, tiny) / np.maximum(noise_power, tiny))
+    return np.clip(snr_db, *SNR_LIMITS_DB)
+
+def pilot_features_to_signals(features):
+    """
+    Convert channel assessment model inputs back to complex pilots.
+
+    :param features: Array of shape (batch, 2L) or (batch, 2L, 1) holding the real parts followed by the
+                     imaginary parts.
+    :return: complex64 array of shape (batch, L).
+    """
+    features = np.asarray(features, dtype=np.float32).reshape(len(features), -1)
+    length = features.shape[1] // 2
+    return features[:, :length] + 1j * features[:, length:]
+
+def noise_bins(pilot, fraction=NOISE_BINS_FRACTION):
+    """
+    Select the FFT bins with the least pilot energy.
+
+    :param pilot: Transmitted pilot of shape (L,).
+    :param fraction: Fraction of the bins to select.
+    :return: Sorted indices of the selected bins.
+    """
+    pilot_spectrum = np.abs(np.fft.fft(np.asarray(pilot))) ** 2
+    count = max(1, int(len(pilot_spectrum) * fraction))
+    return np.sort(np.argpartition(pilot_spectrum, count - 1)[:count])
+
+def estimate_snr_data_aided(received, pilot, fraction=NOISE_BINS_FRACTION):
+    """
+    Data-aided SNR estimate from the noise power in the bins the pilot does not occupy.
+
+    :param received: Received pilots of shape (batch, L).
+    :param pilot: Transmitted pilot of shape (L,).
+    :param fraction: Fraction of the bins, with the least pilot energy, the noise power is measured in.
+    :return: SNR estimates in dB, shape (batch,).
+    """
+    received = np.atleast_2d(received)
+    length = received.shape[1]
+    bins = noise_bins(pilot, fraction)
+
+    spectrum = np.fft.fft(received, axis=1)[:, bins]
+    # White noise of variance N per sample has an expected power of L * N in every bin
+    noise_power = np.mean(spectrum.real**2 + spectrum.imag**2, axis=1) / length
+    total_power = np.mean(received.real**2 + received.imag**2, axis=1)
+    return _to_db(total_power - noise_power, noise_power)
+
+def estimate_snr_m2m4(received, noise_kurtosis=3.0, signal_kurtosis=1.0):
+    """
+    M2M4 moment SNR estimate.
+
+    With M2 = E|r|^2 and M4 = E|r|^4, the signal power S and noise power N satisfy M2 = S + N and
+    M4 = ka S^2 + 4 S N + kw N^2, where ka = E|s|^4 / S^2 and kw = E|n|^4 / N^2.
+
+    :param received: Received signals of shape (batch, L).
+    :param noise_kurtosis: kw, 3 for the real noise added by apply_awgn_snr, 2 for complex noise.
+    :param signal_kurtosis: ka, 1 for a constant envelope signal such as FSK without multipath.
+    :return: SNR estimates in dB, shape (batch,).
+    """
+    received = np.atleast_2d(received)
+    magnitude = (received.real**2 + received.imag**2).astype(np.float64)
+    m2 = magnitude.mean(axis=1)
+    m4 = (magnitude**2).mean(axis=1)
+
+    # Substituting N = M2 - S gives a S^2 + b S + c = 0
+    a = signal_kurtosis - 4 + noise_kurtosis
+    b = (4 - 2 * noise_kurtosis) * m2
+    c = noise_kurtosis * m2**2 - m4
+    if abs(a) < 1e-12:
+        signal_power = -c / b
+    else:
+        # Take the root within [0, M2]
+        root = np.sqrt(np.maximum(b**2 - 4 * a * c, 0))
+        first, second = (-b - root) / (2 * a), (-b + root) / (2 * a)
+        signal_power = np.where((first >= 0) & (first <= m2), first, second)
+    signal_power = np.clip(signal_power, 0, m2)
+    return _to_db(signal_power, m2 - signal_power)
+
+def estimate_snr_eigenvalue(received, window=EIGENVALUE_WINDOW, num_signal=None):
+    """
+    Eigenvalue based SNR estimate.
+
+    The received signal is cut into non-overlapping windows whose sample covariance has num_signal
+    eigenvalues holding the signal and noise eigenvalues averaging to the noise power.
+
+    :param received: Received signals of shape (batch, L).
+    :param window: Window length, the size of the covariance matrix.
+    :param num_signal: Number of signal eigenvalues. Chosen per signal with the MDL criterion if None.
+    :return: SNR estimates in dB, shape (batch,).
+    """
+    received = np.atleast_2d(received).astype(np.complex64)
+    batch, length = received.shape
+    num_windows = length // window
+    windows = received[:, :num_windows * window].reshape(batch, num_windows, window)
+
+    covariance = np.conj(windows.transpose(0, 2, 1)) @ windows / num_windows
+    eigenvalues = np.maximum(np.linalg.eigvalsh(covariance).astype(np.float64), np.finfo(np.float64).tiny)
+    # eigvalsh returns ascending eigenvalues; the noise eigenvalues are the window - k smallest
+    counts = np.arange(window, 0, -1)  # number of noise eigenvalues when k = 0 .. window - 1
+    arithmetic = np.cumsum(eigenvalues, axis=1)[:, ::-1] / counts
+    geometric = np.exp(np.cumsum(np.log(eigenvalues), axis=1)[:, ::-1] / counts)
+
+    if num_signal is None:
+        k = np.arange(window)
+        mdl = (-num_windows * counts * np.log(geometric / arithmetic)
+               + 0.5 * k * (2 * window - k) * np.log(num_windows))
+        num_signal = np.argmin(mdl, axis=1)
+    num_signal = np.broadcast_to(num_signal, (batch,))
+
+    noise_power = arithmetic[np.arange(batch), num_signal]
+    total_power = eigenvalues.sum(axis=1) / window
+    return _to_db(total_power - noise_power, noise_power)
+
+SNR_ESTIMATORS = {
+    'data_aided': estimate_snr_data_aided,
+    'm2m4': lambda received, pilot=None: estimate_snr_m2m4(received),
+    'eigenvalue': lambda received, pilot=None: estimate_snr_eigenvalue(received),
+}
+
+class SNRHeadOverride:
+    """
+    Wrap a channel assessment predict function, replacing or checking its SNR output with a classical
+    estimate from the same received pilots.
+
+    The wrapper takes and returns the same values as the wrapped function, so it can be passed as
+    channel_predict to LinkSimulator or used in place of model.predict.
+
+    :param channel_predict: Function mapping pilot features of shape (B, 2L, 1) to the [snr, delays,
+                            attenuations] outputs of the channel assessment model.
+    :param pilot: Transmitted pilot of shape (L,).
+    :param estimator: Name of the estimator in SNR_ESTIMATORS.
+    :param mode: 'replace' to return the classical estimate as the SNR output, 'check' to keep the
+                 model's SNR output and only count how often it disagrees with the estimate.
+    :param tolerance_db: Disagreement above which a prediction counts as inconsistent in 'check' mode.
+    """
+
+    def __init__(self, channel_predict, pilot, estimator='data_aided', mode='replace', tolerance_db=3.0):
+        if mode not in ('replace', 'check'):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.channel_predict = channel_predict
+        self.pilot = np.asarray(pilot)
+        self.estimate = SNR_ESTIMATORS[estimator]
+        self.mode = mode
+        self.tolerance_db = tolerance_db
+
+        self.predictions = 0
+        self.inconsistent = 0
+
+    def __call__(self, features):
+        snr_db = self.estimate(pilot_features_to_signals(features), self.pilot)
+        outputs = list(self.channel_predict(features))
+        model_snr = np.asarray(outputs[0]).reshape(len(snr_db))
+
+        self.predictions += len(snr_db)
+        self.inconsistent += int(np.count_nonzero(np.abs(model_snr - snr_db) > self.tolerance_db))
+        if self.mode == 'replace':
+            outputs[0] = snr_db.astype(np.float32).reshape(np.shape(outputs[0]))
+        return outputs
+
+def benchmark_snr_estimators(pilot, sampling_freq, num_signals=3000, snr_range=(0, 30), bin_width=5.0,
+                             extra_estimates=None, seed=0):
+    """
+    Compare the SNR estimators against the ground truth of the channel assessment generator.
+
+    :param pilot: Pilot signal of shape (L,).
+    :param sampling_freq: Sampling frequency of the pilot.
+    :param num_signals: Number of channel realizations.
+    :param snr_range: (low, high) range the true SNR in dB is drawn uniformly from.
+    :param bin_width: Width in dB of the SNR bins the errors are broken down by.
+    :param extra_estimates: Optional dictionary mapping names to functions taking the received pilots
+                            (batch, L) and returning SNR estimates, e.g. the model's SNR output.
+    :param seed: Seed of the channel realizations.
+    :return: Dictionary mapping each estimator to its 'bias_db', 'mae_db', 'rmse_db', 'within_1db'
+             fraction, 'us_per_signal' and per-bin 'bins' of those errors.
+    """
+    from .channel_simulation import generate_channel_realizations
+
+    received, labels = generate_channel_realizations(pilot, num_signals, sampling_freq, snr_range,
+                                                     rng=np.random.default_rng(seed))
+    true_snr = labels[:, -1]
+    edges = np.arange(snr_range[0], snr_range[1] + bin_width, bin_width)
+    bin_index = np.clip(np.digitize(true_snr, edges) - 1, 0, len(edges) - 2)
+
+    estimators = {name: (lambda received, estimator=estimator: estimator(received, pilot))
+                  for name, estimator in SNR_ESTIMATORS.items()}
+    estimators.update(extra_estimates or {})
+
+    def errors(error):
+        return {'bias_db': float(error.mean()), 'mae_db': float(np.abs(error).mean()),
+                'rmse_db': float(np.sqrt(np.mean(error**2))), 'within_1db': float(np.mean(np.abs(error) <= 1))}
+
+    results = {}
+    for name, estimator in estimators.items():
+        estimator(received[:8])  # Warm up
+        started = time.perf_counter()
+        estimates = np.asarray(estimator(received), dtype=np.float64).reshape(num_signals)
+        elapsed = time.perf_counter() - started
+
+        error = estimates - true_snr
+        results[name] = errors(error)
+        results[name]['us_per_signal'] = elapsed / num_signals * 1e6
+        results[name]['bins'] = {f'{edges[i]:g}-{edges[i + 1]:g} dB': errors(error[bin_index == i])
+                                 for i in range(len(edges) - 1) if np.any(bin_index == i)}
+    return results
+
+def format_snr_benchmark(results):
+    """
+    Format the results of benchmark_snr_estimators as text.
+    """
+    lines = []
+    for name, result in results.items():
+        lines.append(f"{name:>12}: MAE {result['mae_db']:.2f} dB, bias {result['bias_db']:+.2f} dB, "
+                     f"RMSE {result['rmse_db']:.2f} dB, within 1 dB {result['within_1db']:.1%}, "
+                     f"{result['us_per_signal']:.1f} us/signal")
+        for bin_name, errors in result['bins'].items():
+            lines.append(f"{'':>14}{bin_name:>12}: MAE {errors['mae_db']:.2f} dB, bias {errors['bias_db']:+.2f} dB")
+    return '\n'.join(lines)
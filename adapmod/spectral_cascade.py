@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""Spectral fast path in front of the AMR CNN.
+
+At high SNR the tones of an FSK burst stand out as separate peaks in its spectrum, so BFSK, 4FSK and
+8FSK can be told apart from a handful of FFT features. The cascade computes these features for a whole
+batch of packets with one FFT, classifies them with a small logistic regression and only passes the
+packets it is not confident about on to the CNN.
+
+The confidence threshold is calibrated on the cross validation folds: the fast classifier is trained on
+the training split of every fold and compared, on the validation split, with the fold's CNN. The
+threshold lets as many packets as possible take the fast path while keeping the accuracy of the cascade
+within max_accuracy_loss of the CNN alone.
+
+    cascade = calibrate_cascade(dataset['features'], integer_labels, scaled_features, fold_models,
+                                cv_results['val_indices'], label_encoder.classes_)
+    probabilities = cascade.predict(packets, cnn_predict)
+"""
+
+import time
+
+import numpy as np
+
+# Levels below the strongest spectral peak, in dB, down to which peaks are counted
+PEAK_LEVELS_DB = (3.0, 6.0, 10.0)
+
+# Fractions of the signal energy whose bandwidth is measured
+OCCUPANCY_FRACTIONS = (0.5, 0.9)
+
+# Bins on each side a spectral peak has to dominate
+PEAK_NEIGHBOURHOOD = 2
+
+FEATURE_NAMES = ([f'peaks_{level:g}dB' for level in PEAK_LEVELS_DB] +
+                 [f'occupancy_{fraction:g}' for fraction in OCCUPANCY_FRACTIONS] +
+                 ['flatness', 'peak_to_average'])
+
+def spectral_features(iq, smoothing=3):
+    """
+    Compute the spectral features of a batch of packets.
+
+    :param iq: Array of shape (N, L, 2) holding the I and Q samples of every packet.
+    :param smoothing: Width in bins of the moving average applied to the power spectrum.
+    :return: float32 array of shape (N, len(FEATURE_NAMES)): the number of spectral peaks within each of
+             PEAK_LEVELS_DB of the strongest, the fraction of the bins holding each of
+             OCCUPANCY_FRACTIONS of the energy, the spectral flatness and the peak to average power ratio.
+    """
+    iq = np.asarray(iq, dtype=np.float32)
+    signals = iq[..., 0] + 1j * iq[..., 1]
+    spectrum = np.fft.fft(signals, axis=1)
+    power = spectrum.real**2 + spectrum.imag**2
+
+    # Circular moving average, so that a tone spread over neighbouring bins counts as one peak
+    if smoothing > 1:
+        power = sum(np.roll(power, shift, axis=1) for shift in range(-(smoothing // 2), smoothing - smoothing // 2))
+    power /= np.maximum(power.sum(axis=1, keepdims=True), np.finfo(power.dtype).tiny)
+    num_bins = power.shape[1]
+
+    # Local maxima dominating their neighbourhood
+    neighbourhood = np.max([np.roll(power, shift, axis=1)
+                            for shift in range(-PEAK_NEIGHBOURHOOD, PEAK_NEIGHBOURHOOD + 1) if shift], axis=0)
+    is_peak = power > neighbourhood
+    strongest = power.max(axis=1, keepdims=True)
+    peak_counts = [np.count_nonzero(is_peak & (power >= strongest * 10 ** (-level / 10)), axis=1)
+                   for level in PEAK_LEVELS_DB]
+
+    # Bandwidth holding a given fraction of the energy
+    cumulative = np.cumsum(np.sort(power, axis=1)[:, ::-1], axis=1)
+    occupancy = [(np.argmax(cumulative >= fraction, axis=1) + 1) / num_bins for fraction in OCCUPANCY_FRACTIONS]
+
+    floor = np.finfo(power.dtype).tiny
+    flatness = np.exp(np.mean(np.log(power + floor), axis=1)) * num_bins
+    peak_to_average = strongest[:, 0] * num_bins
+
+    return np.stack(peak_counts + occupancy + [flatness, peak_to_average], axis=1).astype(np.float32)
+
+def _fit_classifier(features, labels, random_state=0):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    classifier = make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000, random_state=random_state))
+    return classifier.fit(features, labels)
+
+def calibrate_threshold(confidence, fast_correct, cnn_correct, max_accuracy_loss=0.0):
+    """
+    Choose the lowest confidence at which packets take the fast path.
+
+    Packets are accepted in order of decreasing confidence for as long as the accuracy of the cascade
+    (fast path for the accepted packets, CNN for the rest) stays within max_accuracy_loss of the CNN.
+
+    :param confidence: Fast classifier confidence of every packet, shape (N,).
+    :param fast_correct: Whether the fast classifier is right for every packet, shape (N,).
+    :param cnn_correct: Whether the CNN is right for every packet, shape (N,).
+    :param max_accuracy_loss: Accuracy the cascade may lose relative to the CNN, as a fraction.
+    :return: Confidence threshold (packets with a confidence >= threshold take the fast path), or
+             np.inf if no packet can take it.
+    """
+    order = np.argsort(-confidence, kind='stable')
+    confidence = confidence[order]
+    # Cascade accuracy when the first k packets take the fast path, for k = 0..N
+    fast_correct = np.concatenate([[0], np.cumsum(fast_correct[order])])
+    cnn_correct = np.asarray(cnn_correct)[order]
+    cnn_remaining = cnn_correct.sum() - np.concatenate([[0], np.cumsum(cnn_correct)])
+    accuracy = (fast_correct + cnn_remaining) / len(order)
+
+    # Only cut between packets of different confidence, since the threshold cannot split ties
+    cuts = np.concatenate([[True], confidence[1:] < confidence[:-1], [True]])
+    allowed = np.flatnonzero(cuts & (accuracy >= accuracy[0] - max_accuracy_loss - 1e-12))
+    accepted = allowed.max()
+    return float(confidence[accepted - 1]) if accepted else float(np.inf)
+
+class SpectralCascade:
+    """
+    Fast spectral classifier deciding the packets it is confident about before the CNN.
+
+    :param classifier: Fitted classifier over spectral_features with predict_proba.
+    :param threshold: Confidence at or above which a packet takes the fast path.
+    :param class_names: Names of the classes, in label order.
+    """
+
+    def __init__(self, classifier, threshold, class_names):
+        self.classifier = classifier
+        self.threshold = threshold
+        self.class_names = list(class_names)
+
+        # Counters of the traffic that took either path
+        self.packets = 0
+        self.fast_path_packets = 0
+        self.fast_path_time = 0.0
+        self.cnn_time = 0.0
+
+    def fast_predict(self, iq):
+        """
+        Classify packets with the fast path alone.
+
+        :param iq: Array of shape (N, L, 2).
+        :return: Tuple (probabilities, confident): class probabilities of shape (N, num_classes) and
+                 whether each packet is confident enough to skip the CNN.
+        """
+        probabilities = self.classifier.predict_proba(spectral_features(iq))
+        return probabilities, probabilities.max(axis=1) >= self.threshold
+
+    def predict(self, iq, cnn_predict):
+        """
+        Classify packets, running the CNN only on the packets the fast path is not confident about.
+
+        :param iq: Array of shape (N, L, 2).
+        :param cnn_predict: Function mapping packets of shape (B, L, 2) to CNN class probabilities.
+        :return: Class probabilities of shape (N, num_classes), from the fast classifier for the
+                 confident packets and from the CNN for the others.
+        """
+        started = time.perf_counter()
+        probabilities, confident = self.fast_predict(iq)
+        self.fast_path_time += time.perf_counter() - started
+
+        ambiguous = np.flatnonzero(~confident)
+        if len(ambiguous):
+            started = time.perf_counter()
+            probabilities[ambiguous] = cnn_predict(np.asarray(iq)[ambiguous])
+            self.cnn_time += time.perf_counter() - started
+
+        self.packets += len(confident)
+        self.fast_path_packets += int(np.count_nonzero(confident))
+        return probabilities
+
+    def stats(self):
+        """
+        Fraction of the packets that took the fast path and the time spent on either path.
+        """
+        return {
+            'packets': self.packets,
+            'fast_path_fraction': self.fast_path_packets / self.packets if self.packets else None,
+            'fast_path_seconds': self.fast_path_time,
+            'cnn_seconds': self.cnn_time,
+        }
+
+    def save(self, path):
+        from joblib import dump
+        dump({'classifier': self.classifier, 'threshold': self.threshold, 'class_names': self.class_names}, path)
+
+    @classmethod
+    def load(cls, path):
+        from joblib import load
+        state = load(path)
+        return cls(state['classifier'], state['threshold'], state['class_names'])
+
+def calibrate_cascade(iq, labels, features, fold_models, val_indices, class_names, max_accuracy_loss=0.0,
+                      random_state=0):
+    """
+    Train the fast classifier and calibrate its threshold on the cross validation folds.
+
+    :param iq: Packets of shape (N, L, 2), as loaded from the dataset.
+    :param labels: Integer class labels of shape (N,).
+    :param features: Scaled CNN inputs of shape (N, ...), in the same order.
+    :param fold_models: Trained CNN of every fold (see cross_validation.load_fold_models).
+    :param val_indices: Validation indices of every fold, as returned by run_cross_validation.
+    :param class_names: Names of the classes, in label order.
+    :param max_accuracy_loss: Accuracy the cascade may lose relative to the CNN, as a fraction.
+    :param random_state: Seed of the classifier.
+    :return: Tuple (cascade, calibration). cascade is a SpectralCascade trained on every packet and
+             calibration describes the out-of-fold results: the threshold, the fraction of packets on
+             the fast path and the accuracy of the CNN, the fast classifier and the cascade.
+    """
+    labels = np.asarray(labels)
+    spectra = spectral_features(iq)
+
+    confidence = np.empty(len(labels))
+    fast_correct = np.empty(len(labels), dtype=bool)
+    cnn_correct = np.empty(len(labels), dtype=bool)
+    for model, val_index in zip(fold_models, val_indices):
+        train_index = np.setdiff1d(np.arange(len(labels)), val_index)
+        classifier = _fit_classifier(spectra[train_index], labels[train_index], random_state)
+        probabilities = classifier.predict_proba(spectra[val_index])
+        confidence[val_index] = probabilities.max(axis=1)
+        fast_correct[val_index] = classifier.classes_[np.argmax(probabilities, axis=1)] == labels[val_index]
+        cnn_probabilities = model.predict(np.asarray(features[val_index]), batch_size=1024, verbose=0)
+        cnn_correct[val_index] = np.argmax(cnn_probabilities, axis=1) == labels[val_index]
+
+    threshold = calibrate_threshold(confidence, fast_correct, cnn_correct, max_accuracy_loss)
+    fast_path = confidence >= threshold
+    calibration = {
+        'threshold': threshold,
+        'fast_path_fraction': float(fast_path.mean()),
+        'cnn_accuracy': float(cnn_correct.mean()),
+        'fast_classifier_accuracy': float(fast_correct.mean()),
+        'cascade_accuracy': float(np.where(fast_path, fast_correct, cnn_correct).mean()),
+    }
+    return SpectralCascade(_fit_classifier(spectra, labels, random_state), threshold, class_names), calibration
+
+def measure_cascade_latency(cascade, iq, cnn_predict, batch_size=64, repeats=3):
+    """
+    Measure the latency of the cascade against the CNN alone.
+
+    :param cascade: Calibrated SpectralCascade.
+    :param iq: Packets of shape (N, L, 2) to classify.
+    :param cnn_predict: Function mapping packets of shape (B, L, 2) to CNN class probabilities.
+    :param batch_size: Packets classified per call.
+    :param repeats: Timed passes over the packets; the fastest pass is kept.
+    :return: Dictionary with the fraction of packets on the fast path, the time per packet of the CNN
+             alone and of the cascade, and the fraction of the CNN time saved.
+    """
+    batches = [iq[start:start + batch_size] for start in range(0, len(iq), batch_size)]
+
+    def best_time(function):
+        function(batches[0])  # Warm up
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            for batch in batches:
+                function(batch)
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    cnn_seconds = best_time(cnn_predict)
+    cascade_seconds = best_time(lambda batch: cascade.predict(batch, cnn_predict))
+    confident = cascade.fast_predict(iq)[1]
+    return {
+        'fast_path_fraction': float(confident.mean()),
+        'cnn_ms_per_packet': cnn_seconds / len(iq) * 1000,
+        'cascade_ms_per_packet': cascade_seconds / len(iq) * 1000,
+        'latency_saved': 1 - cascade_seconds / cnn_seconds,
+    }
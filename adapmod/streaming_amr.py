@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Sliding-window AMR over a continuous IQ stream.
+
+The AMR model classifies fixed-length packets, while a receiver delivers a continuous stream of IQ
+samples in blocks of whatever size its driver hands over. StreamingAMR copies every block once into a
+preallocated buffer and classifies overlapping windows of the model's input length, one every hop
+samples. The windows are strided views of the buffer, so forming them copies nothing, and all windows
+completed by a block are classified together in one predict call (at most max_batch at a time).
+
+The class probabilities are averaged over the last few windows, and a decision is returned for every
+window as soon as the block completing it has been pushed, so the latency of a decision is bounded by
+the block size plus one predict call. Once the buffer is full the samples still needed by the next
+window are moved to its front, so memory use stays fixed however long the stream runs.
+
+    classifier = StreamingAMR(runtime.predict, class_names=label_encoder.classes_, sample_rate=fs)
+    for block in receiver:
+        for decision in classifier.push(block):
+            print(decision.start, decision.label, decision.confidence)
+"""
+
+import collections
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# A decision covers the window of stream samples [start, end)
+Decision = collections.namedtuple('Decision', ['start', 'end', 'label', 'confidence'])
+
+# A run of consecutive windows with the same decision, covering the stream samples [start, end)
+Segment = collections.namedtuple('Segment', ['start', 'end', 'label', 'windows'])
+
+def _as_iq(block):
+    """
+    Convert a block of samples, complex of shape (n,) or I/Q of shape (n, 2), to float32 I/Q.
+    """
+    block = np.asarray(block)
+    if np.iscomplexobj(block):
+        return np.stack([block.real, block.imag], axis=-1).astype(np.float32, copy=False)
+    return block.reshape(-1, 2).astype(np.float32, copy=False)
+
+class StreamingAMR:
+    """
+    Classify the modulation of a continuous IQ stream with overlapping windows.
+
+    :param predict: Function mapping windows of shape (B, window_length, 2) to class probabilities, such
+                    as NumpyModel.predict of a model exported with its scaler, amr_predictor or a
+                    SpectralCascade's predict bound to the CNN.
+    :param window_length: Input length of the model in samples.
+    :param hop: Samples between the starts of consecutive windows. Defaults to half a window.
+    :param max_batch: Most windows classified in one predict call.
+    :param smoothing: Number of most recent windows the class probabilities are averaged over.
+    :param class_names: Names of the classes, in label order. Decisions hold class indices if None.
+    :param sample_rate: Sample rate of the stream, used to report the real-time factor.
+    """
+
+    def __init__(self, predict, window_length=1024, hop=None, max_batch=64, smoothing=4, class_names=None,
+                 sample_rate=None):
+        self.predict = predict
+        self.window_length = window_length
+        self.hop = hop or window_length // 2
+        if not 0 < self.hop <= window_length:
+            raise ValueError("hop must be between 1 and window_length")
+        self.max_batch = max_batch
+        self.smoothing = smoothing
+        self.class_names = None if class_names is None else list(class_names)
+        self.sample_rate = sample_rate
+
+        # Room for the samples of max_batch windows, so a full batch forms before the buffer is compacted
+        self._buffer = np.zeros((window_length + max_batch * self.hop, 2), dtype=np.float32)
+        self._history = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the stream, keeping the buffer.
+        """
+        self._end = 0  # Samples held in the buffer
+        self._next = 0  # Buffer position of the start of the next window
+        self._offset = 0  # Stream position of the start of the buffer
+        self._filled = 0  # Windows in the smoothing history
+        self.samples = 0
+        self.windows = 0
+        self.predict_calls = 0
+        self.busy_time = 0.0
+        self.predict_time = 0.0
+        self.max_push_latency = 0.0
+
+    def _compact(self):
+        # Keep only the samples the next window still needs (fewer than window_length)
+        remaining = self._end - self._next
+        self._buffer[:remaining] = self._buffer[self._next:self._end]
+        self._offset += self._next
+        self._end = remaining
+        self._next = 0
+
+    def _smooth(self, probabilities):
+        """
+        Average every window's probabilities with those of the windows before it.
+        """
+        if self._history is None:
+            self._history = np.zeros((self.smoothing, probabilities.shape[1]))
+        smoothed = np.empty(probabilities.shape)
+        for index, window_probabilities in enumerate(probabilities):
+            self._history[self._filled % self.smoothing] = window_probabilities
+            self._filled += 1
+            smoothed[index] = self._history[:min(self._filled, self.smoothing)].mean(axis=0)
+        return smoothed
+
+    def _classify_ready(self):
+        """
+        Classify every complete window in the buffer, max_batch at a time.
+        """
+        decisions = []
+        while self._end - self._next >= self.window_length:
+            count = min((self._end - self._next - self.window_length) // self.hop + 1, self.max_batch)
+            # (count, window_length, 2) strided view of the buffer
+            windows = sliding_window_view(self._buffer[self._next:self._end], self.window_length, axis=0)
+            windows = windows[::self.hop][:count].transpose(0, 2, 1)
+
+            started = time.perf_counter()
+            probabilities = np.asarray(self.predict(windows))
+            self.predict_time += time.perf_counter() - started
+            self.predict_calls += 1
+
+            smoothed = self._smooth(probabilities)
+            starts = self._offset + self._next + self.hop * np.arange(count)
+            labels = np.argmax(smoothed, axis=1)
+            for start, label, confidence in zip(starts, labels, smoothed[np.arange(count), labels]):
+                decisions.append(Decision(int(start), int(start) + self.window_length,
+                                          int(label) if self.class_names is None else self.class_names[label],
+                                          float(confidence)))
+            self._next += count * self.hop
+            self.windows += count
+        return decisions
+
+    def push(self, block):
+        """
+        Add a block of samples to the stream.
+
+        :param block: Complex samples of shape (n,) or I/Q samples of shape (n, 2), of any length n.
+        :return: List of Decisions for the windows the block completed, in stream order.
+        """
+        started = time.perf_counter()
+        block = _as_iq(block)
+        decisions = []
+        position = 0
+        while position < len(block):
+            if self._end == len(self._buffer):
+                self._compact()
+            count = min(len(self._buffer) - self._end, len(block) - position)
+            self._buffer[self._end:self._end + count] = block[position:position + count]
+            self._end += count
+            position += count
+            decisions.extend(self._classify_ready())
+        self.samples += len(block)
+
+        elapsed = time.perf_counter() - started
+        self.busy_time += elapsed
+        self.max_push_latency = max(self.max_push_latency, elapsed)
+        return decisions
+
+    def stats(self):
+        """
+        Throughput of the classifier: samples and windows processed, time spent, samples per second of
+        processing time and, if the sample rate is known, how many times faster than real time that is.
+        """
+        samples_per_second = self.samples / self.busy_time if self.busy_time else None
+        return {
+            'samples': self.samples,
+            'windows': self.windows,
+            'predict_calls': self.predict_calls,
+            'busy_seconds': self.busy_time,
+            'predict_seconds': self.predict_time,
+            'max_push_latency_ms': self.max_push_latency * 1000,
+            'samples_per_second': samples_per_second,
+            'realtime_factor': (samples_per_second / self.sample_rate
+                                if samples_per_second and self.sample_rate else None),
+        }
+
+def merge_decisions(decisions):
+    """
+    Merge consecutive decisions with the same label into segments.
+
+    :param decisions: Decisions in stream order, e.g. collected from StreamingAMR.push.
+    :return: List of Segments. Overlapping windows with different labels split at the start of the later one.
+    """
+    segments = []
+    for decision in decisions:
+        if segments and segments[-1].label == decision.label:
+            last = segments[-1]
+            segments[-1] = last._replace(end=decision.end, windows=last.windows + 1)
+        else:
+            if segments:
+                segments[-1] = segments[-1]._replace(end=min(segments[-1].end, decision.start))
+            segments.append(Segment(decision.start, decision.end, decision.label, 1))
+    return segments
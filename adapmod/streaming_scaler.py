@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Out-of-core feature scaling.
+
+StandardScaler.fit_transform needs the whole feature matrix in memory as float64, plus the copy made
+when the result is reshaped for the CNN. StreamingScaler fits the same mean and standard deviation
+chunk by chunk (merging the statistics of every chunk with the parallel form of Welford's algorithm),
+so the features can stay in a memory-mapped dataset cache, and writes the float32 model inputs in place
+into a preallocated buffer, such as a memmap from create_cache.
+
+The statistics are kept either per channel (one for I and one for Q, over every time step of every
+packet) or per sample (one for every time step and channel, as StandardScaler fits on the flattened
+features). The fitted scaler has the mean_, var_ and scale_ attributes and the transform method of a
+StandardScaler, so it can be saved with joblib, folded into a model by export_model and used by the
+inference service in its place.
+
+    scaler = StreamingScaler(per='channel').fit(dataset['features'])
+    scaled = create_cache(scaled_path, {'features': (dataset['features'].shape, np.float32)})
+    scaler.transform(dataset['features'], out=scaled['features'])
+"""
+
+import numpy as np
+
+# Packets read and converted to float64 at once
+DEFAULT_CHUNK_SIZE = 4096
+
+class StreamingScaler:
+    """
+    Standardize I/Q features fitted and transformed chunk by chunk.
+
+    :param per: 'channel' for one statistic per channel, 'sample' for one per time step and channel.
+    :param num_channels: Number of interleaved channels of a packet, 2 for I/Q.
+    :param chunk_size: Number of packets processed at once.
+    """
+
+    def __init__(self, per='channel', num_channels=2, chunk_size=DEFAULT_CHUNK_SIZE):
+        if per not in ('channel', 'sample'):
+            raise ValueError(f"Unknown statistics: {per}")
+        self.per = per
+        self.num_channels = num_channels
+        self.chunk_size = chunk_size
+        self._reset()
+
+    def _reset(self):
+        self.n_samples_seen_ = 0
+        self.mean_ = None
+        self.var_ = None
+        self.scale_ = None
+        self._m2 = None
+
+    def _packets(self, X):
+        """
+        View a chunk of packets as (n, time_steps, channels).
+        """
+        return np.asarray(X).reshape(len(X), -1, self.num_channels)
+
+    def partial_fit(self, X):
+        """
+        Update the statistics with a chunk of packets.
+
+        :param X: Array of shape (n, L, channels), or (n, L * channels) with interleaved channels.
+        :return: self.
+        """
+        chunk = self._packets(X)
+        packets, time_steps = chunk.shape[:2]
+        # One row per observation of the statistics: every time step for per channel statistics, every
+        # packet for per sample statistics. einsum reduces the rows much faster than sum(axis=0).
+        rows = chunk.reshape(-1, self.num_channels) if self.per == 'channel' else chunk.reshape(packets, -1)
+        rows = rows.astype(np.float64)
+        count = len(rows)
+        mean = np.einsum('ij->j', rows) / count
+        rows -= mean
+        m2 = np.einsum('ij,ij->j', rows, rows)
+
+        seen = self.n_samples_seen_ * (time_steps if self.per == 'channel' else 1)
+        if self.mean_ is None:
+            self.mean_, self._m2 = mean, m2
+        else:
+            if mean.shape != self.mean_.shape:
+                raise ValueError(f"Expected packets with {self.mean_.size} statistics, got {mean.size}")
+            # Merge the chunk into the running statistics (Chan et al.)
+            total = seen + count
+            delta = mean - self.mean_
+            self.mean_ = self.mean_ + delta * (count / total)
+            self._m2 = self._m2 + m2 + delta**2 * (seen * count / total)
+
+        self.n_samples_seen_ += packets
+        self.var_ = self._m2 / (seen + count)
+        # As in StandardScaler, constant features are left unscaled
+        self.scale_ = np.where(self.var_ > 0, np.sqrt(self.var_), 1.0)
+        return self
+
+    def fit(self, X):
+        """
+        Fit the statistics over all packets, one chunk at a time.
+
+        :param X: Array (or memmap) of shape (N, L, channels), or (N, L * channels) with interleaved channels.
+        :return: self.
+        """
+        self._reset()
+        for start in range(0, len(X), self.chunk_size):
+            self.partial_fit(X[start:start + self.chunk_size])
+        return self
+
+    def transform(self, X, out=None):
+        """
+        Standardize packets one chunk at a time.
+
+        :param X: Array of shape (N, ...) holding L * channels values per packet.
+        :param out: Optional C-contiguous float32 array (or memmap) of shape (N, ...) with the same number
+                    of values per packet, e.g. (N, L, 2) or (N, L * 2, 1). May be X itself to scale a
+                    float32 array in place. Allocated with the shape of X if not given.
+        :return: out, holding the float32 scaled packets.
+        """
+        if self.mean_ is None:
+            raise ValueError("The scaler is not fitted")
+        if out is None:
+            out = np.empty(np.shape(X), dtype=np.float32)
+        if out.dtype != np.float32 or not out.flags.c_contiguous or len(out) != len(X):
+            raise ValueError("out must be a C-contiguous float32 array with one row per packet")
+
+        # The statistics are repeated to the length of a whole packet, so the arithmetic runs over long rows
+        # rather than over a trailing axis of num_channels values
+        time_steps = self._packets(X[:1]).shape[1]
+        mean = self._packet_row(self.mean_, time_steps)
+        inverse_scale = self._packet_row(1 / self.scale_, time_steps)
+        for start in range(0, len(X), self.chunk_size):
+            stop = min(start + self.chunk_size, len(X))
+            target = out[start:stop].reshape(stop - start, -1)
+            np.subtract(np.asarray(X[start:stop]).reshape(stop - start, -1), mean, out=target, casting='unsafe')
+            target *= inverse_scale
+        return out
+
+    def _packet_row(self, statistic, time_steps):
+        statistic = statistic.astype(np.float32).reshape((1, -1, self.num_channels))
+        return np.ascontiguousarray(np.broadcast_to(statistic, (1, time_steps, self.num_channels))).reshape(1, -1)
+
+    def fit_transform(self, X, out=None):
+        return self.fit(X).transform(X, out)
+
+    def inverse_transform(self, X):
+        packets = self._packets(X)
+        return (packets * self.scale_.reshape((1, -1, self.num_channels))
+                + self.mean_.reshape((1, -1, self.num_channels))).reshape(np.shape(X))
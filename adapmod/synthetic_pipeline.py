@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""On-the-fly synthetic training data for the channel assessment model.
+
+Instead of training on a fixed dataset generated ahead of time, the channel assessment model can be fed
+fresh pilot realizations for every batch. Several background worker processes generate batches with the
+batched channel functions in channel_simulation.py and push them into a bounded queue, so the next
+batches are always ready when model.fit asks for them while memory use stays fixed.
+
+    stream = SyntheticPilotStream(bfsk_signal, fs, batch_size=32, num_workers=4, seed=0)
+    with stream:
+        model.fit(stream.batches(), steps_per_epoch=1000, epochs=30)
+
+model.fit takes the generator returned by batches(). If a worker fails, its traceback is raised from the
+generator, and a worker that dies without one is reported as well, instead of training waiting forever.
+"""
+
+import multiprocessing
+import queue
+import time
+import traceback
+
+import numpy as np
+
+from .channel_simulation import generate_channel_realizations
+
+def make_pilot_batch(signal, batch_size, sampling_freq, snr_range=(0, 30), num_paths=5, rng=None, frontend=None):
+    """
+    Generate one training batch of received pilots and their channel targets.
+
+    :param signal: Pilot signal of shape (L,).
+    :param batch_size: Number of realizations in the batch.
+    :param sampling_freq: Sampling frequency of the pilot.
+    :param snr_range: (low, high) range the SNR in dB is drawn uniformly from.
+    :param num_paths: Number of multipath paths per realization.
+    :param rng: np.random.Generator to draw from. A fresh one is created if not given.
+    :param frontend: Optional PilotMatchedFilter (see pilot_frontend.py) the received pilots are passed through.
+    :return: Tuple (features, targets). features has shape (batch_size, 2L, 1) and holds the real parts
+             followed by the imaginary parts, as in the channel assessment dataset, or holds the front end
+             features if a frontend is given. targets maps 'snr_output', 'delays_output' and
+             'attenuations_output' to their arrays.
+    """
+    signals, labels = generate_channel_realizations(signal, batch_size, sampling_freq, snr_range, num_paths, rng)
+
+    if frontend is not None:
+        features = frontend.transform(signals)
+    else:
+        features = np.empty((batch_size, 2 * signals.shape[1], 1), dtype=np.float32)
+        features[:, :signals.shape[1], 0] = signals.real
+        features[:, signals.shape[1]:, 0] = signals.imag
+
+    targets = {
+        'snr_output': labels[:, 2 * num_paths].astype(np.float32),
+        'delays_output': labels[:, :num_paths].astype(np.float32),
+        'attenuations_output': labels[:, num_paths:2 * num_paths].astype(np.float32),
+    }
+    return features, targets
+
+# Seconds the consumer waits on the queue before checking that the workers are still alive
+_LIVENESS_INTERVAL = 1.0
+
+class _WorkerError:
+    """
+    Queued in place of a batch by a worker that raised, carrying its formatted traceback.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+def _put(batches, item, stop):
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def _produce_batches(signal, sampling_freq, batch_size, snr_range, num_paths, frontend, seed_sequence, batches,
+                     stop):
+    """
+    Worker process body: generate batches until asked to stop.
+    """
+    try:
+        rng = np.random.default_rng(seed_sequence)
+        while not stop.is_set():
+            _put(batches, make_pilot_batch(signal, batch_size, sampling_freq, snr_range, num_paths, rng, frontend),
+                 stop)
+    except Exception:
+        _put(batches, _WorkerError(traceback.format_exc()), stop)
+
+class SyntheticPilotStream:
+    """
+    Endless stream of synthetic channel assessment batches generated by background processes.
+
+    :param signal: Pilot signal of shape (L,).
+    :param sampling_freq: Sampling frequency of the pilot.
+    :param batch_size: Number of realizations per batch.
+    :param num_workers: Number of generating processes.
+    :param prefetch: Maximum number of generated batches waiting in the queue.
+    :param snr_range: (low, high) range the SNR in dB is drawn uniformly from.
+    :param num_paths: Number of multipath paths per realization.
+    :param seed: Seed of the np.random.SeedSequence the workers' generators are spawned from.
+    :param frontend: Optional PilotMatchedFilter the workers pass the received pilots through.
+    """
+
+    def __init__(self, signal, sampling_freq, batch_size=32, num_workers=2, prefetch=16, snr_range=(0, 30),
+                 num_paths=5, seed=None, frontend=None):
+        self.signal = np.asarray(signal)
+        self.sampling_freq = sampling_freq
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.snr_range = snr_range
+        self.num_paths = num_paths
+        self.seed = seed
+        self.frontend = frontend
+
+        # Batches delivered and the time spent waiting for them, to check the workers keep up
+        self.batches_delivered = 0
+        self.wait_time = 0.0
+
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = []
+        self._batches = None
+        self._stop = None
+
+    def start(self):
+        """
+        Start the worker processes.
+        """
+        if self._workers:
+            return self
+        self._batches = self._context.Queue(maxsize=self.prefetch)
+        self._stop = self._context.Event()
+        seed_sequences = np.random.SeedSequence(self.seed).spawn(self.num_workers)
+        for seed_sequence in seed_sequences:
+            worker = self._context.Process(target=_produce_batches, daemon=True,
+                                           args=(self.signal, self.sampling_freq, self.batch_size, self.snr_range,
+                                                 self.num_paths, self.frontend, seed_sequence, self._batches,
+                                                 self._stop))
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def close(self):
+        """
+        Stop the worker processes and discard any queued batches.
+        """
+        if not self._workers:
+            return
+        self._stop.set()
+        # Drain the queue so no worker stays blocked on a full queue
+        deadline = time.monotonic() + 5
+        while any(worker.is_alive() for worker in self._workers) and time.monotonic() < deadline:
+            try:
+                self._batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for worker in self._workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+        self._batches.close()
+        self._workers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _next_batch(self):
+        while True:
+            try:
+                batch = self._batches.get(timeout=_LIVENESS_INTERVAL)
+            except queue.Empty:
+                dead = [worker for worker in self._workers if not worker.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Batch generating worker exited with code {dead[0].exitcode}")
+                continue
+            if isinstance(batch, _WorkerError):
+                raise RuntimeError(f"Batch generating worker failed:\n{batch.message}")
+            return batch
+
+    def batches(self):
+        """
+        Start the workers if needed and return a generator over the batches, to be passed to model.fit.
+        """
+        self.start()
+        while True:
+            started = time.perf_counter()
+            batch = self._next_batch()
+            self.wait_time += time.perf_counter() - started
+            self.batches_delivered += 1
+            yield batch
+
+    def __iter__(self):
+        return self.batches()
+
+    def __del__(self):
+        self.close()
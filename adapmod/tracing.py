@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""Per-stage tracing of the data pipelines.
+
+Stages are marked with the stage context manager. Each stage records its wall time, CPU time, resident
+memory and, when the number of rows it processes is given, its rows per second. Stages nest: a stage
+opened inside another is recorded as its child. Stage ids are '<pid>:<counter>' strings, unique across
+the processes tracing into one file.
+
+    enable('amr_trace.jsonl')
+    with stage('scaling', rows=len(features)):
+        scaled_features = scaler.fit_transform(features)
+
+Tracing is disabled until enable is called. While disabled, stage returns a shared do-nothing object,
+so the marked stages can stay in the code of production runs. Every finished stage is appended to the
+trace as one JSON line. With format='chrome' the trace is converted at the end of the run (or on
+disable) to the Chrome trace event format, which can be opened in chrome://tracing or Perfetto.
+
+Worker processes started after enable (such as the cross validation folds) trace into the same file:
+enable stores the trace path in the ADAPMOD_TRACE environment variable, which the workers inherit and
+read when they import this module.
+"""
+
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Environment variable passing the JSON lines trace path on to worker processes
+TRACE_ENV_VAR = 'ADAPMOD_TRACE'
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def _current_rss():
+    """
+    Resident set size of this process in bytes, or None where it cannot be read cheaply.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+def _peak_rss():
+    """
+    Peak resident set size of this process so far in bytes.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+def _megabytes(value):
+    return None if value is None else round(value / 2**20, 3)
+
+class _NullStage:
+    """
+    Stage returned while tracing is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class Stage:
+    """
+    One traced stage. Created by stage, not directly.
+    """
+    __slots__ = ('tracer', 'name', 'rows', 'attributes', 'id', 'parent', 'depth', '_start', '_wall', '_cpu',
+                 '_rss', '_peak')
+
+    def __init__(self, tracer, name, rows, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.rows = rows
+        self.attributes = attributes
+
+    def set(self, rows=None, **attributes):
+        """
+        Set the number of rows processed, or other attributes, once they are known inside the stage.
+        """
+        if rows is not None:
+            self.rows = rows
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        # Worker processes trace into the same file with their own counters, so the id includes the pid
+        self.id = f'{os.getpid()}:{next(self.tracer._ids)}'
+        self.parent = stack[-1].id if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self._rss = _current_rss()
+        self._peak = _peak_rss()
+        self._start = time.time()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        rss = _current_rss()
+        peak = _peak_rss()
+        self.tracer._stack().pop()
+
+        record = {
+            'name': self.name, 'id': self.id, 'parent': self.parent, 'depth': self.depth,
+            'pid': os.getpid(), 'tid': threading.get_ident(), 'start': self._start,
+            'wall_s': wall, 'cpu_s': cpu,
+            'rss_mb': _megabytes(rss),
+            'rss_delta_mb': None if rss is None or self._rss is None else _megabytes(rss - self._rss),
+            'peak_rss_mb': _megabytes(peak),
+            # How far the stage raised the peak memory of the process
+            'peak_rss_growth_mb': None if peak is None else _megabytes(peak - self._peak),
+        }
+        if self.rows is not None:
+            record['rows'] = self.rows
+            record['rows_per_s'] = self.rows / wall if wall > 0 else None
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if self.attributes:
+            record['attributes'] = self.attributes
+        self.tracer._write(record)
+        return False
+
+class Tracer:
+    """
+    Writes finished stages to a JSON lines trace file.
+
+    :param path: Path of the trace. With format='chrome' the JSON lines are written to path + '.jsonl'
+                 and converted to path when the tracer is closed.
+    :param format: 'jsonl' or 'chrome'.
+    """
+
+    def __init__(self, path, format='jsonl'):
+        if format not in ('jsonl', 'chrome'):
+            raise ValueError(f"Unknown trace format: {format}")
+        self.path = path
+        self.format = format
+        self.jsonl_path = path + '.jsonl' if format == 'chrome' else path
+        self._ids = itertools.count()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file = open(self.jsonl_path, 'a', buffering=1)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _write(self, record):
+        # Each record is written with a single call to an append mode file, so records of several
+        # processes do not interleave
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def stage(self, name, rows=None, **attributes):
+        return Stage(self, name, rows, attributes)
+
+    def close(self):
+        """
+        Close the trace file, converting it to the Chrome format if requested.
+        """
+        if self._file.closed:
+            return
+        self._file.close()
+        # Only the process that enabled tracing converts the trace, once its workers are done
+        if self.format == 'chrome' and not _is_worker:
+            write_chrome_trace(self.jsonl_path, self.path)
+
+_tracer = None
+
+# Whether this process inherited the trace from the process that started it
+_is_worker = bool(os.environ.get(TRACE_ENV_VAR))
+
+def enable(path, format='jsonl', propagate=True):
+    """
+    Start tracing to a file.
+
+    :param path: Path of the trace file.
+    :param format: 'jsonl' (one JSON object per stage) or 'chrome' (Chrome trace event format).
+    :param propagate: Make worker processes started from now on trace into the same file.
+    :return: The Tracer.
+    """
+    global _tracer
+    disable()
+    _tracer = Tracer(path, format)
+    if propagate:
+        os.environ[TRACE_ENV_VAR] = _tracer.jsonl_path
+    return _tracer
+
+def disable():
+    """
+    Stop tracing and close the trace file.
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        if not _is_worker and os.environ.get(TRACE_ENV_VAR) == _tracer.jsonl_path:
+            del os.environ[TRACE_ENV_VAR]
+        _tracer = None
+
+def enabled():
+    return _tracer is not None
+
+def stage(name, rows=None, **attributes):
+    """
+    Mark a stage of a pipeline, to be used as a context manager.
+
+    :param name: Name of the stage.
+    :param rows: Number of rows (signals, samples) processed by the stage. Can also be set later with
+                 the set method of the returned stage.
+    :param attributes: Other JSON serializable values stored with the stage (e.g. fold=1).
+    :return: Context manager. While tracing is disabled this is a shared object that does nothing.
+    """
+    if _tracer is None:
+        return _NULL_STAGE
+    return _tracer.stage(name, rows, **attributes)
+
+def read_trace(path):
+    """
+    Read the stages of a JSON lines trace.
+
+    :return: List of stage records in the order they finished.
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def write_chrome_trace(jsonl_path, chrome_path):
+    """
+    Convert a JSON lines trace to the Chrome trace event format.
+
+    :param jsonl_path: Path of the JSON lines trace.
+    :param chrome_path: Path of the Chrome trace to write.
+    :return: chrome_path.
+    """
+    records = read_trace(jsonl_path)
+    origin = min((record['start'] for record in records), default=0)
+    events = []
+    for record in records:
+        args = {key: value for key, value in record.items()
+                if key not in ('name', 'pid', 'tid', 'start', 'wall_s', 'id', 'parent', 'depth')}
+        events.append({'name': record['name'], 'ph': 'X', 'pid': record['pid'], 'tid': record['tid'],
+                       'ts': (record['start'] - origin) * 1e6, 'dur': record['wall_s'] * 1e6, 'args': args})
+    with open(chrome_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return chrome_path
+
+def summarize_trace(records):
+    """
+    Total the stages of a trace by name.
+
+    :param records: Records from read_trace.
+    :return: Dictionary mapping stage names to their count, total wall and CPU time, total rows, rows per
+             second over the total wall time, and the largest peak RSS growth.
+    """
+    summary = {}
+    for record in records:
+        entry = summary.setdefault(record['name'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0,
+                                                    'peak_rss_growth_mb': 0.0})
+        entry['count'] += 1
+        entry['wall_s'] += record['wall_s']
+        entry['cpu_s'] += record['cpu_s']
+        entry['rows'] += record.get('rows') or 0
+        entry['peak_rss_growth_mb'] = max(entry['peak_rss_growth_mb'], record.get('peak_rss_growth_mb') or 0.0)
+    for entry in summary.values():
+        entry['rows_per_s'] = entry['rows'] / entry['wall_s'] if entry['rows'] and entry['wall_s'] else None
+    return summary
+
+def format_trace_summary(records):
+    """
+    Format the summary of a trace as a text table.
+    """
+    lines = [f"{'stage':>28} {'count':>6} {'wall s':>10} {'cpu s':>10} {'rows/s':>12} {'peak +MB':>9}"]
+    for name, entry in summarize_trace(records).items():
+        rows_per_s = f"{entry['rows_per_s']:12.1f}" if entry['rows_per_s'] else f"{'':>12}"
+        lines.append(f"{name:>28} {entry['count']:6d} {entry['wall_s']:10.3f} {entry['cpu_s']:10.3f} {rows_per_s} "
+                     f"{entry['peak_rss_growth_mb']:9.1f}")
+    return '\n'.join(lines)
+
+# Worker processes pick up the trace of the process that started them
+if _is_worker:
+    _tracer = Tracer(os.environ[TRACE_ENV_VAR])
+
+atexit.register(disable)
@@ -27,186 +27,117 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
-from keras.models import Sequential
-from keras.layers import Conv1D, MaxPooling1D, Flatten, Dense
 from google.colab import drive
+from adapmod.hisarmod import FSK_RANGES, build_line_index, load_ranges_iq
+from adapmod.dataset_cache import cache_key, load_or_build
+from adapmod.tracing import enable as enable_tracing, stage
 drive.mount('/content/drive') # Mounting the Drive
 
+# The stages of the pipeline are traced (time, CPU, memory and rows/s) to a Chrome trace when a path is set
+trace_path = None  # e.g. '/content/drive/MyDrive/Logs/AMRProjectTrace.json'
+if trace_path:
+    enable_tracing(trace_path, format='chrome')
+
 """The dataset is loaded in below amd pre-processed in order to have the correct foramt of data. The rows have been selected such that only samples from the selected modulation schemes are considered below."""
 
 # Below is are the directories for the data file and label file
 train_data_file = '/content/drive/MyDrive/Data/HisarMod/train_data.csv'
 
-# The ranges below describe the desired data chunks from the data to be used for this assignment.
-ranges = {
-'8FSK': [
-    (266001, 267000),
-    (292001, 293000),
-    (318001, 319000),
-    (344001, 345000),
-    (370001, 371000),
-    (396001, 397000),
-    (422001, 423000),
-    (448001, 449000),
-    (474001, 475000),
-    (500001, 501000)
-],
-'4FSK': [
-    (265001, 266000),
-    (291001, 292000),
-    (317001, 318000),
-    (343001, 344000),
-    (369001, 370000),
-    (395001, 396000),
-    (421001, 422000),
-    (447001, 448000),
-    (473001, 474000),
-    (499001, 500000)
-],
-'2FSK': [
-    (264001, 265000),
-    (290001, 291000),
-    (316001, 317000),
-    (342001, 343000),
-    (368001, 369000),
-    (394001, 395000),
-    (420001, 421000),
-    (446001, 447000),
-    (472001, 473000),
-    (498001, 499000)
-]
-}
-
-# Initialize empty dataframe
-Raw_Data = pd.DataFrame()
-
-# Load chunks into the desired DataFrame
-for modulation, chunks in ranges.items():
-  for start, end in chunks:
-    chunk_dataframe = pd.read_csv(train_data_file, header=None, skiprows=start-1, nrows=end-start+1)
-    print("Chunk Completed: " + modulation) # Provide a method to see the progress of the execution
-    # Adding a column for labels
-    chunk_dataframe['Label'] = modulation
-
-    # Append to main dataframe
-    Raw_Data = pd.concat([Raw_Data, chunk_dataframe], ignore_index=True)
-    Raw_Data
-
-# Print Dataframe to verify success
-Raw_Data
-
-"""The data is then preprocessed below in order to format it properly."""
-
-cols = ['Label'] + [col for col in Raw_Data if col != 'Label'] #
-Raw_Data = Raw_Data[cols]
-Raw_Data
-
-Raw_Data.to_csv('/content/drive/MyDrive/Data/HisarMod/train_data_project.csv')
-
-Raw_Data = pd.read_csv('/content/drive/MyDrive/Data/HisarMod/train_data_project.csv')
-Raw_Data = Raw_Data.drop(Raw_Data.columns[0], axis=1)
-
-# Convert the data from str to complex
-def convert_to_complex(s):
-    try:
-        return complex(s.replace('i', 'j'))
-    except ValueError:
-        print(f"Problematic string: {s}")
-        return 0j
-
-# Apply the function on each cell of the DataFrame for selected columns
-Raw_Data.iloc[:, 1:] = Raw_Data.iloc[:, 1:].applymap(convert_to_complex)
-Raw_Data # Verify Success
-
-# Split complex numbers into I and Q
-for col in Raw_Data.columns[1:]:
-  Raw_Data[col + '_I'] = Raw_Data[col].apply(lambda x: x.real)
-  Raw_Data[col + '_Q'] = Raw_Data[col].apply(lambda x: x.imag)
-Raw_Data # Print to verify success
-Raw_Data
-
-Raw_Data = Raw_Data.drop(columns=Raw_Data.columns[1:1+len(Raw_Data.columns)//3])
-
-Raw_Data.to_csv('/content/drive/MyDrive/Data/HisarMod/train_data_project_IQSplit.csv')
+# The ranges of the HisarMod rows holding the FSK signals used for this assignment are defined in the
+# adapmod package, one list of (start, end) rows per modulation scheme.
+ranges = FSK_RANGES
+
+# The parsed dataset is cached in a binary format keyed on the data file and the ranges above,
+# so the text of an unchanged input is only ever parsed once.
+cache_dir = '/content/drive/MyDrive/Data/HisarMod/cache'
+
+def build_dataset():
+    # Load every chunk in a single sweep over the file. The line index is built on the first run and reused afterwards.
+    # The MATLAB style complex strings are parsed in bulk straight into a float32 array of shape (N, 1024, 2),
+    # holding the I component in [..., 0] and the Q component in [..., 1].
+    line_index = build_line_index(train_data_file)
+    iq, iq_labels, bad_rows = load_ranges_iq(train_data_file, ranges, index=line_index)
+    print("Chunks Completed: " + ", ".join(ranges)) # Provide a method to see the progress of the execution
+    if bad_rows:
+        print(f"{len(bad_rows)} problematic rows were zero filled: {bad_rows[:20]}")
+    return {'features': iq, 'labels': iq_labels}
+
+dataset, _ = load_or_build(cache_dir, cache_key(train_data_file, ranges), build_dataset)
+
+# Print the array shape to verify success
+dataset['features'].shape
 
 """## Model Training
 ### Cross Validation
 The model is cross validated below for assurance in its quality.
 """
 
-from sklearn.model_selection import StratifiedKFold
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.metrics import confusion_matrix, classification_report
+import functools
+import os
+from sklearn.preprocessing import LabelEncoder
+from adapmod.amr_model import create_model
+from adapmod.cross_validation import run_cross_validation, warm_start_model
+from adapmod.dataset_cache import commit_cache, create_cache, open_cache
+from adapmod.streaming_scaler import StreamingScaler
 
-df = pd.read_csv('/content/drive/MyDrive/Data/HisarMod/train_data_project_IQSplit.csv')
-df = df.drop(df.columns[0], axis=1)
-df
-
-from keras.layers import Dropout
-# Separate Labels and Features
-labels = df.iloc[:, 0].values
-features = df.iloc[:, 1:].values
+# Separate Labels and Features. The features stay in the (N, 1024, 2) memory-mapped array.
+labels = dataset['labels']
+features = dataset['features']
 
 # Convert labels to integers
 label_encoder = LabelEncoder()
 integer_labels = label_encoder.fit_transform(labels)
 
-# Normalize features
-scaler = StandardScaler()
-scaled_features = scaler.fit_transform(features)
-
-# Reshape data for 1D CNN
-scaled_features = np.expand_dims(scaled_features, axis=2)
-
-# Define the 1D CNN model in a function for reusability
-def create_model(input_shape):
-    model = Sequential()
-    model.add(Conv1D(filters=64, kernel_size=3, activation='relu', input_shape=input_shape))
-    model.add(MaxPooling1D(pool_size=2))
-    model.add(Dropout(0.2))
-    model.add(Conv1D(filters=32, kernel_size=3, activation='relu'))
-    model.add(MaxPooling1D(pool_size=2))
-    model.add(Dropout(0.2))
-    model.add(Conv1D(filters=16, kernel_size=3, activation='relu'))
-    model.add(MaxPooling1D(pool_size=2))
-    model.add(Dropout(0.2))
-    model.add(Flatten())
-    model.add(Dense(64, activation='relu'))
-    model.add(Dense(len(np.unique(labels)), activation='softmax'))
-    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
-    return model
-
-# K-fold cross-validation
+# Normalize features with one mean and standard deviation for I and one for Q. The scaler is fitted over
+# chunks of the memory-mapped dataset and writes the float32 inputs of the 1D CNN, of shape (N, 1024, 2),
+# straight into a memory-mapped buffer, so subsets larger than memory can be used.
+scaler = StreamingScaler(per='channel')
+scaled_cache_path = os.path.join(cache_dir, 'scaled')
+with stage('scaling', rows=len(features)):
+    scaled = create_cache(scaled_cache_path, {'features': (features.shape, np.float32)})
+    scaler.fit_transform(features, out=scaled['features'])
+    commit_cache(scaled_cache_path, scaled)
+scaled_features = open_cache(scaled_cache_path)[0]['features']
+
+# The 1D CNN is defined in amr_model.py so that the folds can be built in worker processes
+build_model = functools.partial(create_model, num_classes=len(label_encoder.classes_))
+
+# Hyperparameter search. Configurations of create_model are sampled and trained with successive halving
+# on a subset of the scaled features, shared with the workers through a memory-mapped cache. It trains 27
+# configurations, so it only runs when run_search is set. The most accurate configuration on the
+# accuracy/latency Pareto front then replaces the defaults of build_model, and its batch size is used below.
+run_search = False
+batch_size = 32
+if run_search:
+    from adapmod.hyperparameter_search import (AMR_SEARCH_SPACE, format_search_report, pareto_front,
+                                               select_configuration, successive_halving)
+
+    with stage('hyperparameter_search', rows=len(scaled_features)):
+        search_results = successive_halving(scaled_features, integer_labels, build_model, AMR_SEARCH_SPACE,
+                                            num_configs=27, max_epochs=9, eta=3, max_samples=20000, seed=0,
+                                            work_dir='/content/drive/MyDrive/Models/AMRProjectSearch')
+    print(format_search_report(search_results))
+    for trial in pareto_front(search_results, search_results['rungs'][-1]):
+        print(f"Pareto front: {trial['config']} accuracy {trial['score']:.4f}, {trial['latency_ms']:.3f} ms per packet")
+
+    model_options, training_options = select_configuration(search_results)
+    print(f"Selected configuration: {model_options}, {training_options}")
+    build_model = functools.partial(create_model, num_classes=len(label_encoder.classes_), **model_options)
+    batch_size = training_options.get('batch_size', batch_size)
+
+# K-fold cross-validation. The folds are trained concurrently, each worker limited to its share of the
+# CPU threads, and the weights of every fold are kept in cv_dir.
 n_folds = 5
-skf = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42)
-
-# Prepare Empty Stores for Results
-scores = []
-cms = []
-reports = []
-# Cross Validated Training is happening in this for loop
-for train_index, val_index in skf.split(scaled_features, integer_labels):
-    X_train, X_val = scaled_features[train_index], scaled_features[val_index]
-    y_train, y_val = integer_labels[train_index], integer_labels[val_index]
-
-    model = create_model((X_train.shape[1], 1))
-    model.fit(X_train, y_train, epochs=10, batch_size=32, validation_data=(X_val, y_val))
-
-    # Evaluate model on validation data
-    score = model.evaluate(X_val, y_val, verbose=0)
-    scores.append(score[1])  # assuming score[1] is accuracy
-
-    # Predict on validation data
-    y_pred = model.predict(X_val)
-    y_pred_int = np.argmax(y_pred, axis=1)
-
-    # Compute confusion matrix and classification report
-    cm = confusion_matrix(y_val, y_pred_int)
-    report = classification_report(y_val, y_pred_int, target_names=label_encoder.classes_)
-    # Add Current Folds Results to the empty stores for results we already made
-    # The results are then printed together at once later on.
-    cms.append(cm)
-    reports.append(report)
+cv_dir = '/content/drive/MyDrive/Models/AMRProjectFolds'
+with stage('cross_validation', rows=len(scaled_features), folds=n_folds):
+    cv_results = run_cross_validation(scaled_features, integer_labels, build_model, label_encoder.classes_,
+                                      n_folds=n_folds, epochs=10, batch_size=batch_size, random_state=42,
+                                      work_dir=cv_dir)
+
+# The results of every fold are printed together at once later on.
+scores = cv_results['scores']
+cms = cv_results['cms']
+reports = cv_results['reports']
 
 # Calculate mean and standard deviation of the scores
 mean_score = np.mean(scores)
@@ -240,13 +171,80 @@ What can be seen is that most of the confusion is between 4FSK and 8FSK. While t
 
 The nature of the error described above in fact does not cause any major inconvenience. The reason being is that, for higher SNRs, BFSK is going to be selected anyways, and since that is the case, the errors will be negligible as all of the errors are between 4FSK and 8FSK.
 
-Taking the above results into consideration, the model is recreated below and trained off of the whole dataset.
+Taking the above results into consideration, the final model is trained off of the whole dataset below. Rather than training it from scratch, it starts from the weights of the best fold and is fine tuned for a few epochs.
 """
 
-model = create_model((scaled_features.shape[1], 1))
-model.fit(scaled_features, integer_labels, epochs=10, batch_size=32)
+fine_tune_epochs = 2
+model, best_fold = warm_start_model(build_model, scaled_features.shape[1:], cv_results)
+print(f"Warm starting from fold {best_fold+1}")
+with stage('fine_tune', rows=len(scaled_features) * fine_tune_epochs):
+    model.fit(scaled_features, integer_labels, epochs=fine_tune_epochs, batch_size=batch_size)
 model.save('/content/drive/MyDrive/Models/AMRProjectModel.h5')
 model.save('/content/drive/MyDrive/Models/AMRProjectModel.keras')
 from joblib import dump
 dump(label_encoder, '/content/drive/MyDrive/Models/AMRProjectLabelEncoder.joblib')
 dump(scaler, '/content/drive/MyDrive/Models/AMRProjectScaler.joblib')
+
+# Export the model, with the scaler folded into its first layer, for the Keras-free NumPy runtime
+from adapmod.numpy_runtime import export_model
+export_model(model, '/content/drive/MyDrive/Models/AMRProjectModel.npmodel', scaler=scaler,
+             metadata={'class_names': list(label_encoder.classes_)})
+
+"""### Quantization
+Quantized float16 and int8 variants of the model are evaluated below. Each fold model is quantized, with the int8 activation ranges calibrated on a sample of its training split, and compared against its float32 confusion matrix. The throughput of every variant is measured on a single CPU core.
+"""
+
+from adapmod.cross_validation import load_fold_models
+from adapmod.quantization import (amr_quantization_report, convert_quantized, format_quantization_report,
+                                  sample_calibration_data, save_report)
+
+fold_models = load_fold_models(build_model, scaled_features.shape[1:], cv_results['weights_paths'])
+quantization_report = amr_quantization_report(fold_models, scaled_features, integer_labels,
+                                              cv_results['val_indices'], label_encoder.classes_)
+print(format_quantization_report(quantization_report))
+save_report(quantization_report, '/content/drive/MyDrive/Models/AMRProjectQuantizationReport.json')
+
+# Save the quantized variants of the final model
+calibration_data = sample_calibration_data(scaled_features)
+for mode in ('float16', 'int8'):
+    with open(f'/content/drive/MyDrive/Models/AMRProjectModel_{mode}.tflite', 'wb') as f:
+        f.write(convert_quantized(model, mode, calibration_data))
+
+"""### Spectral Fast Path
+Most of the confusion above is between 4FSK and 8FSK at low SNR, while at high SNR the number of tones of a packet is visible directly in its spectrum. A cascade is calibrated below in which a small classifier over FFT features decides the packets it is confident about and only the remaining packets are passed to the CNN. Its confidence threshold is chosen on the cross validation folds so that the cascade is as accurate as the CNN alone.
+"""
+
+from adapmod.link_simulator import amr_predictor
+from adapmod.spectral_cascade import calibrate_cascade, measure_cascade_latency
+
+cascade, cascade_calibration = calibrate_cascade(dataset['features'], integer_labels, scaled_features, fold_models,
+                                                 cv_results['val_indices'], label_encoder.classes_)
+print(cascade_calibration)
+print(measure_cascade_latency(cascade, dataset['features'][:2048], amr_predictor(model, scaler)))
+cascade.save('/content/drive/MyDrive/Models/AMRProjectCascade.joblib')
+
+"""### Streaming Classification
+A receiver delivers a continuous stream of IQ samples rather than cut packets. Below, packets of the dataset are joined into one stream, which is pushed in blocks of arbitrary size through a sliding-window classifier running the exported model. Windows of 1024 samples, overlapping by half, are classified in batches and their decisions smoothed over the last few windows.
+"""
+
+from adapmod.numpy_runtime import NumpyModel
+from adapmod.streaming_amr import StreamingAMR, merge_decisions
+
+amr_runtime = NumpyModel.load('/content/drive/MyDrive/Models/AMRProjectModel.npmodel')
+stream_classifier = StreamingAMR(amr_runtime.predict, window_length=scaled_features.shape[1],
+                                 class_names=label_encoder.classes_)
+iq_stream = dataset['features'][:512].reshape(-1, 2)
+block_sizes = np.random.default_rng(0).integers(256, 8192, len(iq_stream) // 256)
+block_starts = np.concatenate([[0], np.cumsum(block_sizes)])
+decisions = []
+for start, stop in zip(block_starts[:-1], block_starts[1:]):
+    decisions.extend(stream_classifier.push(iq_stream[start:stop]))
+print(stream_classifier.stats())
+for segment in merge_decisions(decisions)[:20]:
+    print(segment)
+
+# Summarize the traced stages
+if trace_path:
+    from adapmod.tracing import disable as disable_tracing, format_trace_summary, read_trace
+    disable_tracing()
+    print(format_trace_summary(read_trace(trace_path + '.jsonl')))
@@ -8,320 +8,223 @@ This notebook contains the process for both generating a dataset for channel ass
 
 import numpy as np
 import pandas as pd
-import random
 from google.colab import drive
 import seaborn as sns
 import matplotlib.pyplot as plt
+from adapmod.dataset_cache import open_cache
+from adapmod.tracing import enable as enable_tracing, stage
 drive.mount('/content/drive') # Mounting the Drive
 
+# The stages of the pipeline are traced (time, CPU, memory and rows/s) to a Chrome trace when a path is set
+trace_path = None  # e.g. '/content/drive/MyDrive/Logs/ChannelAssessmentTrace.json'
+if trace_path:
+    enable_tracing(trace_path, format='chrome')
+
 """## 2. User Defined Functions
 The following functions are designed wih the intent of generating the channel assessment dataset. Each data sample contains a signal with channel conditions applied to it, a measurement of the signal to noise ratio, and a measurement of the multipath applied. In this case, the signal is the input, or "features", while the channel conditions are the labels.
 """
 
-# Function Definitions
-def generate_random_bits(len):
-    """
-    Generate a bitstream to transmit.
-
-    :param len: Length of the bitstream.
-    :return: NumPy array containing the bitstream.
-    """
-    return np.array([random.randint(0, 1) for i in range(len)])
-
-def generate_BFSK_Signal_vectorized(bitstream, f1, f2, fs, fc, T_symbol):
-    """
-    Generate a BFSK signal using vectorization.
-
-    :param bitstream: Bitstream to modulate.
-    :param f1: Frequency representing '0'.
-    :param f2: Frequency representing '1'.
-    :param fs: Sampling frequency.
-    :param T_symbol: Symbol duration.
-    :return: BFSK signal as a numpy array.
-    """
-    num_bits = len(bitstream)
-    t = np.arange(0, num_bits * T_symbol, 1/fs)  # Full time vector for all symbols
-
-    # Initialize the waveform
-    f_waveform = np.zeros(len(t), dtype=complex)
-
-    # Create the waveform for each bit in the bitstream
-    for i, bit in enumerate(bitstream):
-        start_index = i * int(T_symbol * fs)
-        end_index = start_index + int(T_symbol * fs)
-        frequency = f1 if bit == 0 else f2
-        f_waveform[start_index:end_index] = np.exp(2j * np.pi * frequency * t[start_index:end_index])
-
-    # Upconvert with Carrier Frequency
-    signal_upconverted = f_waveform*np.exp(2j*np.pi*fc*t)
-    return signal_upconverted
-
-def apply_multipath(signal, delays, attenuations, sampling_freq):
-    """
-    Apply multipath effects to a signal without extending its length.
-
-    :param signal: The original signal (numpy array).
-    :param delays: List of delays for each path in seconds.
-    :param attenuations: List of attenuation factors for each path (0 to 1).
-    :param sampling_freq: Sampling frequency of the signal.
-    :return: Signal with multipath effects applied.
-    """
-    multipath_signal = np.copy(signal)  # Start with the original signal
-
-    # Add each delayed and attenuated path
-    for delay, attenuation in zip(delays, attenuations):
-        delay_samples = int(delay * sampling_freq)
-        delayed_signal = np.zeros(len(signal))
-        delayed_signal[:len(signal) - delay_samples] = signal[delay_samples:] * attenuation
-        multipath_signal += delayed_signal
-
-    return multipath_signal
-
-def apply_awgn_snr(signal, snr_db): # Applies addiive white gausian noise to signal
-    """
-    Apply Additive White Gaussian Noise to a signal based on a given SNR in dB.
-
-    :param signal: The original signal (numpy array).
-    :param snr_db: Desired Signal-to-Noise Ratio in dB.
-    :return: Signal with AWGN applied.
-    """
-    # Calculate signal power
-    signal_power = np.mean(np.abs(signal)**2)
-
-    # Convert SNR from dB to linear scale
-    snr_linear = 10 ** (snr_db / 10)
-
-    # Calculate noise power based on SNR
-    noise_power = signal_power / snr_linear
-
-    # Generate white Gaussian noise
-    noise = np.random.normal(0, np.sqrt(noise_power), len(signal))
-
-    # Add noise to the signal
-    noisy_signal = signal + noise
-
-    return noisy_signal
-
-def generate_random_mp_conditions():
-    """
-    Generate a random set of multipath conditions with ordered delays and attenuations scaling linearly with delay.
-
-    :return: List of multipath conditions.
-    """
-    alpha = -0.02645 # Attenuation constant (Approximation based of of kinslers fundamentals of acoustics)
-    # Generate number of paths (Can later be modified to be random in future work)
-    num_paths = 5
-
-    # Generate and sort random delays
-    delays = np.sort(np.random.uniform(0, 0.04, num_paths))
-
-    # Calculate attenuations that decay exponentially with delay
-    min_attenuation = np.random.uniform(0.01, 0.6)
-    attenuations = [min_attenuation * np.exp(-delay * alpha/max(delays)) for delay in delays]
-
-    # Ensure that attenuations do not exceed min_attenuation
-    attenuations = [max(att, min_attenuation) for att in attenuations]
-
-    return delays, attenuations
+# The functions are defined in the adapmod package, so they can be reused outside of this notebook
+from adapmod.fsk_modulation import generate_random_bits, generate_BFSK_Signal_vectorized
 
 """## 3. Dataset generation
-The following code generates a the dataset as a pandas dataframe. Here, the same BFSK signal is used in all data samples as a pilot signal. Each sample then only varies in the channel conditions.
+The following code generates the dataset. Here, the same BFSK signal is used in all data samples as a pilot signal. Each sample then only varies in the channel conditions. The dataset is generated in shards by a pool of worker processes: every shard draws from its own random generator, spawned from the dataset seed for that shard, and is written to its own memory-mapped binary cache, so the dataset is the same whatever the number of workers and any shard can be regenerated on its own. The shards are then merged into a single dataset cache.
 """
 
+import os
+from adapmod.sharded_generation import generate_sharded_dataset, merge_shards
+
 # Parameters
 num_signals = 3000  # Number of signals to generate
+shard_size = 500  # Number of signals per shard
+num_workers = os.cpu_count()  # Number of generating processes
+seed = 0  # Seed of the pilot bitstream and of the channel realizations
 bitstream_length = 25  # Length of each bitstream
 
 # BFSK Parameters
 f1, f2, fs, fc, T_symbol = -2500, 2500, 30000, 10000, 0.02
 
-
-
-# Initialize DataFrame with expanded columns for delays and attenuations
-columns = ['BFSK_Signal_Real', 'BFSK_Signal_Imag'] + [f'Delay_{i+1}' for i in range(5)] + [f'Attenuation_{i+1}' for i in range(5)] + ['SNR']
-df = pd.DataFrame(columns=columns)
-
-
 # Generate Random Bitstream
-bitstream = generate_random_bits(bitstream_length)
+rng = np.random.default_rng(seed)
+bitstream = generate_random_bits(bitstream_length, rng)
 
 # Generate BFSK signal
 bfsk_signal = generate_BFSK_Signal_vectorized(bitstream, f1, f2, fs, fc, T_symbol)
-
-# Generate Samples
-for _ in range(num_signals):
-    # Generate random channel conditions
-    delays, attenuations = generate_random_mp_conditions()
-    snr_db = np.random.uniform(0, 30)
-
-    # Apply channel conditions
-    multipath_signal = apply_multipath(bfsk_signal, delays, attenuations, fs)
-
-    # Apply AWGN
-    final_signal = apply_awgn_snr(multipath_signal, snr_db)
-    real_part = [num.real for num in final_signal]
-    imag_part = [num.imag for num in final_signal]
-
-    # Create a new row and append it
-    new_row = {
-        'BFSK_Signal_Real': real_part,
-        'BFSK_Signal_Imag': imag_part,
-        **{f'Delay_{i+1}': delays[i] for i in range(5)},
-        **{f'Attenuation_{i+1}': attenuations[i] for i in range(5)},
-        'SNR': snr_db
-    }
-    df = pd.concat([df, pd.DataFrame([new_row], columns=columns)], ignore_index=True)
-df
-
-"""The data is separated here into a features dataframe and a labels dataframe"""
-
-# Expand the real and imaginary parts into separate DataFrames
-real_df = pd.DataFrame(df['BFSK_Signal_Real'].tolist())
-imag_df = pd.DataFrame(df['BFSK_Signal_Imag'].tolist())
-
-# Concatenate the two DataFrames Horizontally
-combined_df = pd.concat([real_df, imag_df], axis=1)
-# Create the label data frame
-combined_df_labels = df[[f'Delay_{i+1}' for i in range(5)] +
-                        [f'Attenuation_{i+1}' for i in range(5)] +
-                        ['SNR']]
-
-# Export the dataframes to csv files
-combined_df.to_csv('/content/drive/MyDrive/Data/channelassessment_dataset.csv')
-combined_df_labels.to_csv('/content/drive/MyDrive/Data/channelassessment_labels.csv')
+signal_length = len(bfsk_signal)
+
+# Generate the shards, recording the pilot parameters in the manifest, and merge them into the dataset cache
+dataset_cache_path = '/content/drive/MyDrive/Data/channelassessment_cache'
+shards_dir = '/content/drive/MyDrive/Data/channelassessment_shards'
+with stage('dataset_generation', rows=num_signals):
+    generate_sharded_dataset(shards_dir, bfsk_signal, fs, num_signals, shard_size=shard_size, seed=seed,
+                             num_workers=num_workers, snr_range=(0, 30),
+                             metadata={'bitstream': bitstream.tolist(), 'f1': f1, 'f2': f2, 'fc': fc,
+                                       'T_symbol': T_symbol})
+    merge_shards(shards_dir, dataset_cache_path)
+dataset, dataset_metadata = open_cache(dataset_cache_path)
+label_columns = dataset_metadata['label_columns']
+pd.DataFrame(dataset['labels'], columns=label_columns)
 
 """# 4. Model Training
 The following code executes the training of the channel assessment model based off of the generated dataset
 """
 
-from keras.models import Sequential, Model
-from keras.layers import Input, Conv1D, MaxPooling1D, Flatten, Dense, Dropout, concatenate
-from keras.metrics import MeanSquaredError
-import keras.backend as K
-from sklearn.model_selection import StratifiedKFold, train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.metrics import confusion_matrix, classification_report
-import ast
+from sklearn.model_selection import train_test_split
+from adapmod.channel_model import create_multi_output_model
+from adapmod.synthetic_pipeline import SyntheticPilotStream
+from adapmod.numpy_runtime import export_model
 
 # Load in the Dataset
-features = pd.read_csv('/content/drive/MyDrive/Data/channelassessment_dataset.csv')
-features = features.drop(features.columns[0], axis=1)
-labels = pd.read_csv('/content/drive/MyDrive/Data/channelassessment_labels.csv')
-labels = labels.drop(labels.columns[0], axis=1)
+dataset, dataset_metadata = open_cache(dataset_cache_path)
+features = dataset['features']
+labels = pd.DataFrame(dataset['labels'], columns=dataset_metadata['label_columns'])
 labels
 
-def regression_accuracy(y_true, y_pred, threshold=0.1):
-    """
-    A custom accuracy metric for regression tasks.
-    Considers predictions within a certain range of the actual values as accurate.
-    :param y_true: The actual values.
-    :param y_pred: The predicted values.
-    :param threshold: The acceptable range.
-    """
-    return K.mean(K.less_equal(K.abs(y_true - y_pred), threshold), axis=-1)
-
-"""This following function defines the creation of the CNN model that will be used for channel assessment. One thing thats worth noting is how the model splits into three branches for the three predictions. All branches share the convolutional layers. Where they differ is after the convolutional layers.
-
-The branch that predicts the multipath delays takes in the output of the convolutional layers and feeds that output to a dense layer, followed by the final output.
+"""The CNN used for channel assessment, create_multi_output_model, and its regression_accuracy metric are defined in channel_model.py. The model splits into three branches, for the SNR, the multipath delays and the multipath attenuations, that share the convolutional layers."""
 
-The branch that predicts the multipath attenuations takes in a combination of the convolutional layer output, and the delay branch output and then sends the combination of the two through several dense layers. The reason this has been done is because it was desirable to factor in the results for the delay predictions into the preditions of attenuation in case there was a relationship that could be taken advantage of.
-
-The branch that predicts snr goes straight to the output following the convolution layers.
-"""
-
-def create_multi_output_model(input_shape, num_delays=5, num_attenuations=5):
-    # Input layer
-    input_layer = Input(shape=input_shape)
-
-    # Shared Convolutional layers
-    x = Conv1D(filters=128, kernel_size=3, activation='relu')(input_layer)
-    x = MaxPooling1D(pool_size=2)(x)
-    x = Dropout(0.2)(x)
+"""The following code divides up the data between training and validation"""
 
-    x = Conv1D(filters=64, kernel_size=3, activation='relu')(x)
-    x = MaxPooling1D(pool_size=2)(x)
-    x = Dropout(0.2)(x)
+time_steps = features.shape[1]
+input_shape = (time_steps, 1)
+model = create_multi_output_model(input_shape)
 
-    x = Conv1D(filters=64, kernel_size=3, activation='relu')(x)
-    x = MaxPooling1D(pool_size=2)(x)
-    x = Dropout(0.2)(x)
+X_train, X_val, y_train, y_val = train_test_split(
+    features,
+    labels,
+    test_size=0.2,  # 20% of the data will be used for validation
+    random_state=42  # for reproducibility of results
+)
 
-    x = Conv1D(filters=32, kernel_size=3, activation='relu')(x)
-    x = MaxPooling1D(pool_size=2)(x)
-    x = Dropout(0.2)(x)
+# Extracting individual label sets from the validation set. The training batches are generated on the fly below.
+y_val_snr = y_val['SNR']
+y_val_delays = y_val[[f'Delay_{i+1}' for i in range(5)]]
+y_val_attenuations = y_val[[f'Attenuation_{i+1}' for i in range(5)]]
 
-    x = Conv1D(filters=16, kernel_size=3, activation='relu')(x)
-    x = MaxPooling1D(pool_size=2)(x)
-    x = Dropout(0.2)(x)
+"""The code is trained here. Rather than revisiting the same fixed training samples every epoch, the model is fed fresh pilot realizations generated on the fly by background worker processes, so every batch is a new set of channel conditions. The held out samples of the dataset are used for validation."""
 
-    x = Conv1D(filters=8, kernel_size=3, activation='relu')(x)
-    x = MaxPooling1D(pool_size=2)(x)
-    x = Dropout(0.2)(x)
+# Streaming Parameters
+steps_per_epoch = 100  # Batches per epoch, adjust as needed
+num_workers = 4  # Number of processes generating batches
 
-    x = Flatten()(x)
+# Train the model
+with SyntheticPilotStream(bfsk_signal, fs, batch_size=32, num_workers=num_workers, prefetch=4 * num_workers,
+                          snr_range=(0, 30)) as training_stream, stage('fit', rows=32 * steps_per_epoch * 30):
+    history = model.fit(
+        training_stream.batches(),
+        steps_per_epoch=steps_per_epoch,
+        epochs=30,  # Number of epochs, adjust as needed
+        validation_data=(X_val, {'snr_output': y_val_snr, 'delays_output': y_val_delays, 'attenuations_output': y_val_attenuations})
+    )
+print(f"Time spent waiting on data generation: {training_stream.wait_time:.1f}s over {training_stream.batches_delivered} batches")
+
+# Save the model, and export it for the Keras-free NumPy runtime
+model.save('/content/drive/MyDrive/Models/ChannelAssessmentModel.keras')
+export_model(model, '/content/drive/MyDrive/Models/ChannelAssessmentModel.npmodel')
+
+"""Quantized float16 and int8 variants of the model are compared against float32 below, on the validation samples, with the int8 activation ranges calibrated on a sample of the training samples."""
+
+from adapmod.quantization import (channel_quantization_report, convert_quantized, format_quantization_report,
+                                  sample_calibration_data, save_report)
+
+X_val_array = np.expand_dims(np.asarray(X_val, dtype=np.float32), axis=2)
+calibration_data = np.expand_dims(sample_calibration_data(np.asarray(X_train)), axis=2)
+quantization_report = channel_quantization_report(
+    model, X_val_array,
+    {'snr_output': y_val_snr, 'delays_output': y_val_delays, 'attenuations_output': y_val_attenuations},
+    calibration_data)
+print(format_quantization_report(quantization_report))
+save_report(quantization_report, '/content/drive/MyDrive/Models/ChannelAssessmentQuantizationReport.json')
+
+for mode in ('float16', 'int8'):
+    with open(f'/content/drive/MyDrive/Models/ChannelAssessmentModel_{mode}.tflite', 'wb') as f:
+        f.write(convert_quantized(model, mode, calibration_data))
+
+"""### Matched-Filter Front End
+Since the pilot is always the same signal, the channel can be read off by correlating each received pilot with the known pilot. The front end below does this with one FFT per pilot against the precomputed pilot spectrum, then removes the pilot's own autocorrelation from the result with a regularized deconvolution, keeping a compact impulse response over the 0-40 ms delay range and the residual power of the pilot. A much smaller model is trained on these few hundred features, and its cost per pilot is compared with the model above.
+"""
 
-    # Branch for Delays
-    x_delays = Dense(64, activation='relu')(x)
-    delays_output = Dense(num_delays, name='delays_output')(x_delays)
+from adapmod.channel_model import create_compact_model
+from adapmod.pilot_frontend import PilotMatchedFilter, model_cost
+
+frontend = PilotMatchedFilter(bfsk_signal, fs)
+X_val_frontend = frontend.transform_features(np.asarray(X_val))
+compact_model = create_compact_model((frontend.num_features, 1))
+
+with SyntheticPilotStream(bfsk_signal, fs, batch_size=32, num_workers=num_workers, prefetch=4 * num_workers,
+                          snr_range=(0, 30), frontend=frontend) as training_stream, \
+        stage('fit_compact', rows=32 * steps_per_epoch * 30):
+    compact_history = compact_model.fit(
+        training_stream.batches(),
+        steps_per_epoch=steps_per_epoch,
+        epochs=30,
+        validation_data=(X_val_frontend, {'snr_output': y_val_snr, 'delays_output': y_val_delays, 'attenuations_output': y_val_attenuations})
+    )
+
+compact_model.save('/content/drive/MyDrive/Models/ChannelAssessmentCompactModel.keras')
+export_model(compact_model, '/content/drive/MyDrive/Models/ChannelAssessmentCompactModel.npmodel')
+
+full_cost, compact_cost = model_cost(model), model_cost(compact_model)
+print(f"Full model: {full_cost['flops'] / 1e6:.1f} MFLOPs, {full_cost['activation_bytes'] / 2**20:.2f} MB largest activation per pilot")
+print(f"Front end + compact model: {(frontend.flops() + compact_cost['flops']) / 1e6:.1f} MFLOPs, "
+      f"{compact_cost['activation_bytes'] / 2**20:.2f} MB largest activation per pilot")
+
+"""## 5. Closed-Loop Simulation
+The two models are tied together below in a simulation of the full adaptive modulation loop: packets are sent with the selected scheme, classified by the AMR model and demodulated, the pilot is sent back and assessed by this model, and the next scheme is selected from the assessment. Thousands of links with changing channels are simulated at once, and the same links are run with fixed schemes for comparison.
+"""
 
-    # Combine the output of the delays branch with the flattened features
-    combined_features = concatenate([x, delays_output])
+import functools
+from adapmod.numpy_runtime import NumpyModel
+from adapmod.link_simulator import LinkSimulator, SCHEMES, fixed_policy, format_link_report
 
-    # Enhanced branch for attenuations
-    x_attenuations = Dense(128, activation='relu')(combined_features)  # First dense layer with more neurons
-    x_attenuations = Dropout(0.3)(x_attenuations)  # Dropout layer for regularization
-    x_attenuations = Dense(64, activation='relu')(x_attenuations)  # Second dense layer
-    x_attenuations = Dropout(0.3)(x_attenuations)
-    x_attenuations = Dense(32, activation='relu')(x_attenuations)  # Third dense layer
-    attenuations_output = Dense(num_attenuations, name='attenuations_output')(x_attenuations)
+amr_runtime = NumpyModel.load('/content/drive/MyDrive/Models/AMRProjectModel.npmodel')
+channel_runtime = NumpyModel.load('/content/drive/MyDrive/Models/ChannelAssessmentModel.npmodel')
 
-    # Branch for SNR
-    snr_output = Dense(1, name='snr_output')(x)  # Output for SNR
+policies = {'Adaptive': None}
+policies.update({f'Fixed {name}': functools.partial(fixed_policy, scheme=index) for index, name in enumerate(SCHEMES)})
+for name, policy in policies.items():
+    options = {} if policy is None else {'policy': policy}
+    simulator = LinkSimulator(bfsk_signal, fs, num_links=1024, amr_predict=amr_runtime.predict,
+                              channel_predict=channel_runtime.predict, seed=0, **options)
+    print(name)
+    print(format_link_report(simulator.run(num_rounds=20)))
 
-    # Define the model
-    model = Model(inputs=input_layer, outputs=[snr_output, delays_output, attenuations_output])
+"""Since the SNR output does not learn the SNR, classical estimators of the SNR of the received pilots are compared with it below, and the adaptive loop is run again with the SNR output replaced by the data-aided estimate."""
 
-    # Compile the model
-    model.compile(optimizer='adam',
-                  loss={'snr_output': 'mse', 'delays_output': 'mse', 'attenuations_output': 'mse'},
-                  metrics={'snr_output': regression_accuracy, 'delays_output': regression_accuracy, 'attenuations_output': regression_accuracy})
+from adapmod.snr_estimation import SNRHeadOverride, benchmark_snr_estimators, format_snr_benchmark
 
-    return model
+def model_snr(received):
+    features = np.concatenate([received.real, received.imag], axis=1)[..., np.newaxis].astype(np.float32)
+    return channel_runtime.predict(features)[0]
 
-"""The following code divides up the data between training and validation"""
+print(format_snr_benchmark(benchmark_snr_estimators(bfsk_signal, fs, extra_estimates={'model': model_snr})))
 
-time_steps = features.shape[1]
-input_shape = (time_steps, 1)
-model = create_multi_output_model(input_shape)
+snr_override = SNRHeadOverride(channel_runtime.predict, bfsk_signal, estimator='data_aided')
+simulator = LinkSimulator(bfsk_signal, fs, num_links=1024, amr_predict=amr_runtime.predict,
+                          channel_predict=snr_override, seed=0)
+print('Adaptive, data-aided SNR')
+print(format_link_report(simulator.run(num_rounds=20)))
 
-X_train, X_val, y_train, y_val = train_test_split(
-    features,
-    combined_df_labels,
-    test_size=0.2,  # 20% of the data will be used for validation
-    random_state=42  # for reproducibility of results
-)
+"""The thresholds of the adaptive policy only look at the SNR. Below, the best scheme for every SNR, multipath power and delay spread is precomputed by simulating the three schemes over random channels, and the adaptive loop is run again with this table selecting the scheme, with a hysteresis margin to avoid switching back and forth."""
 
-# Extracting individual label sets from the training and validation sets
-y_train_snr = y_train['SNR']
-y_train_delays = y_train[[f'Delay_{i+1}' for i in range(5)]]
-y_train_attenuations = y_train[[f'Attenuation_{i+1}' for i in range(5)]]
+from adapmod.selection_table import SelectionTable, build_selection_table
 
-y_val_snr = y_val['SNR']
-y_val_delays = y_val[[f'Delay_{i+1}' for i in range(5)]]
-y_val_attenuations = y_val[[f'Attenuation_{i+1}' for i in range(5)]]
+table_path = '/content/drive/MyDrive/Models/SelectionTable.table'
+if not os.path.exists(table_path):
+    build_selection_table(fs, num_channels=100000, seed=0).save(table_path)
+selection_table = SelectionTable.load(table_path)
 
-"""The code is trained here."""
+simulator = LinkSimulator(bfsk_signal, fs, num_links=1024, amr_predict=amr_runtime.predict,
+                          channel_predict=snr_override, policy=selection_table, seed=0)
+print('Adaptive, selection table')
+print(format_link_report(simulator.run(num_rounds=20)))
 
-# Train the model
-history = model.fit(
-    X_train,
-    {'snr_output': y_train_snr, 'delays_output': y_train_delays, 'attenuations_output': y_train_attenuations},
-    epochs=30,  # Number of epochs, adjust as needed
-    batch_size=32,  # Batch size, adjust as needed
-    validation_data=(X_val, {'snr_output': y_val_snr, 'delays_output': y_val_delays, 'attenuations_output': y_val_attenuations})
-)
+# Summarize the traced stages
+if trace_path:
+    from adapmod.tracing import disable as disable_tracing, format_trace_summary, read_trace
+    disable_tracing()
+    print(format_trace_summary(read_trace(trace_path + '.jsonl')))
 
-"""## 5. Evaluation and Results
+"""## 6. Evaluation and Results
 From the above results, it can be seen that the predictions for Multipath are good, however, the prediction for SNR has little to no accuracy. From this, we can say that this model can be used for multipath assessment, however, more traditional methods of noise measurement may be more suitable. Ultimately however, in future work, tweaks can be made in order to better determine the attenuation of the multipath signals.
 
 In summary
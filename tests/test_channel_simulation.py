@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from adapmod.benchmarks import _original_apply_multipath
+from adapmod.channel_simulation import (_DIRECT_BLOCK_BYTES, apply_awgn_snr, apply_awgn_snr_batch,
+                                        apply_multipath, apply_multipath_batch,
+                                        generate_random_mp_conditions_batch)
+
+FS = 30000
+
+def _conditions(num_realizations, length, rng):
+    # Keep the delays inside the signal, as the pilot's MAX_DELAY does
+    delays, attenuations = generate_random_mp_conditions_batch(num_realizations, rng=rng)
+    return delays * (length / FS) / 0.05, attenuations
+
+# A length of a few hundred samples takes the blocked direct path, the pilot length the per-row one
+@pytest.mark.parametrize('length', [256, 15000])
+@pytest.mark.parametrize('fractional', [False, True])
+@pytest.mark.parametrize('shared', [False, True])
+def test_direct_matches_fft(length, fractional, shared):
+    rng = np.random.default_rng(length)
+    delays, attenuations = _conditions(40, length, rng)
+    attenuations = attenuations * np.exp(1j * rng.uniform(0, 2 * np.pi, attenuations.shape))
+    signals = rng.standard_normal((40, length)) + 1j * rng.standard_normal((40, length))
+    if shared:
+        signals = signals[0]
+
+    direct = apply_multipath_batch(signals, delays, attenuations, FS, fractional, method='direct')
+    fft = apply_multipath_batch(signals, delays, attenuations, FS, fractional, method='fft')
+    np.testing.assert_allclose(direct, fft, atol=1e-9)
+
+def test_direct_blocks_span_several_blocks():
+    rng = np.random.default_rng(1)
+    length = 64
+    num_realizations = 3 * _DIRECT_BLOCK_BYTES // (length * 16) + 5
+    delays, attenuations = _conditions(num_realizations, length, rng)
+    signals = rng.standard_normal((num_realizations, length)) + 1j * rng.standard_normal((num_realizations, length))
+
+    direct = apply_multipath_batch(signals, delays, attenuations, FS, True, method='direct')
+    fft = apply_multipath_batch(signals, delays, attenuations, FS, True, method='fft')
+    np.testing.assert_allclose(direct, fft, atol=1e-9)
+
+@pytest.mark.parametrize('length', [256, 15000])
+def test_multipath_matches_original(length):
+    # The original built each delayed path in a real buffer, so it is exact for real signals, and applying
+    # it to the real and imaginary parts separately gives the complex result it was meant to compute
+    rng = np.random.default_rng(2)
+    delays, attenuations = _conditions(5, length, rng)
+    signal = rng.standard_normal(length) + 1j * rng.standard_normal(length)
+
+    batch = apply_multipath_batch(signal, delays, attenuations, FS, fractional=False)
+    for row in range(len(delays)):
+        expected = (_original_apply_multipath(signal.real, delays[row], attenuations[row], FS)
+                    + 1j * _original_apply_multipath(signal.imag, delays[row], attenuations[row], FS))
+        np.testing.assert_allclose(batch[row], expected, atol=1e-12)
+        np.testing.assert_allclose(apply_multipath(signal, delays[row], attenuations[row], FS), expected, atol=1e-12)
+
+def test_awgn_matches_original_statistics():
+    rng = np.random.default_rng(3)
+    length = 200000
+    snr_db = np.array([0.0, 10.0, 25.0])
+    signals = np.exp(2j * np.pi * rng.uniform(size=(len(snr_db), length))).astype(np.complex64)
+
+    noisy = apply_awgn_snr_batch(signals, snr_db, rng)
+    assert noisy.dtype == np.complex64
+    noise = noisy - signals
+    # Like apply_awgn_snr, the noise is real and sets the requested SNR
+    np.testing.assert_array_equal(noise.imag, 0)
+    measured = 10 * np.log10(np.mean(np.abs(signals) ** 2, axis=1) / np.mean(np.abs(noise) ** 2, axis=1))
+    np.testing.assert_allclose(measured, snr_db, atol=0.05)
+
+    np.random.seed(3)
+    original_noise = apply_awgn_snr(signals[1].astype(np.complex128), snr_db[1]) - signals[1]
+    np.testing.assert_allclose(np.var(noise[1].real), np.var(original_noise.real), rtol=0.02)
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from adapmod.dataset_cache import (cache_key, cache_source, commit_cache, create_cache, load_or_build, open_cache,
+                                   write_cache)
+
+def test_write_open_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    arrays = {'features': rng.standard_normal((7, 3, 5)).astype(np.float32),
+              'iq': (rng.standard_normal(4) + 1j * rng.standard_normal(4)).astype(np.complex64),
+              'labels': np.array(['BPSK', 'QPSK', '8FSK']),
+              'empty': np.zeros((0, 3), dtype=np.int64)}
+    cache_path = write_cache(str(tmp_path / 'cache'), arrays, metadata={'fs': 30000})
+
+    loaded, metadata = open_cache(cache_path)
+    assert metadata == {'fs': 30000}
+    assert set(loaded) == set(arrays)
+    for name in ('features', 'iq'):
+        assert isinstance(loaded[name], np.memmap)
+        assert loaded[name].dtype == arrays[name].dtype
+        np.testing.assert_array_equal(loaded[name], arrays[name])
+    assert loaded['labels'].tolist() == arrays['labels'].tolist()
+    assert loaded['empty'].shape == (0, 3)
+    assert not os.path.exists(cache_path + '.tmp')
+
+def test_create_commit_fills_in_place(tmp_path):
+    cache_path = str(tmp_path / 'cache')
+    arrays = create_cache(cache_path, {'features': ((10, 4), np.float64)})
+    assert not os.path.exists(cache_path)
+    for start in range(0, 10, 3):
+        arrays['features'][start:start + 3] = np.arange(start, min(start + 3, 10))[:, None]
+    commit_cache(cache_path, arrays)
+
+    loaded, _ = open_cache(cache_path)
+    np.testing.assert_array_equal(loaded['features'], np.repeat(np.arange(10.0)[:, None], 4, axis=1))
+
+def test_cache_source_only_matches_whole_arrays(tmp_path):
+    cache_path = write_cache(str(tmp_path / 'cache'), {'features': np.ones((6, 2)), 'labels': np.arange(6)})
+    loaded, _ = open_cache(cache_path)
+    assert cache_source(loaded['features']) == (cache_path, 'features')
+    assert cache_source(loaded['labels']) == (cache_path, 'labels')
+    assert cache_source(loaded['features'][2:]) is None
+    assert cache_source(np.ones((6, 2))) is None
+
+def test_load_or_build_builds_once(tmp_path):
+    source = tmp_path / 'source.txt'
+    source.write_text('rows')
+    key = cache_key(str(source), {'ranges': [0, 1]})
+    assert key == cache_key([str(source)], {'ranges': [0, 1]})
+    assert key != cache_key(str(source), {'ranges': [0, 2]})
+
+    calls = []
+    def build():
+        calls.append(1)
+        return {'features': np.arange(12.0).reshape(3, 4)}
+
+    first, _ = load_or_build(str(tmp_path / 'caches'), key, build)
+    second, _ = load_or_build(str(tmp_path / 'caches'), key, build)
+    assert len(calls) == 1
+    np.testing.assert_array_equal(first['features'], second['features'])
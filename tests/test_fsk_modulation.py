@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from adapmod.fsk_modulation import (FSK_ORDERS, PILOT_PARAMETERS, bits_to_symbols, demodulate_fsk, fsk_tones,
+                                    generate_BFSK_Signal_vectorized, generate_random_bits_batch, modulate_fsk_bits,
+                                    symbols_to_bits)
+
+P = PILOT_PARAMETERS
+
+@pytest.mark.parametrize('order', sorted(FSK_ORDERS.values()))
+def test_modulate_demodulate_round_trip(order):
+    bits = generate_random_bits_batch(4, 30 * int(np.log2(order)), np.random.default_rng(order))
+    signals = modulate_fsk_bits(bits, order, P['fs'], P['T_symbol'], P['fc'])
+
+    spacing = P['fs'] / round(P['T_symbol'] * P['fs'])
+    symbols = demodulate_fsk(signals, fsk_tones(order, spacing), P['fs'], P['T_symbol'], P['fc'])
+    np.testing.assert_array_equal(symbols, bits_to_symbols(bits, order))
+    np.testing.assert_array_equal(symbols_to_bits(symbols, order), bits)
+
+def test_pilot_round_trip():
+    bits = generate_random_bits_batch(1, P['bitstream_length'], np.random.default_rng(0))[0]
+    pilot = generate_BFSK_Signal_vectorized(bits, P['f1'], P['f2'], P['fs'], P['fc'], P['T_symbol'])
+    np.testing.assert_array_equal(demodulate_fsk(pilot, [P['f1'], P['f2']], P['fs'], P['T_symbol'], P['fc']), bits)
+
+def test_aliased_tones_are_rejected():
+    bits = np.zeros((1, 30), dtype=np.uint8)
+    with pytest.raises(ValueError, match='Nyquist'):
+        modulate_fsk_bits(bits, 8, P['fs'], P['T_symbol'], P['fc'], tone_spacing=5000)
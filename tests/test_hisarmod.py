@@ -0,0 +1,28 @@
+import numpy as np
+
+from adapmod.hisarmod import convert_to_complex, parse_iq_rows
+
+def _legacy_values(line):
+    return np.array([convert_to_complex(value) for value in line.decode().split(',')])
+
+def test_mixed_form_rows_match_convert_to_complex():
+    lines = [
+        b'1+2i,2i,3',
+        b'-1.5e-3-2E+2i,-4i,+7',
+        b'0.25-0.5j,1e-05,-3.5e+1i',
+        b'-0,0i,1.-.5i\r\n',
+    ]
+    iq, bad_rows = parse_iq_rows(lines)
+
+    assert bad_rows == []
+    for row, line in enumerate(lines):
+        expected = _legacy_values(line.rstrip(b'\r\n')).astype(np.complex64)
+        np.testing.assert_array_equal(iq[row, :, 0] + 1j * iq[row, :, 1], expected)
+
+def test_unparsable_rows_are_zero_filled_and_reported():
+    lines = [b'1+2i,2i,3', b'1+2i,abc,3', b'1+2i,3', b'1+2,0,0', b'4,5i,6-7i']
+    iq, bad_rows = parse_iq_rows(lines, num_samples=3)
+
+    assert bad_rows == [1, 2, 3]
+    assert not iq[bad_rows].any()
+    np.testing.assert_array_equal(iq[4, :, 0] + 1j * iq[4, :, 1], _legacy_values(lines[4]).astype(np.complex64))
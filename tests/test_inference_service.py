@@ -0,0 +1,66 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from adapmod.inference_service import AMRInferenceService, InferenceClient
+
+PACKET_LENGTH = 16
+
+class _MeanModel:
+    """Stand-in for the Keras model: class 1 when the mean of the inputs is positive."""
+
+    input_shape = (None, PACKET_LENGTH, 2)
+
+    def predict_on_batch(self, features):
+        positive = features.mean(axis=(1, 2)) > 0
+        return np.stack([~positive, positive], axis=1).astype(np.float32)
+
+class _IdentityScaler:
+    def transform(self, features):
+        return features
+
+class _LabelEncoder:
+    classes_ = np.array(['2FSK', '4FSK'])
+
+def _service():
+    return AMRInferenceService(_MeanModel(), _IdentityScaler(), _LabelEncoder(), max_wait_ms=20.0)
+
+def _packet(sign, length=PACKET_LENGTH):
+    return np.full((length, 2), sign, dtype=np.float32)
+
+def test_mixed_length_batch_only_fails_its_own_requests():
+    async def run():
+        service = _service()
+        results = await asyncio.gather(service.classify(_packet(1)), service.classify(_packet(1, 8)),
+                                       return_exceptions=True)
+        # The batcher survives the failed batch and keeps classifying
+        return results, await service.classify(_packet(-1))
+
+    results, after = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert after['label'] == '2FSK'
+
+def test_malformed_request_gets_error_reply(tmp_path):
+    path = str(tmp_path / 'amr.sock')
+
+    def client_requests():
+        client = InferenceClient(path)
+        with pytest.raises(ValueError, match='Expected a packet'):
+            client.classify(_packet(1, 7))
+        labels = [client.classify(_packet(sign))['label'] for sign in (1, -1)]
+        return labels, client.stats()
+
+    async def run():
+        service = _service()
+        server = asyncio.ensure_future(service.serve(path))
+        while not (tmp_path / 'amr.sock').exists():
+            await asyncio.sleep(0.01)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, client_requests)
+        finally:
+            server.cancel()
+
+    labels, stats = asyncio.run(run())
+    assert labels == ['4FSK', '2FSK']
+    assert stats['requests'] == 2
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+keras = pytest.importorskip('keras')
+
+from adapmod.amr_model import create_model
+from adapmod.channel_model import create_multi_output_model
+from adapmod.numpy_runtime import NumpyModel, export_model
+from adapmod.streaming_scaler import StreamingScaler
+
+def _randomize(model, rng):
+    # Freshly initialized biases are zero; random weights exercise every parameter of the export
+    model.set_weights([rng.normal(0, 0.3, weight.shape).astype(np.float32) for weight in model.get_weights()])
+    return model
+
+def test_amr_model_matches_keras(tmp_path):
+    rng = np.random.default_rng(0)
+    model = _randomize(create_model((64, 2), filters=(8, 4), dense_units=16), rng)
+    x = rng.standard_normal((10, 64, 2)).astype(np.float32)
+
+    runtime = NumpyModel.load(export_model(model, str(tmp_path / 'amr'), metadata={'class_names': ['a', 'b', 'c']}))
+    assert runtime.metadata == {'class_names': ['a', 'b', 'c']}
+    np.testing.assert_allclose(runtime.predict(x, batch_size=4), model.predict(x, verbose=0), atol=1e-5)
+
+def test_channel_model_matches_keras(tmp_path):
+    rng = np.random.default_rng(1)
+    model = _randomize(create_multi_output_model((128, 1), filters=(8, 8, 4)), rng)
+    x = rng.standard_normal((6, 128, 1)).astype(np.float32)
+
+    outputs = NumpyModel.load(export_model(model, str(tmp_path / 'channel'))).predict(x)
+    expected = model.predict(x, verbose=0)
+    assert len(outputs) == len(expected) == 3
+    for output, reference in zip(outputs, expected):
+        np.testing.assert_allclose(output, reference, rtol=1e-4, atol=1e-4)
+
+@pytest.mark.parametrize('per', ['channel', 'sample'])
+def test_scaler_is_folded_into_first_layer(tmp_path, per):
+    rng = np.random.default_rng(2)
+    model = _randomize(create_model((32, 2), filters=(8,), dense_units=8), rng)
+    raw = (rng.standard_normal((20, 64)) * 3 + 5).astype(np.float32)
+    scaler = StreamingScaler(per=per).fit(raw)
+
+    runtime = NumpyModel.load(export_model(model, str(tmp_path / per), scaler=scaler))
+    expected = model.predict(scaler.transform(raw).reshape(-1, 32, 2), verbose=0)
+    np.testing.assert_allclose(runtime.predict(raw), expected, atol=1e-5)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from adapmod.channel_simulation import apply_multipath_batch, generate_channel_realizations
+from adapmod.fsk_modulation import PILOT_PARAMETERS, generate_pilot
+from adapmod.pilot_frontend import PilotMatchedFilter, pilot_gram
+
+FS = PILOT_PARAMETERS['fs']
+
+@pytest.fixture(scope='module')
+def pilot():
+    return generate_pilot(0)[0]
+
+@pytest.fixture(scope='module')
+def frontend(pilot):
+    return PilotMatchedFilter(pilot, FS)
+
+def test_pilot_gram_matches_advanced_copies(pilot):
+    num_lags = 40
+    advanced = np.zeros((len(pilot), num_lags), dtype=complex)
+    for lag in range(num_lags):
+        advanced[:len(pilot) - lag, lag] = pilot[lag:]
+    np.testing.assert_allclose(pilot_gram(pilot, num_lags), advanced.conj().T @ advanced, atol=1e-8)
+
+def test_noise_free_response_recovers_the_paths(pilot, frontend):
+    lags = np.array([[20, 49, 324, 764, 976], [6, 12, 400, 401, 1100]])
+    attenuations = np.array([[0.4, 0.3, 0.2, 0.05, 0.03], [0.5, 0.1, 0.3, 0.2, 0.1]])
+    received = apply_multipath_batch(pilot, (lags + 0.5) / FS, attenuations, FS, fractional=False)
+
+    response = frontend.impulse_response(received)[0]
+    expected = np.zeros(response.shape)
+    expected[:, 0] = 1
+    np.put_along_axis(expected, lags, attenuations, axis=1)
+    np.testing.assert_allclose(np.abs(response), expected, atol=0.02)
+
+def test_peaks_follow_the_channel(pilot, frontend):
+    received, labels = generate_channel_realizations(pilot, 20, FS, snr_range=(30, 30),
+                                                     rng=np.random.default_rng(5))
+    magnitude = np.abs(frontend.impulse_response(received)[0])
+    lags = np.rint(labels[:, :5] * FS).astype(int)
+
+    # Fractional delays spread a path over its neighbouring lags
+    peaks = np.max([np.take_along_axis(magnitude, np.clip(lags + shift, 0, None), axis=1) for shift in (-1, 0, 1)],
+                   axis=0)
+    assert np.median(np.abs(peaks - labels[:, 5:10])) < 0.06
+    strongest = np.argsort(magnitude, axis=1)[:, -12:]
+    found = np.abs(lags[:, :, None] - strongest[:, None, :]).min(axis=2) <= 1
+    assert found.mean() > 0.8
+    # The sidelobes of the pilot's autocorrelation are gone: the direct path stands out on its own
+    assert np.all(np.abs(magnitude[:, 0] - 1) < 0.1)
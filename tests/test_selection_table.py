@@ -0,0 +1,65 @@
+import numpy as np
+
+from adapmod.selection_table import AXES, SCHEMES, SelectionTable, build_selection_table
+
+BINS = {'snr_db': (0.0, 1.0, 30), 'multipath_power_db': (-35.0, 5.0, 1), 'delay_spread': (0.0, 0.01, 1)}
+
+# No multipath: every channel falls into the single multipath power and delay spread cell
+DELAYS = np.zeros((1, 5))
+ATTENUATIONS = np.zeros((1, 5))
+
+def _table(hysteresis_db=1.0):
+    # The most robust scheme below 10 dB, the middle one from 10 dB and the fastest from 20 dB
+    schemes = np.repeat([0, 1, 2], 10)[:, None, None]
+    goodput = np.random.default_rng(0).uniform(0, 100, schemes.shape + (len(SCHEMES),))
+    samples = np.arange(30)[:, None, None]
+    return SelectionTable(schemes, BINS, hysteresis_db, goodput, samples)
+
+def _lookup(table, snr_db, current=None):
+    snr_db = np.asarray(snr_db, dtype=np.float64)
+    current = None if current is None else np.full(len(snr_db), current)
+    return table.lookup(snr_db, np.repeat(DELAYS, len(snr_db), axis=0), np.repeat(ATTENUATIONS, len(snr_db), axis=0),
+                        current=current).tolist()
+
+def test_lookup_without_hysteresis():
+    table = _table()
+    assert _lookup(table, [-3, 0.5, 9.9, 10.0, 19.5, 20.0, 45]) == [0, 0, 0, 1, 1, 2, 2]
+    # A single link can be looked up with (P,) delays and attenuations
+    assert table.lookup(15.0, DELAYS[0], ATTENUATIONS[0]).tolist() == [1]
+
+def test_hysteresis_damps_switching():
+    table = _table(hysteresis_db=1.0)
+    # Moving up needs the faster scheme to be selected hysteresis_db lower
+    assert _lookup(table, [10.5, 11.2, 21.5], current=0) == [0, 1, 2]
+    # Falling back needs the more robust scheme to be selected hysteresis_db higher
+    assert _lookup(table, [9.5, 8.7], current=1) == [1, 0]
+    assert _lookup(table, [19.3, 18.5, 5.0], current=2) == [2, 1, 0]
+    # Within the current scheme's range nothing changes
+    assert _lookup(table, [12.0, 15.0, 18.0], current=1) == [1, 1, 1]
+    # Without a margin the table is followed directly
+    assert _lookup(_table(hysteresis_db=0), [10.5, 9.5], current=1) == [1, 0]
+
+def test_snr_thresholds():
+    assert _table().snr_thresholds() == {(0, 0): [(10.0, SCHEMES[0], SCHEMES[1]), (20.0, SCHEMES[1], SCHEMES[2])]}
+
+def test_save_load_round_trip(tmp_path):
+    table = _table(hysteresis_db=2.5)
+    loaded = SelectionTable.load(table.save(str(tmp_path / 'table')))
+
+    np.testing.assert_array_equal(loaded.schemes, table.schemes)
+    assert loaded.bins == table.bins
+    assert loaded.hysteresis_db == 2.5
+    np.testing.assert_allclose(loaded.goodput, table.goodput, rtol=1e-6)
+    np.testing.assert_array_equal(loaded.samples, table.samples)
+    snr_db = np.linspace(0, 30, 61)
+    assert _lookup(loaded, snr_db, current=1) == _lookup(table, snr_db, current=1)
+
+def test_build_selection_table():
+    bins = {'snr_db': (0.0, 10.0, 3), 'multipath_power_db': (-35.0, 40.0, 1), 'delay_spread': (0.0, 1.0, 1)}
+    table = build_selection_table(30000, num_channels=96, bins=bins, min_samples=1000, chunk_size=40, seed=0,
+                                  packet_length=256)
+    assert table.schemes.shape == tuple(bins[axis][2] for axis in AXES)
+    assert table.samples.sum() == 96
+    assert table.goodput.shape == table.schemes.shape + (len(SCHEMES),)
+    # Cells with fewer than min_samples channels fall back to the most robust scheme
+    np.testing.assert_array_equal(table.schemes, 0)
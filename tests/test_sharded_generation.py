@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from adapmod.dataset_cache import open_cache
+from adapmod.sharded_generation import generate_sharded_dataset, merge_shards, read_manifest, regenerate_shard
+
+FS = 30000
+
+def _pilot():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal(1500) + 1j * rng.standard_normal(1500)
+
+def _generate(output_dir, num_workers, **options):
+    generate_sharded_dataset(str(output_dir), _pilot(), FS, num_signals=23, shard_size=10, seed=7,
+                             num_workers=num_workers, batch_size=4, **options)
+    return open_cache(merge_shards(str(output_dir), str(output_dir) + '_merged'))[0]
+
+def test_merged_dataset_does_not_depend_on_workers(tmp_path):
+    serial = _generate(tmp_path / 'serial', num_workers=1)
+    parallel = _generate(tmp_path / 'parallel', num_workers=2)
+    assert serial['features'].shape == (23, 3000)
+    assert serial['labels'].shape == (23, 11)
+    for name in ('features', 'labels'):
+        np.testing.assert_array_equal(serial[name], parallel[name])
+
+    other_seed = generate_sharded_dataset(str(tmp_path / 'other'), _pilot(), FS, num_signals=23, shard_size=10,
+                                          seed=8, num_workers=1, batch_size=4)
+    assert other_seed['shards'][0]['sha256'] != read_manifest(str(tmp_path / 'serial'))['shards'][0]['sha256']
+
+def test_regenerated_shard_matches_manifest(tmp_path):
+    merged = _generate(tmp_path / 'shards', num_workers=1)
+    manifest = read_manifest(str(tmp_path / 'shards'))
+    assert [shard['count'] for shard in manifest['shards']] == [10, 10, 3]
+
+    arrays, matches = regenerate_shard(str(tmp_path / 'shards'), 1)
+    assert matches
+    np.testing.assert_array_equal(arrays['features'], merged['features'][10:20])
+    np.testing.assert_array_equal(arrays['labels'], merged['labels'][10:20])
+
+def test_merge_rejects_modified_shard(tmp_path):
+    _generate(tmp_path / 'shards', num_workers=1)
+    arrays, _ = open_cache(str(tmp_path / 'shards' / 'shard_00002'), mode='r+')
+    arrays['labels'][0, 0] += 1
+    arrays['labels'].flush()
+    with pytest.raises(ValueError, match='does not match'):
+        merge_shards(str(tmp_path / 'shards'), str(tmp_path / 'merged_again'))
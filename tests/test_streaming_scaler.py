@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+sklearn_preprocessing = pytest.importorskip('sklearn.preprocessing')
+
+from adapmod.streaming_scaler import StreamingScaler
+
+def _features(rng, packets=103, time_steps=16):
+    # Interleaved I/Q with a different offset and spread per time step and channel
+    offsets = rng.uniform(-5, 5, time_steps * 2)
+    spreads = rng.uniform(0.5, 4, time_steps * 2)
+    features = rng.standard_normal((packets, time_steps * 2)) * spreads + offsets
+    # A constant feature is left unscaled by both scalers
+    features[:, 3] = 2.0
+    return features.astype(np.float32)
+
+def test_per_sample_matches_standard_scaler():
+    features = _features(np.random.default_rng(0))
+    reference = sklearn_preprocessing.StandardScaler().fit(features)
+
+    # A chunk size that does not divide the packet count exercises the merge of unequal chunks
+    scaler = StreamingScaler(per='sample', chunk_size=10).fit(features)
+    assert scaler.n_samples_seen_ == len(features)
+    np.testing.assert_allclose(scaler.mean_, reference.mean_, rtol=1e-10, atol=1e-10)
+    np.testing.assert_allclose(scaler.var_, reference.var_, rtol=1e-10, atol=1e-10)
+    np.testing.assert_allclose(scaler.scale_, reference.scale_, rtol=1e-10)
+    np.testing.assert_allclose(scaler.transform(features), reference.transform(features), atol=1e-5)
+
+def test_per_channel_matches_standard_scaler_on_channels():
+    features = _features(np.random.default_rng(1))
+    reference = sklearn_preprocessing.StandardScaler().fit(features.reshape(-1, 2))
+
+    scaler = StreamingScaler(per='channel', chunk_size=7).fit(features)
+    np.testing.assert_allclose(scaler.mean_, reference.mean_, rtol=1e-10)
+    np.testing.assert_allclose(scaler.var_, reference.var_, rtol=1e-10)
+    expected = reference.transform(features.reshape(-1, 2)).reshape(features.shape)
+    np.testing.assert_allclose(scaler.transform(features), expected, atol=1e-5)
+
+@pytest.mark.parametrize('per', ['channel', 'sample'])
+def test_merged_chunks_match_one_fit(per):
+    features = _features(np.random.default_rng(2))
+    whole = StreamingScaler(per=per, chunk_size=len(features)).fit(features)
+
+    merged = StreamingScaler(per=per)
+    for start, stop in [(0, 1), (1, 40), (40, 41), (41, len(features))]:
+        merged.partial_fit(features[start:stop])
+    assert merged.n_samples_seen_ == whole.n_samples_seen_
+    np.testing.assert_allclose(merged.mean_, whole.mean_, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(merged.var_, whole.var_, rtol=1e-10, atol=1e-12)
+
+def test_transform_in_place_and_inverse():
+    features = _features(np.random.default_rng(3))
+    scaler = StreamingScaler(per='channel', chunk_size=16).fit(features)
+    expected = scaler.transform(features)
+
+    out = features.copy().reshape(len(features), -1, 2)
+    assert scaler.transform(out, out=out) is out
+    np.testing.assert_allclose(out.reshape(features.shape), expected)
+    np.testing.assert_allclose(scaler.inverse_transform(expected), features, atol=1e-4)
+    with pytest.raises(ValueError):
+        StreamingScaler().transform(features)